@@ -67,7 +67,9 @@ export default function useSpatialAudio() {
       stems.map(async (stem) => {
         if (buffersRef.current[stem.id]) return;
         const url = stemUrl(stem.file_path);
-        const response = await fetch(url);
+        // Local stems come as FLAC when the server has it (lossless, ~half the
+        // bytes of the WAV); decodeAudioData handles both
+        const response = await fetch(url, { headers: { Accept: 'audio/flac, audio/wav;q=0.9, */*;q=0.5' } });
         if (!response.ok) throw new Error(`HTTP ${response.status} for ${url}`);
         const raw = await response.arrayBuffer();
         buffersRef.current[stem.id] = await ctx.decodeAudioData(raw);
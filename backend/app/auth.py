@@ -1,37 +1,117 @@
+import asyncio
+import secrets
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
 import bcrypt as _bcrypt
 from jose import JWTError, jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .database import get_db
+from .database import get_async_db
 from .models import User
 from .config import settings
+from .services.principal_cache import Principal, principal_cache
 
 bearer_scheme = HTTPBearer()
+optional_bearer_scheme = HTTPBearer(auto_error=False)
 
 
+# ── Passwords ─────────────────────────────────────────────────────────────────
+
 def hash_password(password: str) -> str:
-    return _bcrypt.hashpw(password.encode(), _bcrypt.gensalt()).decode()
+    return _bcrypt.hashpw(password.encode(), _bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)).decode()
 
 
 def verify_password(plain: str, hashed: str) -> bool:
     return _bcrypt.checkpw(plain.encode(), hashed.encode())
 
 
-def create_token(user_id: int) -> str:
+def password_needs_rehash(hashed: str) -> bool:
+    """True if *hashed* ("$2b$<cost>$...") wasn't made with the current BCRYPT_ROUNDS."""
+    try:
+        return int(hashed.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+class PasswordHasher:
+    """
+    bcrypt on a dedicated, bounded thread pool. bcrypt releases the GIL, so
+    PASSWORD_HASH_WORKERS hashes run in parallel without taking the threadpool
+    slots that sync endpoints and file I/O need, and once
+    PASSWORD_HASH_MAX_PENDING calls are queued new sign-ins get a 503 rather
+    than an ever-growing wait.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+        )
+        self._pending = 0  # only touched on the event loop
+        # cost → hash of a random password, for verify_dummy() — see prepare()
+        self._dummy_hashes: dict[int, str] = {}
+
+    async def _run(self, fn, *args):
+        if self._pending >= settings.PASSWORD_HASH_MAX_PENDING:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many sign-ins in progress, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain: str, hashed: str) -> bool:
+        return await self._run(verify_password, plain, hashed)
+
+    async def prepare(self) -> str:
+        """
+        Make verify_dummy()'s hash. Called at startup: made on the first
+        unknown-email login instead, that login would cost two hashes and
+        stand out by its timing.
+        """
+        rounds = settings.BCRYPT_ROUNDS
+        if rounds not in self._dummy_hashes:
+            self._dummy_hashes[rounds] = await self.hash(secrets.token_hex(16))
+        return self._dummy_hashes[rounds]
+
+    async def verify_dummy(self, plain: str) -> None:
+        """
+        Do the work of verify() for an email with no account, so response
+        times don't reveal which emails are registered.
+        """
+        # Already made at startup, unless BCRYPT_ROUNDS changed since
+        await self.verify(plain, await self.prepare())
+
+
+password_hasher = PasswordHasher()
+
+
+# ── Tokens ────────────────────────────────────────────────────────────────────
+
+def create_token(user: User) -> str:
     expire = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    payload = {"sub": str(user_id), "exp": expire}
+    # email lets AUTH_PRINCIPAL_MODE=claims build the principal without a lookup
+    payload = {"sub": str(user.id), "email": user.email, "exp": expire}
     return jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
-    db: Session = Depends(get_db),
-) -> User:
-    token = credentials.credentials
+async def _user_from_token(token: str, db: AsyncSession) -> Principal:
+    """
+    The principal a token stands for. Depending on AUTH_PRINCIPAL_MODE that
+    costs a users lookup every time (db), only on a principal cache miss
+    (cache), or nothing at all (claims). The AsyncSession only checks out a
+    connection if it's actually used.
+    """
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         user_id = int(payload["sub"])
@@ -41,7 +121,56 @@ def get_current_user(
             detail="Invalid or expired token",
         )
 
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+    mode = settings.AUTH_PRINCIPAL_MODE
+    # Tokens issued before the email claim existed fall back to a lookup
+    if mode == "claims" and isinstance(payload.get("email"), str):
+        return Principal(user_id, payload["email"])
+    if mode != "db":
+        cached = principal_cache.get(user_id)
+        if cached is not None:
+            return cached
+
+    generation = principal_cache.generation
+    row = (await db.execute(select(User.id, User.email).where(User.id == user_id))).first()
+    if row is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-    return user
+    principal = Principal(row.id, row.email)
+    if mode != "db":
+        principal_cache.put(principal, generation)
+    return principal
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db: AsyncSession = Depends(get_async_db),
+) -> Principal:
+    return await _user_from_token(credentials.credentials, db)
+
+
+async def get_stream_user(
+    credentials: HTTPAuthorizationCredentials | None = Depends(optional_bearer_scheme),
+    token: str | None = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+) -> Principal:
+    """
+    Like get_current_user, but also accepts ?token= — the browser's
+    EventSource API can't send an Authorization header.
+    """
+    if credentials:
+        return await _user_from_token(credentials.credentials, db)
+    if token:
+        return await _user_from_token(token, db)
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+
+
+async def get_optional_stream_user(
+    credentials: HTTPAuthorizationCredentials | None = Depends(optional_bearer_scheme),
+    token: str | None = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+) -> Principal | None:
+    """get_stream_user for endpoints that are public for demo songs."""
+    if credentials:
+        return await _user_from_token(credentials.credentials, db)
+    if token:
+        return await _user_from_token(token, db)
+    return None
@@ -1,18 +1,102 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Literal
 
 
 class Settings(BaseSettings):
     SECRET_KEY: str = "change-me-in-production-use-a-long-random-string"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 days
+    # How get_current_user resolves a token's user (see app/auth.py):
+    # db = look it up every request | cache = in-process TTL cache |
+    # claims = trust the signed token, no lookup (a deleted user's tokens
+    # keep working until they expire)
+    AUTH_PRINCIPAL_MODE: Literal["db", "cache", "claims"] = "cache"
+    AUTH_CACHE_TTL_SECONDS: float = 60.0
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    # bcrypt cost (2^n rounds). Raising it rehashes each password at its
+    # owner's next login
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2  # threads hashing at once, per API process
+    PASSWORD_HASH_MAX_PENDING: int = 32  # queued hashes before sign-ins get a 503
+    # Sign-in throttling (token buckets per API process): register + login
+    # attempts per client IP, and failed logins per email
+    AUTH_ATTEMPTS_PER_IP_PER_MINUTE: int = 30
+    LOGIN_FAILURES_PER_EMAIL_PER_MINUTE: int = 5
+    RATE_LIMIT_MAX_KEYS: int = 100000
+    # Reverse proxies in front of the API that append the client address to
+    # X-Forwarded-For (1 on Render). Rate limits key on the entry the
+    # outermost one appended — anything left of it is whatever the client sent
+    TRUSTED_PROXY_HOPS: int = 0
 
     DATABASE_URL: str = "sqlite:///./prism.db"
+    # Connection pool (see app/database.py). Neon suspends idle computes and
+    # drops their connections, so pooled ones are pinged before use and
+    # recycled before the server-side idle timeout
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0  # wait for a free connection before erroring
+    DB_POOL_RECYCLE_SECONDS: int = 240
+    DB_POOL_PRE_PING: bool = True
+    DB_CONNECT_TIMEOUT_SECONDS: int = 10  # per attempt (PostgreSQL)
+    # New connections that fail (e.g. while Neon wakes up) are retried with
+    # exponential backoff: 0.5 s, 1 s, 2 s … capped at the max
+    DB_CONNECT_RETRIES: int = 5
+    DB_CONNECT_BACKOFF_SECONDS: float = 0.5
+    DB_CONNECT_BACKOFF_MAX_SECONDS: float = 8.0
+    DB_WARM_CONNECTIONS: int = 2  # opened during API startup
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # wait on a locked database instead of failing
     UPLOAD_DIR: str = "./uploads"
     DEMO_STEMS_DIR: str = "./demo_stems"
 
     MAX_USER_SONGS: int = 3
     DEMO_MODE: bool = False  # Set to true on Render to disable user uploads
+    MAX_UPLOAD_MB: int = 200
+    UPLOAD_PART_MB: int = 8  # part size for resumable uploads
+    UPLOAD_SESSION_TTL_HOURS: int = 24  # abandoned resumable uploads expire
+    MAX_OPEN_UPLOADS_PER_USER: int = 3  # resumable sessions open at once (each preallocates its size)
+
+    # Separation worker (python -m app.worker)
+    WORKER_CONCURRENCY: int = 0  # 0 = size to available RAM / cores
+    WORKER_POLL_SECONDS: float = 2.0
+    SEPARATION_THREADS_PER_JOB: int = 2
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BASE_SECONDS: int = 30  # doubled after every failed attempt
+    JOB_RETRY_MAX_SECONDS: int = 900
+    JOB_STALE_SECONDS: int = 300  # running job with no heartbeat → re-queued
+    PROGRESS_WRITE_SECONDS: float = 1.0  # worker → DB progress update throttle
+    PROGRESS_POLL_SECONDS: float = 1.0  # API → DB poll for /events streams
+    # How long the API trusts its cached demo catalog before re-reading the
+    # catalog version (one primary-key lookup) from the DB
+    CATALOG_VERSION_TTL_SECONDS: float = 5.0
+    # Resolved paths + stat results of served files (services/file_delivery.py)
+    FILE_STAT_CACHE_SECONDS: float = 30.0
+    FILE_STAT_CACHE_MAX_ENTRIES: int = 4096
+
+    # Demucs models in priority order — later entries are fallbacks
+    SEPARATION_MODELS: List[str] = ["htdemucs_6s", "htdemucs"]
+    SEPARATION_MODEL_CACHE_MB: int = 1024  # warm models kept in memory
+    SEPARATION_DEVICE: str = "auto"  # auto | cpu | cuda
+    # Peak RAM of one separation — long tracks are streamed in segments
+    # sized to fit, so this doesn't depend on track length
+    SEPARATION_MAX_MEMORY_MB: int = 2048
+    # A stem that isn't above this for at least a second in total is
+    # "silent" (e.g. the piano stem of a song with no piano — only bleed)
+    SILENT_STEM_THRESHOLD_DB: float = -50.0
+    SILENT_STEMS: Literal["keep", "hide", "drop"] = "keep"  # flag only | not listed | not stored
+    # Web encodings made next to each WAV master, "codec:kbps" (opus | aac | mp3);
+    # the first codec is what clients get when they don't ask for one, so
+    # keep a universally playable one first
+    STEM_RENDITIONS: List[str] = ["mp3:192", "opus:96", "opus:48", "aac:128"]
+    # Also write a FLAC copy of each WAV master, served in its place (same
+    # PCM, about half the bytes) to clients that accept audio/flac
+    STEM_FLAC_VARIANTS: bool = True
+    # Length of the time-aligned FLAC segments each stem is also cut into for
+    # progressive playback (GET /api/songs/{id}/manifest); 0 = don't segment
+    STEM_SEGMENT_SECONDS: float = 6.0
+    # Pack each song's segments into one chunk-indexed file
+    # (GET /api/songs/{id}/pack); segments are then served out of the pack
+    # rather than kept as separate files
+    STEM_PACKS: bool = True
 
     CORS_ORIGINS: List[str] = [
         "http://localhost:5173",
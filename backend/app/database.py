@@ -1,17 +1,253 @@
-from sqlalchemy import create_engine
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, exc, make_url, text
+from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.util import await_only
 
 from .config import settings
 
-_connect_args = (
-    {"check_same_thread": False}
-    if settings.DATABASE_URL.startswith("sqlite")
-    else {}
-)
-engine = create_engine(settings.DATABASE_URL, connect_args=_connect_args)
+logger = logging.getLogger(__name__)
+
+
+# ── Pool metrics ──────────────────────────────────────────────────────────────
+
+class PoolMetrics:
+    """Counters for one engine's pool, reported by GET /health."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.connects = 0
+        self.connect_retries = 0
+        self.invalidations = 0
+
+    def add(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def record_checkout(self, seconds: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            stats = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 2),
+                "connects": self.connects,
+                "connect_retries": self.connect_retries,
+                "invalidations": self.invalidations,
+            }
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=max(pool.overflow(), 0),
+            )
+        return stats
+
+
+class _MeteredPool:
+    """Pool mixin that times every checkout — queueing, connecting and pre-ping."""
+
+    metrics: PoolMetrics
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.metrics.add("timeouts")
+            raise
+        finally:
+            self.metrics.record_checkout(time.perf_counter() - start)
+
+
+# One subclass per engine: the metrics survive pool.recreate() / dispose()
+class MeteredQueuePool(_MeteredPool, QueuePool):
+    metrics = PoolMetrics()
+
+
+class MeteredAsyncQueuePool(_MeteredPool, AsyncAdaptedQueuePool):
+    metrics = PoolMetrics()
+
+
+pool_metrics = MeteredQueuePool.metrics
+async_pool_metrics = MeteredAsyncQueuePool.metrics
+
+
+# ── Engines ───────────────────────────────────────────────────────────────────
+
+def _backoff(attempt: int) -> float:
+    return min(settings.DB_CONNECT_BACKOFF_SECONDS * 2 ** attempt, settings.DB_CONNECT_BACKOFF_MAX_SECONDS)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    # WAL lets API reads proceed while the worker writes; NORMAL sync is
+    # durable across application crashes in WAL mode
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+def _connect_with_retry(metrics: PoolMetrics):
+    """do_connect hook: open a DBAPI connection, retrying with bounded backoff."""
+
+    def connect(dialect, conn_rec, cargs, cparams):
+        retryable = (dialect.loaded_dbapi.OperationalError, OSError, TimeoutError)
+        for attempt in range(settings.DB_CONNECT_RETRIES + 1):
+            try:
+                connection = dialect.connect(*cargs, **cparams)
+            except retryable as err:
+                if attempt == settings.DB_CONNECT_RETRIES:
+                    raise
+                delay = _backoff(attempt)
+                logger.warning("Database connect failed (%s); retrying in %.1fs", err, delay)
+                metrics.add("connect_retries")
+                if dialect.is_async:
+                    # Running on the event loop (in SQLAlchemy's greenlet) — don't block it
+                    await_only(asyncio.sleep(delay))
+                else:
+                    time.sleep(delay)
+            else:
+                metrics.add("connects")
+                return connection
+
+    return connect
+
+
+def async_database_url(url: str) -> URL:
+    """*url* with the asyncio driver: aiosqlite for SQLite, asyncpg for PostgreSQL."""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite")
+    # asyncpg takes ssl=, not libpq's sslmode= / channel_binding=
+    query = dict(parsed.query)
+    if "sslmode" in query:
+        query["ssl"] = query.pop("sslmode")
+    query.pop("channel_binding", None)
+    return parsed.set(drivername="postgresql+asyncpg", query=query)
+
+
+def _engine_options(url: URL, metered_pool: type) -> tuple[dict, bool]:
+    """(create_engine keyword arguments, whether to set the SQLite pragmas)."""
+    if url.get_backend_name() == "sqlite":
+        file_db = url.database not in (None, "", ":memory:")
+        options = {"connect_args": {"check_same_thread": False}}
+        if file_db:
+            # Busy timeout: wait for a writer's lock instead of failing at once
+            options["connect_args"]["timeout"] = settings.SQLITE_BUSY_TIMEOUT_MS / 1000
+    else:
+        file_db = False
+        timeout_arg = "timeout" if url.get_driver_name() == "asyncpg" else "connect_timeout"
+        options = {"connect_args": {timeout_arg: settings.DB_CONNECT_TIMEOUT_SECONDS}}
+
+    # In-memory SQLite keeps SQLAlchemy's single-connection pool
+    if file_db or url.get_backend_name() != "sqlite":
+        options.update(
+            poolclass=metered_pool,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+            pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+        )
+    return options, file_db
 
+
+def _instrument(sync_engine, metrics: PoolMetrics, sqlite_pragmas: bool) -> None:
+    event.listen(sync_engine, "do_connect", _connect_with_retry(metrics))
+    event.listen(sync_engine, "invalidate", lambda *args: metrics.add("invalidations"))
+    if sqlite_pragmas:
+        event.listen(sync_engine, "connect", _set_sqlite_pragmas)
+
+
+def create_app_engine(url: str):
+    """The sync engine — worker, scripts, migrations — configured from settings."""
+    parsed = make_url(url)
+    options, sqlite_pragmas = _engine_options(parsed, MeteredQueuePool)
+    new_engine = create_engine(parsed, **options)
+    _instrument(new_engine, MeteredQueuePool.metrics, sqlite_pragmas)
+    return new_engine
+
+
+def create_async_app_engine(url: str):
+    """The asyncio engine behind the API's request handlers (get_async_db)."""
+    parsed = async_database_url(url)
+    options, sqlite_pragmas = _engine_options(parsed, MeteredAsyncQueuePool)
+    new_engine = create_async_engine(parsed, **options)
+    _instrument(new_engine.sync_engine, MeteredAsyncQueuePool.metrics, sqlite_pragmas)
+    return new_engine
+
+
+def _warm_count(pool, connections: int | None) -> int:
+    wanted = settings.DB_WARM_CONNECTIONS if connections is None else connections
+    return min(wanted, pool.size()) if isinstance(pool, QueuePool) else wanted
+
+
+def warm_up(bind=None, connections: int | None = None) -> int:
+    """
+    Open up to *connections* (default DB_WARM_CONNECTIONS) pooled connections
+    so the first requests after a deploy or cold start don't pay for them.
+    Returns how many were opened; failures are logged, not raised.
+    """
+    target = bind if bind is not None else engine
+    opened = []
+    try:
+        for _ in range(_warm_count(target.pool, connections)):
+            conn = target.connect()
+            opened.append(conn)
+            conn.execute(text("SELECT 1"))
+    except exc.SQLAlchemyError as err:
+        logger.warning("Database warm-up stopped after %d connection(s): %s", len(opened), err)
+    finally:
+        # Back to the pool, where they stay open for the next checkouts
+        for conn in opened:
+            conn.close()
+    return len(opened)
+
+
+async def warm_up_async(bind=None, connections: int | None = None) -> int:
+    """warm_up() for the async engine."""
+    target = bind if bind is not None else async_engine
+    opened = []
+    try:
+        for _ in range(_warm_count(target.pool, connections)):
+            conn = await target.connect()
+            opened.append(conn)
+            await conn.execute(text("SELECT 1"))
+    except (exc.SQLAlchemyError, OSError) as err:
+        logger.warning("Database warm-up stopped after %d connection(s): %s", len(opened), err)
+    finally:
+        for conn in opened:
+            await conn.close()
+    return len(opened)
+
+
+engine = create_app_engine(settings.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Objects stay usable after commit — lazy refreshes can't happen outside
+# an await, so handlers load what they return up front
+async_engine = create_async_app_engine(settings.DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 
 class Base(DeclarativeBase):
     pass
@@ -23,3 +259,45 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Request-scoped AsyncSession — what the API routers depend on."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# ── Query-count instrumentation ───────────────────────────────────────────────
+
+class QueryCounter:
+    def __init__(self):
+        self.statements: list[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+
+@contextmanager
+def count_queries(bind=None):
+    """
+    Count the SQL statements *bind* (default: both app engines, sync and
+    async) executes inside the block, from any thread:
+
+        with count_queries() as queries:
+            client.get("/api/songs/demos")
+        assert queries.count <= 4, queries.statements
+    """
+    targets = [bind] if bind is not None else [engine, async_engine.sync_engine]
+    counter = QueryCounter()
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        counter.statements.append(statement)
+
+    for target in targets:
+        event.listen(target, "before_cursor_execute", _record)
+    try:
+        yield counter
+    finally:
+        for target in targets:
+            event.remove(target, "before_cursor_execute", _record)
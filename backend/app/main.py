@@ -3,21 +3,36 @@ from pathlib import Path
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from sqlalchemy import text
 
+from .auth import password_hasher
 from .config import settings
-from .database import Base, engine, SessionLocal
-from .routers import auth, songs, files
+from .database import (
+    AsyncSessionLocal,
+    async_engine,
+    async_pool_metrics,
+    engine,
+    pool_metrics,
+    warm_up_async,
+)
+from .migrations import migrate_database
+from .middleware import BodySizeLimitMiddleware
+from .routers import auth, songs, files, uploads
+from .services.static_delivery import StaticUploads
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Create DB tables and upload directories on startup
-    Base.metadata.create_all(bind=engine)
+    # Migrate the schema and create upload directories on startup
+    migrate_database(engine)
+    # Open pooled connections (and make the dummy password hash) now rather
+    # than on the first requests
+    await warm_up_async()
+    await password_hasher.prepare()
     Path(settings.UPLOAD_DIR).mkdir(parents=True, exist_ok=True)
     Path(settings.DEMO_STEMS_DIR).mkdir(parents=True, exist_ok=True)
     yield
+    await async_engine.dispose()
 
 
 app = FastAPI(title="Prism API", version="1.0.0", lifespan=lifespan)
@@ -30,27 +45,46 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized uploads while they stream in, before multipart parsing
+# spools them to disk (+64 KB for multipart framing)
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_bytes=settings.MAX_UPLOAD_MB * 1_048_576 + 65_536,
+    path_prefixes=("/api/songs/upload", "/api/uploads"),
+)
+
 # Serve uploaded audio files as static assets — only if the directory exists.
 # On Render (demo mode) stems are served from Supabase CDN, so this is skipped.
+# Precompressed variants, ranges, 304s and immutable caching: see
+# services/static_delivery.py
 _upload_path = Path(settings.UPLOAD_DIR)
 if _upload_path.exists():
-    app.mount(
-        "/uploads",
-        StaticFiles(directory=str(_upload_path)),
-        name="uploads",
-    )
+    app.mount("/uploads", StaticUploads(_upload_path), name="uploads")
 
 app.include_router(auth.router)
 app.include_router(songs.router)
+app.include_router(uploads.router)
 app.include_router(files.router)
 
 
 @app.get("/health")
-def health():
-    # Touch the DB so Neon wakes up alongside the Render instance
+async def health():
+    # Touch the DB so Neon wakes up alongside the Render instance. Still 200
+    # when it's unreachable — the API itself is up and Render shouldn't
+    # restart it over a sleeping database
     try:
-        with SessionLocal() as db:
-            db.execute(text("SELECT 1"))
-    except Exception:
-        pass
-    return {"status": "ok"}
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("SELECT 1"))
+        database = "ok"
+    except Exception as exc:
+        database = f"unavailable: {type(exc).__name__}"
+    return {
+        "status": "ok",
+        "database": database,
+        "pools": {
+            # Request handlers
+            "async": async_pool_metrics.snapshot(async_engine.pool),
+            # Migrations and anything else in-process on the sync engine
+            "sync": pool_metrics.snapshot(engine.pool),
+        },
+    }
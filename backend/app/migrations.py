@@ -0,0 +1,58 @@
+"""
+Schema migrations (Alembic — revisions live in backend/migrations/versions).
+
+The API, the worker and the seeding/sync scripts call migrate_database() on
+startup instead of create_all(), so a deploy picks up new columns, tables
+and indexes on existing databases too. Databases created by create_all()
+before migrations existed have no alembic_version table; they're stamped
+at the baseline revision first and upgraded from there (revision 0002
+only adds what each of them is missing).
+"""
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import inspect, text
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+BASELINE = "0001"
+
+# Arbitrary key: serialises concurrent startups (API workers + job worker)
+# on PostgreSQL so only one of them runs the DDL
+_PG_LOCK_KEY = 0x70726973
+
+
+def alembic_config(connection=None) -> Config:
+    config = Config(str(MIGRATIONS_DIR.parent / "alembic.ini"))
+    config.set_main_option("script_location", str(MIGRATIONS_DIR))
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+
+def migrate_database(engine, revision: str = "head") -> None:
+    """Bring *engine*'s schema to *revision*, adopting pre-migration databases."""
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _PG_LOCK_KEY})
+        config = alembic_config(conn)
+        tables = set(inspect(conn).get_table_names())
+        if "alembic_version" not in tables and "songs" in tables:
+            command.stamp(config, BASELINE)
+        command.upgrade(config, revision)
+
+
+def pending_revisions(engine) -> list[str]:
+    """
+    Revisions migrate_database() would apply to *engine*, oldest first —
+    read-only, for dry runs.
+    """
+    with engine.connect() as conn:
+        tables = set(inspect(conn).get_table_names())
+        current = MigrationContext.configure(conn).get_current_revision()
+    if current is None and "songs" in tables:
+        current = BASELINE  # what migrate_database() would stamp
+    script = ScriptDirectory.from_config(alembic_config())
+    return [rev.revision for rev in reversed(list(script.iterate_revisions("head", current)))]
@@ -1,10 +1,17 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from datetime import datetime, timezone
+
+from sqlalchemy import BigInteger, Column, Integer, String, Boolean, DateTime, Float, ForeignKey, Index, JSON, and_
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 from .database import Base
 
 
+def utcnow() -> datetime:
+    """Naive UTC timestamp, matching what SQLite's CURRENT_TIMESTAMP stores."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -23,6 +30,8 @@ class Song(Base):
     title = Column(String, nullable=False)
     artist = Column(String, nullable=True)
     original_path = Column(String, nullable=True)
+    # SHA-256 of the original audio — key for reusing stems across songs
+    content_hash = Column(String(64), nullable=True, index=True)
     # pending | processing | complete | error
     status = Column(String, default="pending", nullable=False)
     error_message = Column(String, nullable=True)
@@ -32,6 +41,21 @@ class Song(Base):
 
     user = relationship("User", back_populates="songs")
     stems = relationship("Stem", back_populates="song", cascade="all, delete-orphan")
+    job = relationship(
+        "SeparationJob", back_populates="song", uselist=False, cascade="all, delete-orphan"
+    )
+
+    # Index rationale lives in migrations/versions/0003_query_indexes.py
+    __table_args__ = (
+        Index(
+            "ix_songs_demo_title",
+            "title",
+            sqlite_where=and_(is_demo == True, status == "complete"),
+            postgresql_where=and_(is_demo == True, status == "complete"),
+        ),
+        Index("ix_songs_user_created", "user_id", "created_at"),
+        Index("ix_songs_original_path", "original_path"),
+    )
 
 
 class Stem(Base):
@@ -42,5 +66,130 @@ class Stem(Base):
     # vocals | drums | bass | guitar | piano | other
     stem_type = Column(String, nullable=False)
     file_path = Column(String, nullable=False)
+    # sha256 of the master file — identity for catalog sync / object storage
+    checksum = Column(String(64), nullable=True, index=True)
+    # Demucs model that produced the file (htdemucs_6s | htdemucs)
+    model_name = Column(String, nullable=True)
+
+    # Computed once after separation (services/audio_analysis.py)
+    duration = Column(Float, nullable=True)  # seconds
+    sample_rate = Column(Integer, nullable=True)
+    peak_db = Column(Float, nullable=True)  # dBFS
+    rms_db = Column(Float, nullable=True)  # dBFS
+    lufs = Column(Float, nullable=True)  # integrated loudness, BS.1770
+    # Only model bleed — hidden from listings unless SILENT_STEMS = "keep"
+    is_silent = Column(Boolean, default=False, nullable=False)
+    # Binary waveform pyramid + silence map sidecar
+    peaks_path = Column(String, nullable=True)
+    # Time-aligned FLAC segments for progressive playback (services/segments.py);
+    # NULL for stems packaged before segmenting existed
+    segment_seconds = Column(Float, nullable=True)
+    segment_count = Column(Integer, nullable=True)
 
     song = relationship("Song", back_populates="stems")
+    renditions = relationship(
+        "StemRendition", back_populates="stem", cascade="all, delete-orphan"
+    )
+
+    __table_args__ = (
+        # One row per stem type — also the index for stems-by-song lookups
+        Index("uq_stems_song_stem_type", "song_id", "stem_type", unique=True),
+        Index("ix_stems_file_path", "file_path"),
+    )
+
+
+class StemRendition(Base):
+    """A web encoding of a stem's WAV master (see services/renditions.py)."""
+
+    __tablename__ = "stem_renditions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    stem_id = Column(Integer, ForeignKey("stems.id", ondelete="CASCADE"), nullable=False, index=True)
+    # opus | aac | mp3
+    codec = Column(String, nullable=False)
+    bitrate_kbps = Column(Integer, nullable=False)
+    mime_type = Column(String, nullable=False)
+    file_path = Column(String, nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)
+
+    stem = relationship("Stem", back_populates="renditions")
+
+
+class SeparationJob(Base):
+    """Durable queue entry for one song's stem separation (see app.worker)."""
+
+    __tablename__ = "separation_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    song_id = Column(
+        Integer, ForeignKey("songs.id", ondelete="CASCADE"), nullable=False, unique=True
+    )
+    # pending | running | done | failed
+    status = Column(String, default="pending", nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    # Earliest time the job may be claimed — pushed back on retry
+    run_after = Column(DateTime, default=utcnow, nullable=False)
+    claimed_by = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
+    # Live progress written by the worker: current stage plus a fraction per
+    # stage, e.g. {"decode": 1.0, "separate": 0.4}
+    stage = Column(String, nullable=True)
+    progress = Column(JSON, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+
+    song = relationship("Song", back_populates="job")
+
+    __table_args__ = (
+        # Partial: only the few live jobs, not every finished one
+        Index(
+            "ix_separation_jobs_pending",
+            "run_after",
+            "id",
+            sqlite_where=status == "pending",
+            postgresql_where=status == "pending",
+        ),
+        Index(
+            "ix_separation_jobs_running",
+            "heartbeat_at",
+            sqlite_where=status == "running",
+            postgresql_where=status == "running",
+        ),
+    )
+
+
+class UploadSession(Base):
+    """A resumable upload in progress — parts land in uploads/incoming/<id>.part."""
+
+    __tablename__ = "upload_sessions"
+
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    filename = Column(String, nullable=False)
+    total_size = Column(BigInteger, nullable=False)
+    part_size = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=utcnow, nullable=False)
+
+    parts = relationship("UploadPart", cascade="all, delete-orphan")
+
+
+class UploadPart(Base):
+    __tablename__ = "upload_parts"
+
+    session_id = Column(
+        String(32), ForeignKey("upload_sessions.id", ondelete="CASCADE"), primary_key=True
+    )
+    part_number = Column(Integer, primary_key=True)
+
+
+class CatalogVersion(Base):
+    """
+    Counter bumped whenever a cached catalog changes (seeding, sync, reset),
+    so every API process knows when to rebuild it (see services/catalog_cache.py).
+    """
+
+    __tablename__ = "catalog_versions"
+
+    name = Column(String, primary_key=True)  # "demos"
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow)
@@ -0,0 +1,4 @@
+"""
+Query layer over app.models — every loading strategy lives here, so
+routers never trigger lazy loads (one SELECT per song) by accident.
+"""
@@ -0,0 +1,98 @@
+"""
+Song and stem queries with explicit loading.
+
+List endpoints use column projections: three queries (songs, their stems,
+those stems' renditions) build plain dicts shaped like SongOut, whatever the
+number of songs, without materialising ORM objects. Single-song lookups
+return ORM objects with stems and renditions selectin-loaded up front.
+
+Everything takes a sync Session: the worker and scripts call these
+directly, the async API handlers through AsyncSession.run_sync().
+"""
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from ..models import Song, Stem, StemRendition
+from ..schemas import RenditionOut, SongOut, StemOut
+
+# Projected columns follow the response schemas, so the two can't drift
+_SONG_COLUMNS = [getattr(Song, name) for name in SongOut.model_fields if name != "stems"]
+_STEM_COLUMNS = [Stem.song_id] + [
+    getattr(Stem, name) for name in StemOut.model_fields if name != "renditions"
+]
+_RENDITION_COLUMNS = [StemRendition.stem_id] + [
+    getattr(StemRendition, name) for name in RenditionOut.model_fields
+]
+
+# Everything SongOut (and stem_cache.release_song_files) touches
+SONG_WITH_STEMS = selectinload(Song.stems).selectinload(Stem.renditions)
+
+
+def _song_dicts(db: Session, songs_query) -> list[dict]:
+    """Run *songs_query* (a select of _SONG_COLUMNS) and attach stems + renditions."""
+    songs = [dict(row._mapping) for row in db.execute(songs_query)]
+    if not songs:
+        return []
+
+    song_ids = songs_query.with_only_columns(Song.id).order_by(None).scalar_subquery()
+    stems_by_song: dict[int, list[dict]] = {song["id"]: [] for song in songs}
+    stems_by_id: dict[int, dict] = {}
+    for row in db.execute(
+        select(*_STEM_COLUMNS).where(Stem.song_id.in_(song_ids)).order_by(Stem.id)
+    ):
+        stem = dict(row._mapping)
+        stem["renditions"] = []
+        stems_by_song[stem.pop("song_id")].append(stem)
+        stems_by_id[stem["id"]] = stem
+
+    stem_ids = select(Stem.id).where(Stem.song_id.in_(song_ids)).scalar_subquery()
+    for row in db.execute(
+        select(*_RENDITION_COLUMNS).where(StemRendition.stem_id.in_(stem_ids)).order_by(StemRendition.id)
+    ):
+        rendition = dict(row._mapping)
+        stems_by_id[rendition.pop("stem_id")]["renditions"].append(rendition)
+
+    for song in songs:
+        song["stems"] = stems_by_song[song["id"]]
+    return songs
+
+
+def list_demo_songs(db: Session) -> list[dict]:
+    return _song_dicts(
+        db,
+        select(*_SONG_COLUMNS)
+        .where(Song.is_demo == True, Song.status == "complete")
+        .order_by(Song.title),
+    )
+
+
+def list_user_songs(db: Session, user_id: int) -> list[dict]:
+    return _song_dicts(
+        db,
+        select(*_SONG_COLUMNS)
+        .where(Song.user_id == user_id)
+        .order_by(Song.created_at.desc()),
+    )
+
+
+def get_song(db: Session, song_id: int) -> Song | None:
+    """One song with its stems and renditions loaded."""
+    return db.execute(
+        select(Song).options(SONG_WITH_STEMS).where(Song.id == song_id)
+    ).scalar_one_or_none()
+
+
+def get_user_song(db: Session, song_id: int, user_id: int) -> Song | None:
+    """*song_id* if *user_id* owns it, with stems and renditions loaded."""
+    return db.execute(
+        select(Song).options(SONG_WITH_STEMS).where(Song.id == song_id, Song.user_id == user_id)
+    ).scalar_one_or_none()
+
+
+def get_stem(db: Session, song_id: int, stem_id: int) -> Stem | None:
+    """A stem of *song_id* with its song (for access checks) and renditions."""
+    return db.execute(
+        select(Stem)
+        .options(joinedload(Stem.song), selectinload(Stem.renditions))
+        .where(Stem.id == stem_id, Stem.song_id == song_id)
+    ).scalar_one_or_none()
@@ -1,36 +1,122 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..database import get_db
+from ..config import settings
+from ..database import get_async_db
 from ..models import User
 from ..schemas import UserCreate, UserLogin, Token, UserOut
-from ..auth import hash_password, verify_password, create_token, get_current_user
+from ..auth import Principal, create_token, get_current_user, password_hasher, password_needs_rehash
+from ..services.rate_limit import RateLimiter
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
+# Every attempt costs a bcrypt hash — throttle them before hashing
+ip_limiter = RateLimiter(settings.AUTH_ATTEMPTS_PER_IP_PER_MINUTE)
+email_limiter = RateLimiter(settings.LOGIN_FAILURES_PER_EMAIL_PER_MINUTE)
+
+
+def _acquire(limiter: RateLimiter, key: str) -> None:
+    retry_after = limiter.acquire(key)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, try again later",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+def _ip_key(request: Request) -> str:
+    """
+    Key for the client's address. Behind TRUSTED_PROXY_HOPS proxies that's
+    the X-Forwarded-For entry the outermost one appended, counted from the
+    right: the leftmost entries are whatever the client chose to send.
+    """
+    hops = settings.TRUSTED_PROXY_HOPS
+    if hops > 0:
+        forwarded = [
+            address.strip()
+            for header in request.headers.getlist("x-forwarded-for")
+            for address in header.split(",")
+            if address.strip()
+        ]
+        if len(forwarded) >= hops:
+            return f"ip:{forwarded[-hops]}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
 
 @router.post("/register", response_model=Token, status_code=status.HTTP_201_CREATED)
-def register(data: UserCreate, db: Session = Depends(get_db)):
-    if db.query(User).filter(User.email == data.email).first():
+async def register(data: UserCreate, request: Request, db: AsyncSession = Depends(get_async_db)):
+    ip_key = _ip_key(request)
+    _acquire(ip_limiter, ip_key)
+
+    if await db.scalar(select(User.id).where(User.email == data.email)):
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    user = User(email=data.email, password_hash=hash_password(data.password))
+    try:
+        password_hash = await password_hasher.hash(data.password)
+    except HTTPException as exc:
+        if exc.status_code == status.HTTP_503_SERVICE_UNAVAILABLE:
+            ip_limiter.refund(ip_key)
+        raise
+    user = User(email=data.email, password_hash=password_hash)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
 
-    return Token(access_token=create_token(user.id))
+    return Token(access_token=create_token(user))
 
 
 @router.post("/login", response_model=Token)
-def login(data: UserLogin, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == data.email).first()
-    if not user or not verify_password(data.password, user.password_hash):
+async def login(data: UserLogin, request: Request, db: AsyncSession = Depends(get_async_db)):
+    ip_key, email_key = _ip_key(request), f"email:{data.email.lower()}"
+    _acquire(ip_limiter, ip_key)
+    # Counted as a failure until the password checks out — concurrent
+    # guesses for one email each need a token before any hash runs
+    try:
+        _acquire(email_limiter, email_key)
+    except HTTPException:
+        ip_limiter.refund(ip_key)
+        raise
+
+    user = await db.scalar(select(User).where(User.email == data.email))
+    try:
+        if user is None:
+            await password_hasher.verify_dummy(data.password)
+            valid = False
+        else:
+            valid = await password_hasher.verify(data.password, user.password_hash)
+    except HTTPException as exc:
+        # An overloaded hasher (503) is our fault, not a failed attempt
+        if exc.status_code == status.HTTP_503_SERVICE_UNAVAILABLE:
+            ip_limiter.refund(ip_key)
+            email_limiter.refund(email_key)
+        raise
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    email_limiter.refund(email_key)
+
+    # The only moment the plain password is at hand: bring an old hash up to
+    # the current BCRYPT_ROUNDS — unless the hasher is overloaded, in which
+    # case the next sign-in does it
+    if password_needs_rehash(user.password_hash):
+        try:
+            user.password_hash = await password_hasher.hash(data.password)
+        except HTTPException as exc:
+            if exc.status_code != status.HTTP_503_SERVICE_UNAVAILABLE:
+                raise
+        else:
+            await db.commit()
 
-    return Token(access_token=create_token(user.id))
+    return Token(access_token=create_token(user))
 
 
 @router.get("/me", response_model=UserOut)
-def me(current_user: User = Depends(get_current_user)):
-    return current_user
+async def me(
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # The principal carries no created_at — read the row (this isn't a hot path)
+    user = await db.get(User, current_user.id)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    return user
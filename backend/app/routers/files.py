@@ -2,30 +2,23 @@
 Serves audio files stored on disk with path-traversal protection.
 Audio files are also accessible via the /uploads static mount in main.py,
 but this router gives an explicit API endpoint with security checks.
+
+Responses support byte ranges (so seeking fetches only what it needs) and
+conditional requests, content-addressed files are cached as immutable, and
+precompressed variants are served to clients that accept them — see
+services/file_delivery.py and services/static_delivery.py.
 """
 from pathlib import Path
 
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Request
 
 from ..config import settings
+from ..services.static_delivery import deliver_best
 
 router = APIRouter(prefix="/api/files", tags=["files"])
 
 
-@router.get("/{file_path:path}")
-def serve_file(file_path: str):
-    base = Path(settings.UPLOAD_DIR).resolve()
-    target = (base / file_path).resolve()
-
-    # Prevent path traversal
-    if not str(target).startswith(str(base)):
-        raise HTTPException(status_code=403, detail="Access denied")
-
-    if not target.exists() or not target.is_file():
-        raise HTTPException(status_code=404, detail="File not found")
-
-    return FileResponse(
-        str(target),
-        headers={"Accept-Ranges": "bytes"},
-    )
+@router.api_route("/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_file(file_path: str, request: Request):
+    # Resolved, confined to UPLOAD_DIR (403 otherwise) and stat'ed — cached
+    return await deliver_best(file_path, request.headers, base=Path(settings.UPLOAD_DIR))
@@ -1,173 +1,368 @@
 """
-Songs router — upload, list, poll status, delete.
-
-Stem separation runs in a FastAPI BackgroundTask using a fresh DB session
-so it doesn't block the request thread.
+Songs router — upload, list, poll status, stem audio, peaks, segments and
+packs, delete.
+
+Uploads are stored by content hash; audio that was separated before gets
+its existing stems straight away (see services.stem_cache). Everything else
+is only queued here — a separation_jobs row is committed together
+with the song, and a separate worker process (python -m app.worker) picks it
+up, so the API never runs Demucs itself. Clients follow a job through
+GET /{song_id}/events (Server-Sent Events) instead of polling GET /{song_id}.
+
+Handlers are async on an AsyncSession (database.get_async_db), so requests
+waiting on the database don't hold threadpool threads. Repository and
+service functions are shared with the sync worker and scripts; they run on
+the async connection via AsyncSession.run_sync().
 """
-import shutil
-import uuid
-from pathlib import Path
+import asyncio
+import json
 from typing import List
 
-from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, UploadFile, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, Request, UploadFile, status
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..auth import get_current_user
+from ..auth import Principal, get_current_user, get_optional_stream_user, get_stream_user
 from ..config import settings
-from ..database import get_db, SessionLocal
-from ..models import Song, Stem, User
-from ..schemas import SongOut
-from ..services.stem_separator import separate_stems
+from ..database import get_async_db
+from ..models import Song
+from ..repositories import songs as song_repo
+from ..schemas import SongManifest, SongOut, StemSegmentsOut
+from ..services import (
+    catalog_cache, file_delivery, progress, renditions, segments, stem_cache, stem_pack,
+    static_delivery,
+)
+from ..services.ingest import check_upload_allowed, create_uploaded_song, ingest_upload
 
 router = APIRouter(prefix="/api/songs", tags=["songs"])
 
-ALLOWED_EXTENSIONS = {".mp3", ".wav", ".flac", ".m4a", ".ogg", ".aac"}
-
-
-# ── Background worker ──────────────────────────────────────────────────────────
-
-def _process_song(song_id: int, file_path: str) -> None:
-    """Run demucs in the background, persist results to a fresh DB session."""
-    db = SessionLocal()
-    try:
-        song = db.query(Song).filter(Song.id == song_id).first()
-        if not song:
-            return
-
-        song.status = "processing"
-        db.commit()
-
-        stems_dir = Path(settings.UPLOAD_DIR) / "stems"
-        stem_paths = separate_stems(file_path, str(stems_dir), song_id)
-
-        for stem_type, path in stem_paths.items():
-            db.add(Stem(song_id=song_id, stem_type=stem_type, file_path=str(path)))
-
-        song.status = "complete"
-        db.commit()
-
-    except Exception as exc:
-        db.rollback()
-        try:
-            song = db.query(Song).filter(Song.id == song_id).first()
-            if song:
-                song.status = "error"
-                song.error_message = str(exc)[:500]
-                db.commit()
-        except Exception:
-            pass
-    finally:
-        db.close()
+# SSE comment sent on idle streams so proxies don't time them out
+_KEEPALIVE_SECONDS = 15
 
 
 # ── Endpoints ──────────────────────────────────────────────────────────────────
 
 @router.get("/demos", response_model=List[SongOut])
-def get_demo_songs(db: Session = Depends(get_db)):
-    """Public — list all pre-stemmed demo songs."""
-    return (
-        db.query(Song)
-        .filter(Song.is_demo == True, Song.status == "complete")
-        .order_by(Song.title)
-        .all()
-    )
+async def get_demo_songs(
+    accept_encoding: str | None = Header(None),
+    if_none_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Public — list all pre-stemmed demo songs. Served from pre-encoded,
+    pre-compressed bytes (services.catalog_cache) with an ETag, so repeat
+    visits get a 304 and a reseed is picked up within seconds.
+    """
+    catalog = await catalog_cache.demo_catalog.get(db)
+    headers = {
+        "ETag": catalog.etag,
+        "Cache-Control": "public, max-age=0, must-revalidate",
+        "Vary": "Accept-Encoding",
+    }
+    if catalog_cache.etag_matches(if_none_match, catalog.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    encoding = catalog_cache.choose_encoding(accept_encoding, catalog.bodies)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=catalog.bodies[encoding], media_type="application/json", headers=headers)
 
 
 @router.get("/my", response_model=List[SongOut])
-def get_my_songs(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+async def get_my_songs(
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    return (
-        db.query(Song)
-        .filter(Song.user_id == current_user.id)
-        .order_by(Song.created_at.desc())
-        .all()
-    )
+    return await db.run_sync(song_repo.list_user_songs, current_user.id)
 
 
 @router.post("/upload", response_model=SongOut, status_code=status.HTTP_202_ACCEPTED)
 async def upload_song(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    if settings.DEMO_MODE:
-        raise HTTPException(
-            status_code=503,
-            detail="Song upload is disabled in demo mode. Run the app locally to upload your own tracks.",
-        )
+    await db.run_sync(check_upload_allowed, current_user.id)
+
+    # Format is sniffed and size capped as the bytes are streamed to disk
+    dest_path, content_hash = await ingest_upload(file)
+
+    return await db.run_sync(
+        create_uploaded_song, current_user.id, dest_path, content_hash, file.filename
+    )
+
+
+@router.get("/{song_id}", response_model=SongOut)
+async def get_song(
+    song_id: int,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    song = await db.run_sync(song_repo.get_song, song_id)
+    if not song:
+        raise HTTPException(status_code=404, detail="Song not found")
+    if not song.is_demo and song.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    return song
+
+
+@router.get("/{song_id}/stems/{stem_id}/peaks")
+async def get_stem_peaks(
+    song_id: int,
+    stem_id: int,
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Binary waveform peak pyramid + silence map for one stem, precomputed by
+    the worker (format: services/audio_analysis.py). Clients pick the level
+    that matches their zoom instead of decoding the stem to draw it.
+    """
+    stem = await db.run_sync(song_repo.get_stem, song_id, stem_id)
+    if not stem:
+        raise HTTPException(status_code=404, detail="Stem not found")
+    if not stem.song.is_demo and stem.song.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    if not stem.peaks_path:
+        raise HTTPException(status_code=404, detail="Peaks not available for this stem")
+
+    return await static_delivery.deliver_best(
+        stem.peaks_path,
+        request.headers,
+        media_type="application/octet-stream",
+        cache_control="private, max-age=86400",
+    )
+
+
+@router.get("/{song_id}/stems/{stem_id}/audio")
+async def get_stem_audio(
+    song_id: int,
+    stem_id: int,
+    format: str | None = Query(None, description="opus | aac | mp3 | wav"),
+    bitrate: int | None = Query(None, description="Max kbps; highest rendition not above it"),
+    accept: str | None = Header(None),
+    current_user: Principal | None = Depends(get_optional_stream_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    A stem's audio in the best format for the client: ?format= / ?bitrate=
+    if given, else negotiated from the Accept header. wav is the lossless
+    master; anything else is a precomputed rendition. Demo stems are public;
+    <audio> elements can pass ?token= for private ones.
+    """
+    stem = await db.run_sync(song_repo.get_stem, song_id, stem_id)
+    if not stem:
+        raise HTTPException(status_code=404, detail="Stem not found")
+    if not stem.song.is_demo and (current_user is None or stem.song.user_id != current_user.id):
+        raise HTTPException(status_code=403, detail="Access denied")
 
-    # Enforce upload limit
-    song_count = db.query(Song).filter(Song.user_id == current_user.id).count()
-    if song_count >= settings.MAX_USER_SONGS:
+    choice = renditions.choose_rendition(stem.renditions, format, bitrate, accept)
+    if choice is None:
         raise HTTPException(
-            status_code=400,
-            detail=f"Upload limit reached ({settings.MAX_USER_SONGS} songs per account).",
+            status_code=406,
+            detail={"available": [f"{r.codec}:{r.bitrate_kbps}" for r in stem.renditions] + ["wav"]},
         )
+    if choice == renditions.LOSSLESS:
+        path, media_type = stem.file_path, renditions.LOSSLESS_MIME
+    else:
+        path, media_type = choice.file_path, choice.mime_type
+
+    # The URL names a stem, not file contents (stem ids can be reused), so
+    # clients revalidate — a 304 when nothing changed
+    return await file_delivery.deliver(
+        path,
+        media_type=media_type,
+        headers={"Vary": "Accept"},
+        cache_control="public, no-cache" if stem.song.is_demo else "private, no-cache",
+    )
 
-    # Validate extension
-    suffix = Path(file.filename or "").suffix.lower()
-    if suffix not in ALLOWED_EXTENSIONS:
-        raise HTTPException(status_code=400, detail=f"Unsupported file type: {suffix}")
 
-    # Save original
-    originals_dir = Path(settings.UPLOAD_DIR) / "originals"
-    originals_dir.mkdir(parents=True, exist_ok=True)
+def _segment_version(stem) -> str:
+    # The master's checksum: a segment URL carrying it names fixed bytes
+    return (stem.checksum or "")[:16]
 
-    file_id = uuid.uuid4().hex
-    dest_path = originals_dir / f"{file_id}{suffix}"
 
-    with dest_path.open("wb") as fp:
-        shutil.copyfileobj(file.file, fp)
+@router.get("/{song_id}/manifest", response_model=SongManifest)
+async def get_song_manifest(
+    song_id: int,
+    current_user: Principal | None = Depends(get_optional_stream_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Segment manifest for progressive playback (services/segments.py). All
+    stems are cut at the same frame boundaries, so a client fetches segment
+    0 of every stem, starts playing and streams the rest. 404 for songs
+    separated before segmenting existed — play the whole files instead.
+    """
+    song = await db.run_sync(song_repo.get_song, song_id)
+    if not song:
+        raise HTTPException(status_code=404, detail="Song not found")
+    if not song.is_demo and (current_user is None or song.user_id != current_user.id):
+        raise HTTPException(status_code=403, detail="Access denied")
 
-    title = Path(file.filename or "Untitled").stem
-    song = Song(
-        title=title,
-        original_path=str(dest_path),
-        status="pending",
-        user_id=current_user.id,
+    stems = [
+        stem for stem in song.stems
+        if stem.segment_count and not (stem.is_silent and settings.SILENT_STEMS == "hide")
+    ]
+    if not stems:
+        raise HTTPException(status_code=404, detail="Segments not available for this song")
+
+    first = stems[0]
+    pack = stem_pack.song_pack_path(song.stems)
+    if pack is not None and await file_delivery.stat_cache.find(pack) is None:
+        pack = None
+    return SongManifest(
+        song_id=song.id,
+        segment_seconds=first.segment_seconds,
+        sample_rate=first.sample_rate,
+        duration=first.duration,
+        segment_count=max(stem.segment_count for stem in stems),
+        mime_type=segments.SEGMENT_MIME,
+        stems=[
+            StemSegmentsOut(
+                id=stem.id,
+                stem_type=stem.stem_type,
+                segment_count=stem.segment_count,
+                url_template=(
+                    f"/api/songs/{song.id}/stems/{stem.id}/segments/{{index}}?v={_segment_version(stem)}"
+                ),
+            )
+            for stem in stems
+        ],
+        pack_url=f"/api/songs/{song.id}/pack?v={pack.stem[:16]}" if pack else None,
     )
-    db.add(song)
-    db.commit()
-    db.refresh(song)
 
-    background_tasks.add_task(_process_song, song.id, str(dest_path))
-    return song
+
+@router.get("/{song_id}/stems/{stem_id}/segments/{index}")
+async def get_stem_segment(
+    song_id: int,
+    stem_id: int,
+    index: int,
+    v: str | None = Query(None, description="Version from the manifest's url_template"),
+    current_user: Principal | None = Depends(get_optional_stream_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    One FLAC segment of a stem — see GET /{song_id}/manifest. Packed songs
+    keep their segments only inside the pack, so it's served from there.
+    """
+    song = await db.run_sync(song_repo.get_song, song_id)
+    stem = next((stem for stem in song.stems if stem.id == stem_id), None) if song else None
+    if not stem:
+        raise HTTPException(status_code=404, detail="Stem not found")
+    if not song.is_demo and (current_user is None or song.user_id != current_user.id):
+        raise HTTPException(status_code=403, detail="Access denied")
+    if not stem.segment_count or not 0 <= index < stem.segment_count:
+        raise HTTPException(status_code=404, detail="Segment not found")
+
+    # Versioned URLs from the manifest never change; bare ones revalidate
+    visibility = "public" if song.is_demo else "private"
+    if v is not None and v == _segment_version(stem):
+        cache_control = f"{visibility}, max-age=31536000, immutable"
+    else:
+        cache_control = f"{visibility}, no-cache"
+
+    pack = stem_pack.song_pack_path(song.stems)
+    if pack is not None and await file_delivery.stat_cache.find(pack) is not None:
+        return await stem_pack.deliver_segment(pack, stem.stem_type, index, cache_control)
+    return await file_delivery.deliver(
+        segments.segment_path(stem.file_path, index),
+        media_type=segments.SEGMENT_MIME,
+        cache_control=cache_control,
+    )
 
 
-@router.get("/{song_id}", response_model=SongOut)
-def get_song(
+@router.get("/{song_id}/pack")
+async def get_song_pack(
     song_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    stems: str | None = Query(None, description="Comma-separated stem types; default all"),
+    start: float = Query(0.0, ge=0, description="Seconds"),
+    end: float | None = Query(None, gt=0, description="Seconds; default the end of the song"),
+    v: str | None = Query(None, description="Version from the manifest's pack_url"),
+    current_user: Principal | None = Depends(get_optional_stream_user),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    song = db.query(Song).filter(Song.id == song_id).first()
+    """
+    Every stem of a song in one chunk-indexed file (format:
+    services/stem_pack.py). Without stems/start/end it's the whole pack, with
+    Range support for clients that read the index themselves; otherwise the
+    server slices out those stems and the chunks covering [start, end) and
+    returns them as a smaller pack of the same format.
+    """
+    song = await db.run_sync(song_repo.get_song, song_id)
+    if not song:
+        raise HTTPException(status_code=404, detail="Song not found")
+    if not song.is_demo and (current_user is None or song.user_id != current_user.id):
+        raise HTTPException(status_code=403, detail="Access denied")
+    pack = stem_pack.song_pack_path(song.stems)
+    if pack is None:
+        raise HTTPException(status_code=404, detail="Pack not available for this song")
+
+    # The pack is named after its stems' checksums, so a versioned URL names fixed bytes
+    visibility = "public" if song.is_demo else "private"
+    if v is not None and v == pack.stem[:16]:
+        cache_control = f"{visibility}, max-age=31536000, immutable"
+    else:
+        cache_control = f"{visibility}, no-cache"
+
+    if stems is None and start == 0 and end is None:
+        return await file_delivery.deliver(pack, media_type=stem_pack.PACK_MIME, cache_control=cache_control)
+    stem_types = [name.strip() for name in stems.split(",") if name.strip()] if stems else None
+    return await stem_pack.deliver_slice(pack, stem_types, start, end, cache_control)
+
+
+@router.get("/{song_id}/events")
+async def song_events(
+    song_id: int,
+    current_user: Principal = Depends(get_stream_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Server-Sent Events stream of a song's separation progress. Sends a
+    `progress` event whenever status/stage/progress change and closes after
+    the song reaches complete or error — fetch GET /{song_id} once then.
+    """
+    song = await db.get(Song, song_id)
     if not song:
         raise HTTPException(status_code=404, detail="Song not found")
     if not song.is_demo and song.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Access denied")
-    return song
+
+    return StreamingResponse(
+        _progress_events(song_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _progress_events(song_id: int):
+    queue = progress.hub.subscribe(song_id)
+    try:
+        while True:
+            try:
+                state = await asyncio.wait_for(queue.get(), timeout=_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: progress\ndata: {json.dumps(state)}\n\n"
+            if state["status"] in progress.TERMINAL_STATUSES:
+                return
+    finally:
+        progress.hub.unsubscribe(song_id, queue)
 
 
 @router.delete("/{song_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_song(
+async def delete_song(
     song_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    song = db.query(Song).filter(
-        Song.id == song_id,
-        Song.user_id == current_user.id,
-    ).first()
+    song = await db.run_sync(song_repo.get_user_song, song_id, current_user.id)
     if not song:
         raise HTTPException(status_code=404, detail="Song not found or access denied")
 
-    if song.original_path:
-        Path(song.original_path).unlink(missing_ok=True)
-    for stem in song.stems:
-        Path(stem.file_path).unlink(missing_ok=True)
+    await db.run_sync(stem_cache.release_song_files, song)
 
-    db.delete(song)
-    db.commit()
+    await db.delete(song)
+    await db.commit()
@@ -0,0 +1,274 @@
+"""
+Resumable uploads for large lossless files.
+
+  POST   /api/uploads                     → start a session (filename, size)
+  PUT    /api/uploads/{id}/parts/{n}      → raw bytes of part n (0-based)
+  GET    /api/uploads/{id}                → which parts have arrived (resume)
+  POST   /api/uploads/{id}/complete       → create the song and queue it
+  DELETE /api/uploads/{id}                → abandon the session
+
+Every part is written straight into its place in one preallocated file
+(uploads/incoming/<id>.part), so completing the upload needs no stitching
+copy — the file is hashed once and renamed into originals/.
+
+A user has at most MAX_OPEN_UPLOADS_PER_USER sessions open. Sessions past
+UPLOAD_SESSION_TTL_HOURS answer 410 and the worker sweeps them out
+(services.ingest.expire_upload_sessions).
+"""
+import hashlib
+import uuid
+from pathlib import Path
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import delete, func, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from ..auth import Principal, get_current_user
+from ..config import settings
+from ..database import get_async_db
+from ..models import UploadPart, UploadSession, User
+from ..schemas import SongOut, UploadInit, UploadSessionOut
+from ..services.content_hash import CHUNK_SIZE
+from ..services.ingest import (
+    SNIFF_BYTES,
+    check_upload_allowed,
+    create_uploaded_song,
+    incoming_path,
+    sniff_audio_format,
+    store_original,
+    too_large,
+    upload_session_cutoff,
+    unsupported_format,
+)
+
+router = APIRouter(prefix="/api/uploads", tags=["uploads"])
+
+
+# ── Helpers ───────────────────────────────────────────────────────────────────
+
+def _part_count(session: UploadSession) -> int:
+    return max(1, -(-session.total_size // session.part_size))
+
+
+def _part_length(session: UploadSession, part_number: int) -> int:
+    start = part_number * session.part_size
+    return min(session.part_size, session.total_size - start)
+
+
+async def _session_out(db: AsyncSession, session: UploadSession) -> UploadSessionOut:
+    received = await db.scalars(
+        select(UploadPart.part_number)
+        .where(UploadPart.session_id == session.id)
+        .order_by(UploadPart.part_number)
+    )
+    return UploadSessionOut(
+        id=session.id,
+        filename=session.filename,
+        size=session.total_size,
+        part_size=session.part_size,
+        part_count=_part_count(session),
+        received_parts=list(received),
+    )
+
+
+def _expired() -> HTTPException:
+    return HTTPException(status_code=410, detail="Upload expired — start it again")
+
+
+async def _get_session(db: AsyncSession, upload_id: str, user: Principal) -> UploadSession:
+    session = await db.get(UploadSession, upload_id)
+    if not session or session.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    # Past its TTL but not yet swept by the worker
+    if session.created_at < upload_session_cutoff():
+        raise _expired()
+    return session
+
+
+def _preallocate(path: Path, size: int) -> None:
+    """Sparse, full-size file: each part is written at its own offset."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("wb") as fp:
+        fp.truncate(size)
+
+
+def _hash_file(path: Path) -> tuple[str, bytes]:
+    """Return (sha256 hex, first SNIFF_BYTES) of *path* in one read pass."""
+    digest = hashlib.sha256()
+    with path.open("rb") as fp:
+        head = fp.read(SNIFF_BYTES)
+        digest.update(head)
+        while chunk := fp.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest(), head
+
+
+# ── Endpoints ─────────────────────────────────────────────────────────────────
+
+@router.post("", response_model=UploadSessionOut, status_code=status.HTTP_201_CREATED)
+async def init_upload(
+    data: UploadInit,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    await db.run_sync(check_upload_allowed, current_user.id)
+    if data.size <= 0:
+        raise HTTPException(status_code=400, detail="size must be positive")
+    if data.size > settings.MAX_UPLOAD_MB * 1_048_576:
+        raise too_large()
+
+    upload_id = uuid.uuid4().hex
+    path = incoming_path(upload_id)
+    await run_in_threadpool(_preallocate, path, data.size)
+
+    # Count and insert in one statement, under a lock on the user row, so
+    # parallel inits can't all slip under MAX_OPEN_UPLOADS_PER_USER
+    await db.execute(select(User.id).where(User.id == current_user.id).with_for_update())
+    open_sessions = (
+        select(func.count())
+        .select_from(UploadSession)
+        .where(UploadSession.user_id == current_user.id, UploadSession.created_at >= upload_session_cutoff())
+        .scalar_subquery()
+    )
+    created = await db.execute(
+        insert(UploadSession).from_select(
+            ["id", "user_id", "filename", "total_size", "part_size"],
+            select(
+                literal(upload_id),
+                literal(current_user.id),
+                literal(data.filename),
+                literal(data.size),
+                literal(settings.UPLOAD_PART_MB * 1_048_576),
+            ).where(open_sessions < settings.MAX_OPEN_UPLOADS_PER_USER),
+        )
+    )
+    await db.commit()
+    if created.rowcount != 1:
+        await run_in_threadpool(path.unlink, missing_ok=True)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Too many uploads in progress ({settings.MAX_OPEN_UPLOADS_PER_USER} per account) "
+                   "— finish or cancel one first.",
+        )
+    return await _session_out(db, await db.get(UploadSession, upload_id))
+
+
+@router.get("/{upload_id}", response_model=UploadSessionOut)
+async def get_upload(
+    upload_id: str,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await _session_out(db, await _get_session(db, upload_id, current_user))
+
+
+@router.put("/{upload_id}/parts/{part_number}", response_model=UploadSessionOut)
+async def upload_part(
+    upload_id: str,
+    part_number: int,
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    session = await _get_session(db, upload_id, current_user)
+    if not 0 <= part_number < _part_count(session):
+        raise HTTPException(status_code=400, detail="Part number out of range")
+
+    expected = _part_length(session, part_number)
+    offset = part_number * session.part_size
+    path = incoming_path(session.id)
+
+    try:
+        fp = await run_in_threadpool(path.open, "r+b")
+    except FileNotFoundError:
+        # Swept by the worker after it expired
+        raise _expired()
+    try:
+        await run_in_threadpool(fp.seek, offset)
+        received = 0
+        # Part 0 is held back until there's enough of it to sniff the format
+        head = bytearray() if part_number == 0 else None
+        async for chunk in request.stream():
+            if not chunk:
+                continue
+            received += len(chunk)
+            if received > expected:
+                raise HTTPException(
+                    status_code=400, detail=f"Part {part_number} exceeds {expected} bytes"
+                )
+            if head is not None:
+                head += chunk
+                if len(head) < min(SNIFF_BYTES, expected):
+                    continue
+                if sniff_audio_format(bytes(head[:SNIFF_BYTES])) is None:
+                    raise unsupported_format()
+                chunk, head = bytes(head), None
+            await run_in_threadpool(fp.write, chunk)
+    finally:
+        await run_in_threadpool(fp.close)
+
+    if received != expected:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Part {part_number} is {received} bytes, expected {expected}",
+        )
+
+    # Re-sending a part (e.g. after a dropped response) is harmless
+    await db.merge(UploadPart(session_id=session.id, part_number=part_number))
+    await db.commit()
+    return await _session_out(db, session)
+
+
+@router.post("/{upload_id}/complete", response_model=SongOut, status_code=status.HTTP_202_ACCEPTED)
+async def complete_upload(
+    upload_id: str,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    session = await _get_session(db, upload_id, current_user)
+    status_out = await _session_out(db, session)
+    missing = sorted(set(range(status_out.part_count)) - set(status_out.received_parts))
+    if missing:
+        raise HTTPException(status_code=409, detail={"missing_parts": missing})
+
+    await db.run_sync(check_upload_allowed, current_user.id)
+
+    # Claim the session: of two concurrent completes only one deletes the
+    # row, and only that one goes on to move the file
+    upload_id, filename = session.id, session.filename
+    await db.execute(delete(UploadPart).where(UploadPart.session_id == upload_id))
+    claimed = await db.execute(
+        delete(UploadSession)
+        .where(UploadSession.id == upload_id)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    if claimed.rowcount != 1:
+        raise HTTPException(status_code=409, detail="Upload already completed")
+
+    path = incoming_path(upload_id)
+    try:
+        content_hash, head = await run_in_threadpool(_hash_file, path)
+    except FileNotFoundError:
+        raise _expired()
+    suffix = sniff_audio_format(head)
+    if suffix is None:
+        path.unlink(missing_ok=True)
+        raise unsupported_format()
+
+    dest_path = await run_in_threadpool(store_original, path, content_hash, suffix)
+
+    return await db.run_sync(create_uploaded_song, current_user.id, dest_path, content_hash, filename)
+
+
+@router.delete("/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def abort_upload(
+    upload_id: str,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    session = await _get_session(db, upload_id, current_user)
+    incoming_path(session.id).unlink(missing_ok=True)
+    await db.delete(session)
+    await db.commit()
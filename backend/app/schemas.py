@@ -1,7 +1,9 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, field_validator
 from typing import Optional, List
 from datetime import datetime
 
+from .config import settings
+
 
 # ── Auth ──────────────────────────────────────────────────────────────────────
 
@@ -30,10 +32,26 @@ class UserOut(BaseModel):
 
 # ── Songs ─────────────────────────────────────────────────────────────────────
 
+class RenditionOut(BaseModel):
+    codec: str
+    bitrate_kbps: int
+    mime_type: str
+    size_bytes: int
+
+    model_config = {"from_attributes": True}
+
+
 class StemOut(BaseModel):
     id: int
     stem_type: str
     file_path: str
+    duration: Optional[float] = None
+    sample_rate: Optional[int] = None
+    peak_db: Optional[float] = None
+    rms_db: Optional[float] = None
+    lufs: Optional[float] = None
+    is_silent: bool = False
+    renditions: List[RenditionOut] = []
 
     model_config = {"from_attributes": True}
 
@@ -49,3 +67,51 @@ class SongOut(BaseModel):
     stems: List[StemOut] = []
 
     model_config = {"from_attributes": True}
+
+    @field_validator("stems")
+    @classmethod
+    def _hide_silent_stems(cls, stems: List[StemOut]) -> List[StemOut]:
+        # Clients never download stems that are only model bleed
+        if settings.SILENT_STEMS == "hide":
+            return [stem for stem in stems if not stem.is_silent]
+        return stems
+
+
+# ── Segmented playback ────────────────────────────────────────────────────────
+
+class StemSegmentsOut(BaseModel):
+    id: int
+    stem_type: str
+    segment_count: int
+    # Replace {index} (0-based) to get a segment's URL
+    url_template: str
+
+
+class SongManifest(BaseModel):
+    song_id: int
+    # Every stem is cut at the same frame boundaries: segment i of each stem
+    # starts at i * segment_seconds
+    segment_seconds: float
+    sample_rate: Optional[int] = None
+    duration: Optional[float] = None
+    segment_count: int
+    mime_type: str
+    stems: List[StemSegmentsOut]
+    # Every stem in one chunk-indexed file (services/stem_pack.py), if packed
+    pack_url: Optional[str] = None
+
+
+# ── Resumable uploads ─────────────────────────────────────────────────────────
+
+class UploadInit(BaseModel):
+    filename: str
+    size: int
+
+
+class UploadSessionOut(BaseModel):
+    id: str
+    filename: str
+    size: int
+    part_size: int
+    part_count: int
+    received_parts: List[int] = []
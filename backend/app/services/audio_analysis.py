@@ -0,0 +1,292 @@
+"""
+Per-stem audio analysis, computed once after separation.
+
+For every stem we derive, in a single streaming pass with vectorised NumPy:
+  - duration / sample rate / peak / RMS
+  - integrated loudness (ITU-R BS.1770 gating; K-weighting applied in the
+    frequency domain per 100 ms window, which is exact up to window-edge
+    effects and needs no IIR filter)
+  - a silence map (runs of 100 ms windows below SILENCE_THRESHOLD_DB)
+  - whether the whole stem is silent (never above SILENT_STEM_THRESHOLD_DB
+    for a second in total) — 6-stem models emit a near-silent piano or
+    guitar stem for most songs, which SILENT_STEMS then hides or drops
+  - a multi-resolution min/max peak pyramid for drawing waveforms
+
+Scalars are stored on the Stem row; the pyramid and silence map go into a
+compact binary sidecar next to the stem (<stem>.peaks, format below) that
+the API serves as-is.
+
+Sidecar format (little-endian):
+  header   4s magic "PRPK", u16 version, u16 level count, u32 sample rate,
+           u64 frames, u32 silence range count
+  levels   per level: u32 samples per peak, u32 peak count
+  data     per level: int8 (min, max) pairs, scaled to ±127
+  silence  per range: u32 start frame, u32 end frame
+"""
+import struct
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from ..config import settings
+from .content_hash import sha256_file
+from .static_delivery import precompress
+
+PEAKS_MAGIC = b"PRPK"
+PEAKS_VERSION = 1
+_HEADER = struct.Struct("<4sHHIQI")
+_LEVEL = struct.Struct("<II")
+
+BASE_SAMPLES_PER_PEAK = 256
+LEVEL_FACTOR = 4
+MIN_LEVEL_PEAKS = 512  # stop adding coarser levels below this many peaks
+
+WINDOW_SECONDS = 0.1  # loudness / silence analysis window
+SILENCE_THRESHOLD_DB = -60.0
+MIN_SILENCE_SECONDS = 0.5
+LOUDEST_SPAN_SECONDS = 1.0  # total audible time that makes a stem not silent
+
+# BS.1770 K-weighting biquads (defined at 48 kHz): high shelf, then RLB high-pass
+_K_SHELF = ([1.53512485958697, -2.69169618940638, 1.19839281085285],
+            [1.0, -1.69065929318241, 0.73248077421585])
+_K_HIGHPASS = ([1.0, -2.0, 1.0], [1.0, -1.99004745483398, 0.99007225036621])
+
+
+@dataclass
+class StemAnalysis:
+    sample_rate: int
+    frames: int
+    peak_db: float
+    rms_db: float
+    lufs: float
+    # level of each 100 ms window (mono, dBFS)
+    window_db: np.ndarray = field(repr=False)
+    silence: list[tuple[int, int]] = field(default_factory=list)
+    levels: list[tuple[int, np.ndarray, np.ndarray]] = field(default_factory=list, repr=False)
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.sample_rate if self.sample_rate else 0.0
+
+    @property
+    def loudest_span_db(self) -> float:
+        """
+        Level the stem reaches for at least LOUDEST_SPAN_SECONDS in total —
+        a few loud clicks in otherwise pure bleed don't count.
+        """
+        span = max(1, int(round(LOUDEST_SPAN_SECONDS / WINDOW_SECONDS)))
+        if len(self.window_db) <= span:
+            return float(self.window_db.min())
+        return float(np.partition(self.window_db, -span)[-span])
+
+    def is_silent(self, threshold_db: float) -> bool:
+        return self.loudest_span_db < threshold_db
+
+
+def _db(value: float) -> float:
+    return float(10 * np.log10(value)) if value > 0 else -120.0
+
+
+def _k_weighting_power(n: int, samplerate: int) -> np.ndarray:
+    """|H(f)|² of the K-weighting filter at the rfft bins of an n-point window."""
+    freqs = np.fft.rfftfreq(n, d=1.0 / samplerate)
+    z = np.exp(-2j * np.pi * freqs / 48000.0)
+    response = np.ones_like(z)
+    for b, a in (_K_SHELF, _K_HIGHPASS):
+        response *= (b[0] + b[1] * z + b[2] * z**2) / (a[0] + a[1] * z + a[2] * z**2)
+    return np.abs(response) ** 2
+
+
+def analyze_stem(path: str | Path, blocks: int = 2) -> StemAnalysis:
+    """Analyse one stem file, reading it in blocks of whole analysis windows."""
+    import soundfile as sf
+
+    with sf.SoundFile(str(path)) as f:
+        samplerate = f.samplerate
+        channels = f.channels
+        window = int(samplerate * WINDOW_SECONDS)
+        # Block = whole analysis windows and whole base peaks, so every
+        # block reduces independently
+        unit = int(np.lcm(window, BASE_SAMPLES_PER_PEAK))
+        block = unit * blocks
+        k_power = _k_weighting_power(window, samplerate)
+        # Parseval weights for a real FFT of even/odd length
+        parseval = np.full(len(k_power), 2.0)
+        parseval[0] = 1.0
+        if window % 2 == 0:
+            parseval[-1] = 1.0
+
+        frames = 0
+        peak = 0.0
+        sum_squares = 0.0
+        window_ms: list[np.ndarray] = []
+        window_k: list[np.ndarray] = []
+        base_min: list[np.ndarray] = []
+        base_max: list[np.ndarray] = []
+
+        while True:
+            data = f.read(block, dtype="float32", always_2d=True)
+            if not len(data):
+                break
+            frames += len(data)
+            peak = max(peak, float(np.abs(data).max()))
+            sum_squares += float(np.square(data, dtype=np.float64).sum())
+
+            # Pad the final partial block with silence to whole windows
+            padded = _pad_to(data, unit)
+            mono = padded.mean(axis=1)
+
+            per_window = padded.reshape(-1, window, padded.shape[1])
+            window_ms.append(np.square(mono.reshape(-1, window), dtype=np.float64).mean(axis=1))
+
+            spectrum = np.fft.rfft(per_window, axis=1)
+            power = (np.abs(spectrum) ** 2 * (k_power * parseval)[None, :, None]).sum(axis=1)
+            # Per-channel K-weighted mean square, summed over channels (G = 1)
+            window_k.append((power / window**2).sum(axis=1))
+
+            buckets = mono.reshape(-1, BASE_SAMPLES_PER_PEAK)
+            base_min.append(buckets.min(axis=1))
+            base_max.append(buckets.max(axis=1))
+
+    if frames == 0:
+        raise ValueError(f"{path} contains no audio")
+
+    n_windows = -(-frames // window)
+    ms = np.concatenate(window_ms)[:n_windows]
+    k_ms = np.concatenate(window_k)[:n_windows]
+    n_peaks = -(-frames // BASE_SAMPLES_PER_PEAK)
+
+    return StemAnalysis(
+        sample_rate=samplerate,
+        frames=frames,
+        peak_db=round(_db(peak * peak), 2),
+        rms_db=round(_db(sum_squares / (frames * channels)), 2),
+        lufs=round(_integrated_loudness(k_ms), 2),
+        window_db=10 * np.log10(np.maximum(ms, 1e-12)),
+        silence=_silence_ranges(ms, window, frames),
+        levels=_pyramid(
+            np.concatenate(base_min)[:n_peaks], np.concatenate(base_max)[:n_peaks]
+        ),
+    )
+
+
+def _pad_to(data: np.ndarray, multiple: int) -> np.ndarray:
+    remainder = len(data) % multiple
+    if not remainder:
+        return data
+    return np.pad(data, ((0, multiple - remainder), (0, 0)))
+
+
+def _integrated_loudness(k_ms: np.ndarray) -> float:
+    """BS.1770 gated loudness from K-weighted mean square per 100 ms window."""
+    if len(k_ms) < 4:
+        blocks = np.array([k_ms.mean()]) if len(k_ms) else np.array([0.0])
+    else:
+        # 400 ms blocks with 75 % overlap = 4 consecutive 100 ms windows
+        blocks = np.convolve(k_ms, np.ones(4) / 4, mode="valid")
+    loudness = -0.691 + 10 * np.log10(np.maximum(blocks, 1e-12))
+
+    gated = blocks[loudness > -70.0]
+    if not len(gated):
+        return -70.0
+    relative = -0.691 + 10 * np.log10(gated.mean()) - 10.0
+    gated = blocks[(loudness > -70.0) & (loudness > relative)]
+    if not len(gated):
+        return -70.0
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def _silence_ranges(ms: np.ndarray, window: int, frames: int) -> list[tuple[int, int]]:
+    """(start, end) frame ranges of consecutive quiet windows ≥ MIN_SILENCE_SECONDS."""
+    quiet = 10 * np.log10(np.maximum(ms, 1e-12)) < SILENCE_THRESHOLD_DB
+    edges = np.diff(np.concatenate([[0], quiet.astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    min_windows = int(round(MIN_SILENCE_SECONDS / WINDOW_SECONDS))
+    return [
+        (int(s * window), int(min(e * window, frames)))
+        for s, e in zip(starts, ends)
+        if e - s >= min_windows
+    ]
+
+
+def _pyramid(mins: np.ndarray, maxs: np.ndarray) -> list[tuple[int, np.ndarray, np.ndarray]]:
+    """Base min/max peaks, then coarser levels reduced by LEVEL_FACTOR each."""
+    levels = [(BASE_SAMPLES_PER_PEAK, mins, maxs)]
+    while len(mins) > MIN_LEVEL_PEAKS:
+        pad = (-len(mins)) % LEVEL_FACTOR
+        mins = np.pad(mins, (0, pad), mode="edge").reshape(-1, LEVEL_FACTOR).min(axis=1)
+        maxs = np.pad(maxs, (0, pad), mode="edge").reshape(-1, LEVEL_FACTOR).max(axis=1)
+        levels.append((levels[-1][0] * LEVEL_FACTOR, mins, maxs))
+    return levels
+
+
+def write_peaks(analysis: StemAnalysis, path: str | Path) -> None:
+    """Write the pyramid and silence map as a binary sidecar."""
+    parts = [
+        _HEADER.pack(
+            PEAKS_MAGIC, PEAKS_VERSION, len(analysis.levels),
+            analysis.sample_rate, analysis.frames, len(analysis.silence),
+        )
+    ]
+    for samples_per_peak, mins, _ in analysis.levels:
+        parts.append(_LEVEL.pack(samples_per_peak, len(mins)))
+    for _, mins, maxs in analysis.levels:
+        pairs = np.empty((len(mins), 2), dtype=np.int8)
+        pairs[:, 0] = np.clip(np.round(mins * 127), -127, 127)
+        pairs[:, 1] = np.clip(np.round(maxs * 127), -127, 127)
+        parts.append(pairs.tobytes())
+    parts.append(np.asarray(analysis.silence, dtype="<u4").reshape(-1, 2).tobytes())
+    Path(path).write_bytes(b"".join(parts))
+
+
+def peaks_path_for(stem_path: str | Path) -> Path:
+    return Path(stem_path).with_suffix(".peaks")
+
+
+def analyze_stems(stem_paths: dict[str, str], progress=None) -> dict[str, dict]:
+    """
+    Analyse each separated stem and write its sidecar.
+
+    Returns {stem_type: Stem column values}, ready for Stem(**values).
+    With SILENT_STEMS = "drop", silent stems are deleted and left out. If
+    every stem is silent the loudest isn't counted as silent, so hide and
+    drop never leave a song without stems.
+    *progress(stage, fraction)* is called after each stem.
+    """
+    analyses = {}
+    for index, (stem_type, path) in enumerate(stem_paths.items()):
+        analyses[stem_type] = analyze_stem(path)
+        if progress is not None:
+            progress("analyze", (index + 1) / len(stem_paths))
+
+    silent = {
+        stem_type for stem_type, analysis in analyses.items()
+        if analysis.is_silent(settings.SILENT_STEM_THRESHOLD_DB)
+    }
+    if analyses and silent == set(analyses):
+        silent.discard(max(analyses, key=lambda stem_type: analyses[stem_type].loudest_span_db))
+
+    stems = {}
+    for stem_type, path in stem_paths.items():
+        analysis = analyses[stem_type]
+        if stem_type in silent and settings.SILENT_STEMS == "drop":
+            Path(path).unlink(missing_ok=True)
+            continue
+
+        peaks_path = peaks_path_for(path)
+        write_peaks(analysis, peaks_path)
+        precompress(peaks_path)
+        stems[stem_type] = {
+            "file_path": str(path),
+            "checksum": sha256_file(path),
+            "duration": round(analysis.duration, 3),
+            "sample_rate": analysis.sample_rate,
+            "peak_db": analysis.peak_db,
+            "rms_db": analysis.rms_db,
+            "lufs": analysis.lufs,
+            "is_silent": stem_type in silent,
+            "peaks_path": str(peaks_path),
+        }
+    return stems
@@ -0,0 +1,145 @@
+"""
+Pre-encoded, versioned cache of the public demo catalog (GET /api/songs/demos).
+
+The demo list only changes when someone seeds, syncs or resets, yet every
+visitor used to pay a query, a lazy stems load per song and a Pydantic
+serialisation. Instead the fully serialised list is kept as JSON bytes,
+plus gzip and (if the brotli package is installed) brotli variants, keyed
+by the catalog_versions counter that those scripts bump.
+
+Each API process re-reads the counter at most every
+CATALOG_VERSION_TTL_SECONDS, so a reseed shows up within seconds everywhere
+without any cross-process signalling, and a hit in between costs no DB
+round-trip at all. A rebuild is a fixed four queries (version + the
+repository's song/stem/rendition projections).
+"""
+import asyncio
+import gzip
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import List
+
+from pydantic import TypeAdapter
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..models import CatalogVersion, utcnow
+from ..repositories import songs as song_repo
+from ..schemas import SongOut
+
+try:
+    import brotli
+except ImportError:  # optional — gzip covers every browser
+    brotli = None
+
+DEMOS = "demos"
+
+_songs_adapter = TypeAdapter(List[SongOut])
+
+
+def bump_catalog_version(db, name: str = DEMOS) -> None:
+    """
+    Mark the catalog changed. *db* is a Session or Connection; the bump is
+    part of the caller's transaction, so it commits with the change itself.
+    """
+    table = CatalogVersion.__table__
+    result = db.execute(
+        update(table)
+        .where(table.c.name == name)
+        .values(version=table.c.version + 1, updated_at=utcnow())
+    )
+    if result.rowcount == 0:
+        db.execute(table.insert().values(name=name, version=1, updated_at=utcnow()))
+
+
+def get_catalog_version(db, name: str = DEMOS) -> int:
+    table = CatalogVersion.__table__
+    return db.execute(select(table.c.version).where(table.c.name == name)).scalar() or 0
+
+
+@dataclass
+class EncodedCatalog:
+    version: int
+    etag: str
+    # content-coding → body ("identity", "gzip", "br")
+    bodies: dict[str, bytes]
+
+
+def _encode(version: int, songs: list[dict]) -> EncodedCatalog:
+    body = _songs_adapter.dump_json(_songs_adapter.validate_python(songs))
+    bodies = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        bodies["br"] = brotli.compress(body, quality=11)
+    # Weak: the compressed variants are the same resource, not the same bytes
+    etag = f'W/"{DEMOS}-{version}-{hashlib.sha256(body).hexdigest()[:16]}"'
+    return EncodedCatalog(version, etag, bodies)
+
+
+class CatalogCache:
+    def __init__(self):
+        self._entry: EncodedCatalog | None = None
+        self._checked_at = 0.0
+        # Only one request per process re-checks / rebuilds; the rest wait for it
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return (
+            self._entry is not None
+            and time.monotonic() - self._checked_at < settings.CATALOG_VERSION_TTL_SECONDS
+        )
+
+    async def get(self, db: AsyncSession) -> EncodedCatalog:
+        """The current encoded demo catalog, rebuilding it if the version moved."""
+        if self._fresh():
+            return self._entry
+
+        async with self._lock:
+            if self._fresh():
+                return self._entry
+
+            version = await db.run_sync(get_catalog_version)
+            if self._entry is None or self._entry.version != version:
+                songs = await db.run_sync(song_repo.list_demo_songs)
+                # brotli at quality 11 is CPU-heavy — keep it off the event loop
+                self._entry = await run_in_threadpool(_encode, version, songs)
+            self._checked_at = time.monotonic()
+            return self._entry
+
+    def invalidate(self) -> None:
+        self._entry = None
+
+
+def choose_encoding(accept_encoding: str | None, available: dict[str, bytes]) -> str:
+    """Best content-coding the client accepts: br, then gzip, else identity."""
+    if not accept_encoding:
+        return "identity"
+    accepted: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    for coding in ("br", "gzip"):
+        if coding in available and accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return "identity"
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison (RFC 9110 §13.1.2): ignore W/ prefixes
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+demo_catalog = CatalogCache()
@@ -0,0 +1,348 @@
+"""
+Incremental sync of the demo catalog from a local database to production.
+
+Identity is content, not titles: songs are matched by Song.content_hash and
+stems by Stem.checksum (sha256 of the master file). Stem objects are stored
+content-addressed as stems/<checksum>.mp3, so one listing of that prefix
+tells us exactly which audio the object store already has.
+
+  plan = plan_sync(load_local(local_engine), load_target(target_engine), remote)
+  print(plan.describe())          # dry run: load_local/load_target(…, dry_run=True)
+  apply_plan(plan, target_engine, url_for)
+
+apply_plan only writes the delta: song inserts use one multi-row
+INSERT … RETURNING per batch, stem inserts/updates are executemany, and each
+batch commits as one transaction. The target schema comes from the app's
+migrations, never hand-written DDL. A dry run writes nothing anywhere: no
+migrations (the pending ones are only listed), no checksum backfill.
+"""
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from sqlalchemy import bindparam, delete, insert, inspect, literal, select, update
+from sqlalchemy.orm import Session, selectinload
+
+from ..config import settings
+from ..migrations import migrate_database, pending_revisions
+from ..models import Song, Stem
+from .catalog_cache import bump_catalog_version
+from .content_hash import sha256_file
+
+BATCH_SIZE = 500
+
+# Stem metadata copied to the target alongside the public URL
+_STEM_COLUMNS = ("model_name", "duration", "sample_rate", "peak_db", "rms_db", "lufs", "is_silent")
+
+
+@dataclass
+class LocalStem:
+    stem_type: str
+    checksum: str
+    file_path: Path
+    # Already-encoded MP3 rendition, uploaded as-is when present
+    mp3_path: Path | None
+    columns: dict
+
+    @property
+    def remote_path(self) -> str:
+        return f"stems/{self.checksum}.mp3"
+
+
+@dataclass
+class LocalSong:
+    content_hash: str
+    title: str
+    artist: str | None
+    stems: dict[str, LocalStem]
+
+
+@dataclass
+class TargetCatalog:
+    songs_by_hash: dict[str, tuple[int, str, str | None]]
+    songs_by_title: dict[str, tuple[int, str | None]]  # songs that predate content hashes
+    # song id → {stem_type: (stem id, checksum)}
+    stems: dict[int, dict[str, tuple[int, str | None]]]
+    # Migrations a dry run found unapplied (an applying run has applied them)
+    pending_migrations: list[str] = field(default_factory=list)
+
+
+@dataclass
+class SyncPlan:
+    uploads: list[LocalStem] = field(default_factory=list)
+    new_songs: list[LocalSong] = field(default_factory=list)
+    # (target song id, local song) — title/artist/hash changed
+    changed_songs: list[tuple[int, LocalSong]] = field(default_factory=list)
+    # (target song id, stem) for songs that already exist
+    new_stems: list[tuple[int, LocalStem]] = field(default_factory=list)
+    # (target stem id, stem) — audio changed (e.g. re-separated)
+    changed_stems: list[tuple[int, LocalStem]] = field(default_factory=list)
+    removed_stems: list[int] = field(default_factory=list)
+    unchanged_songs: int = 0
+
+    @property
+    def empty(self) -> bool:
+        return not (
+            self.uploads or self.new_songs or self.changed_songs
+            or self.new_stems or self.changed_stems or self.removed_stems
+        )
+
+    def describe(self) -> str:
+        lines = [
+            f"  objects to upload : {len(self.uploads)}",
+            f"  songs to insert   : {len(self.new_songs)}",
+            f"  songs to update   : {len(self.changed_songs)}",
+            f"  stems to insert   : {len(self.new_stems) + sum(len(s.stems) for s in self.new_songs)}",
+            f"  stems to update   : {len(self.changed_stems)}",
+            f"  stems to delete   : {len(self.removed_stems)}",
+            f"  songs up to date  : {self.unchanged_songs}",
+        ]
+        for song in self.new_songs:
+            lines.append(f"    + {song.title} ({len(song.stems)} stems)")
+        for _, song in self.changed_songs:
+            lines.append(f"    ~ {song.title}")
+        return "\n".join(lines)
+
+
+# ── Loading ───────────────────────────────────────────────────────────────────
+
+def load_local(engine, dry_run: bool = False) -> list[LocalSong]:
+    """
+    Complete demo songs and their listed stems (silent ones too under
+    SILENT_STEMS = "keep"). Stems seeded before checksums existed are hashed
+    once and the checksum saved back — except on a dry run, which leaves the
+    local database as it was.
+    """
+    songs = []
+    with Session(engine) as db:
+        rows = (
+            db.query(Song)
+            .options(selectinload(Song.stems).selectinload(Stem.renditions))
+            .filter(Song.is_demo == True, Song.status == "complete")
+            .order_by(Song.id)
+            .all()
+        )
+        for song in rows:
+            if not song.content_hash:
+                print(f"  [warn] {song.title}: no content hash — re-run seed_demos.py; skipping")
+                continue
+            stems = {}
+            for stem in song.stems:
+                hidden = stem.is_silent and settings.SILENT_STEMS != "keep"
+                if hidden or not Path(stem.file_path).exists():
+                    continue
+                if not stem.checksum:
+                    stem.checksum = sha256_file(stem.file_path)
+                mp3 = max(
+                    (r for r in stem.renditions if r.codec == "mp3" and Path(r.file_path).exists()),
+                    key=lambda r: r.bitrate_kbps,
+                    default=None,
+                )
+                stems[stem.stem_type] = LocalStem(
+                    stem_type=stem.stem_type,
+                    checksum=stem.checksum,
+                    file_path=Path(stem.file_path),
+                    mp3_path=Path(mp3.file_path) if mp3 else None,
+                    columns={name: getattr(stem, name) for name in _STEM_COLUMNS},
+                )
+            if stems:
+                songs.append(LocalSong(song.content_hash, song.title, song.artist, stems))
+        if dry_run:
+            db.rollback()
+        else:
+            db.commit()
+    return songs
+
+
+def load_target(engine, dry_run: bool = False) -> TargetCatalog:
+    """
+    The target's demo catalog in two queries, migrating its schema first. A
+    dry run only lists the pending migrations and reads whatever the
+    current schema has: columns it lacks read as NULL, no tables as empty.
+    """
+    pending = []
+    if dry_run:
+        pending = pending_revisions(engine)
+    else:
+        migrate_database(engine)
+    songs, stems = Song.__table__, Stem.__table__
+
+    with engine.connect() as conn:
+        present = {table: {c["name"] for c in inspect(conn).get_columns(table)}
+                   for table in inspect(conn).get_table_names()}
+        if songs.name not in present or stems.name not in present:
+            return TargetCatalog({}, {}, {}, pending)
+
+        def column(table, name):
+            return table.c[name] if name in present[table.name] else literal(None).label(name)
+
+        song_rows = conn.execute(
+            select(songs.c.id, column(songs, "content_hash"), songs.c.title, songs.c.artist)
+            .where(songs.c.is_demo == True)
+        ).all()
+        stem_rows = conn.execute(
+            select(stems.c.id, stems.c.song_id, stems.c.stem_type, column(stems, "checksum"))
+            .join(songs, songs.c.id == stems.c.song_id)
+            .where(songs.c.is_demo == True)
+        ).all()
+
+    catalog = TargetCatalog({}, {}, {}, pending)
+    for song_id, content_hash, title, artist in song_rows:
+        if content_hash:
+            catalog.songs_by_hash[content_hash] = (song_id, title, artist)
+        else:
+            catalog.songs_by_title[title] = (song_id, artist)
+    for stem_id, song_id, stem_type, checksum in stem_rows:
+        catalog.stems.setdefault(song_id, {})[stem_type] = (stem_id, checksum)
+    return catalog
+
+
+# ── Planning ──────────────────────────────────────────────────────────────────
+
+def plan_sync(local: list[LocalSong], target: TargetCatalog, remote_checksums: set[str]) -> SyncPlan:
+    """Diff the local catalog against the target DB and object store."""
+    plan = SyncPlan()
+    queued: set[str] = set()
+
+    for song in local:
+        for stem in song.stems.values():
+            if stem.checksum not in remote_checksums and stem.checksum not in queued:
+                queued.add(stem.checksum)
+                plan.uploads.append(stem)
+
+        song_changed = False
+        if song.content_hash in target.songs_by_hash:
+            song_id, title, artist = target.songs_by_hash[song.content_hash]
+            if (title, artist) != (song.title, song.artist):
+                plan.changed_songs.append((song_id, song))
+                song_changed = True
+        elif song.title in target.songs_by_title:
+            # Seeded by title before content hashes — adopt the row
+            song_id, _ = target.songs_by_title.pop(song.title)
+            plan.changed_songs.append((song_id, song))
+            song_changed = True
+        else:
+            plan.new_songs.append(song)
+            continue
+
+        existing = target.stems.get(song_id, {})
+        for stem_type, stem in song.stems.items():
+            if stem_type not in existing:
+                plan.new_stems.append((song_id, stem))
+                song_changed = True
+            elif existing[stem_type][1] != stem.checksum:
+                plan.changed_stems.append((existing[stem_type][0], stem))
+                song_changed = True
+        for stem_type, (stem_id, _) in existing.items():
+            if stem_type not in song.stems:
+                plan.removed_stems.append(stem_id)
+                song_changed = True
+        if not song_changed:
+            plan.unchanged_songs += 1
+
+    return plan
+
+
+# ── Applying ──────────────────────────────────────────────────────────────────
+
+def _stem_row(song_id: int, stem: LocalStem, url_for: Callable[[str], str]) -> dict:
+    return {
+        "song_id": song_id,
+        "stem_type": stem.stem_type,
+        "file_path": url_for(stem.remote_path),
+        "checksum": stem.checksum,
+        **stem.columns,
+    }
+
+
+def _batches(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def apply_plan(
+    plan: SyncPlan,
+    engine,
+    url_for: Callable[[str], str],
+    batch_size: int = BATCH_SIZE,
+) -> None:
+    """Write the plan's DB changes; each batch is one transaction."""
+    songs, stems = Song.__table__, Stem.__table__
+
+    for batch in _batches(plan.new_songs, batch_size):
+        with engine.begin() as conn:
+            inserted = conn.execute(
+                insert(songs).returning(songs.c.id, songs.c.content_hash),
+                [
+                    {
+                        "title": song.title,
+                        "artist": song.artist,
+                        "content_hash": song.content_hash,
+                        "status": "complete",
+                        "is_demo": True,
+                    }
+                    for song in batch
+                ],
+            ).all()
+            ids = {content_hash: song_id for song_id, content_hash in inserted}
+            stem_rows = [
+                _stem_row(ids[song.content_hash], stem, url_for)
+                for song in batch
+                for stem in song.stems.values()
+            ]
+            if stem_rows:
+                conn.execute(insert(stems), stem_rows)
+
+    for batch in _batches(plan.changed_songs, batch_size):
+        with engine.begin() as conn:
+            conn.execute(
+                update(songs)
+                .where(songs.c.id == bindparam("song_id"))
+                .values(
+                    title=bindparam("new_title"),
+                    artist=bindparam("new_artist"),
+                    content_hash=bindparam("new_hash"),
+                ),
+                [
+                    {
+                        "song_id": song_id,
+                        "new_title": song.title,
+                        "new_artist": song.artist,
+                        "new_hash": song.content_hash,
+                    }
+                    for song_id, song in batch
+                ],
+            )
+
+    for batch in _batches(plan.new_stems, batch_size):
+        with engine.begin() as conn:
+            conn.execute(insert(stems), [_stem_row(sid, stem, url_for) for sid, stem in batch])
+
+    for batch in _batches(plan.changed_stems, batch_size):
+        with engine.begin() as conn:
+            conn.execute(
+                update(stems)
+                .where(stems.c.id == bindparam("stem_id"))
+                .values(
+                    file_path=bindparam("new_path"),
+                    checksum=bindparam("new_checksum"),
+                    **{name: bindparam(f"new_{name}") for name in _STEM_COLUMNS},
+                ),
+                [
+                    {
+                        "stem_id": stem_id,
+                        "new_path": url_for(stem.remote_path),
+                        "new_checksum": stem.checksum,
+                        **{f"new_{name}": stem.columns[name] for name in _STEM_COLUMNS},
+                    }
+                    for stem_id, stem in batch
+                ],
+            )
+
+    for batch in _batches(plan.removed_stems, batch_size):
+        with engine.begin() as conn:
+            conn.execute(delete(stems).where(stems.c.id.in_(batch)))
+
+    # Tell the production API processes to rebuild their cached catalog
+    with engine.begin() as conn:
+        bump_catalog_version(conn)
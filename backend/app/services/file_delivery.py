@@ -0,0 +1,357 @@
+"""
+Audio and sidecar file delivery: byte ranges, validators and caching.
+
+Starlette's FileResponse stats the file on every request, never answers a
+conditional request with 304, rejects a whole multi-range request if any one
+range is unsatisfiable and labels multipart range responses with the file's
+own Content-Type. FileDelivery handles all of that per RFC 9110:
+
+- Range: single ranges (206), several ranges (206 multipart/byteranges,
+  overlapping ones merged), suffix and open-ended ranges, If-Range, 416 only
+  when no requested range overlaps the file. A malformed or oversized Range
+  header is ignored and the whole file is sent, as the RFC allows.
+- If-None-Match / If-Modified-Since → 304 with no body.
+- Cache-Control: originals and packs are named after their content's
+  sha256, and stem files after the audio's sha256 plus the separation
+  model, so such a name never points at different bytes and can be cached
+  for a year ("immutable": browsers don't even revalidate on reload).
+  Anything else — including stems from before the model was in the name,
+  which retries rewrote in place — must revalidate, which the validators
+  make cheap. /uploads and /api/files aren't authenticated and hold private
+  users' files, so the default is always "private": only routes that know
+  a file is demo content mark it public.
+- Body: zero-copy via the ASGI zerocopysend extension (os.sendfile) when the
+  server offers it; otherwise large positioned reads (os.pread) on the
+  threadpool, so concurrent requests never share a file offset.
+
+Path resolution and stat results — including "no such file" — are cached
+for FILE_STAT_CACHE_SECONDS. A file deleted in that window makes the open
+fail, which evicts the entry and 404s.
+"""
+import mimetypes
+import os
+import re
+import stat
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from secrets import token_hex
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from ..config import settings
+
+# <sha256>.<ext>, <sha256>_<model>_<stem>.wav, <sha256>_<model>_<stem>.192k.mp3 …
+CONTENT_ADDRESSED = re.compile(
+    r"^[0-9a-f]{64}(?:\.|_(?:%s)_)"
+    % "|".join(re.escape(model) for model in sorted(settings.SEPARATION_MODELS, key=len, reverse=True))
+)
+IMMUTABLE = "private, max-age=31536000, immutable"
+REVALIDATE = "private, no-cache"
+
+MAX_RANGES = 16  # more than this in one request → the whole file instead
+CHUNK_SIZE = 256 * 1024
+_RANGE_SPEC = re.compile(r"^(\d*)-(\d*)$")
+
+
+# ── File metadata ─────────────────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class FileInfo:
+    path: str
+    size: int
+    mtime: int  # whole seconds, the resolution of Last-Modified
+    etag: str  # strong: usable with If-Range
+    last_modified: str
+
+    @property
+    def content_addressed(self) -> bool:
+        return CONTENT_ADDRESSED.match(os.path.basename(self.path)) is not None
+
+    @property
+    def media_type(self) -> str:
+        return mimetypes.guess_type(self.path)[0] or "application/octet-stream"
+
+
+def _stat(path: Path, base: Path | None) -> FileInfo | None:
+    target = path.resolve()
+    if base is not None and not target.is_relative_to(base.resolve()):
+        raise HTTPException(status_code=403, detail="Access denied")
+    try:
+        st = target.stat()
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    mtime = int(st.st_mtime)
+    return FileInfo(
+        path=str(target),
+        size=st.st_size,
+        mtime=mtime,
+        etag=f'"{st.st_size:x}-{st.st_mtime_ns:x}"',
+        last_modified=formatdate(mtime, usegmt=True),
+    )
+
+
+class StatCache:
+    def __init__(self):
+        # (base, path) → (checked at, info or None for "no such file"),
+        # least recently used first
+        self._entries: OrderedDict[tuple[str, str], tuple[float, FileInfo | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def lookup(self, path: str | Path, base: Path | None = None) -> FileInfo:
+        """
+        FileInfo for *path* (relative to *base* if given, which it may not
+        escape — 403). 404 if it isn't a regular file.
+        """
+        info = await self.find(path, base)
+        if info is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        return info
+
+    async def find(self, path: str | Path, base: Path | None = None) -> FileInfo | None:
+        """lookup(), but None for a missing file — misses are cached too."""
+        key = (str(base or ""), str(path))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[0] < settings.FILE_STAT_CACHE_SECONDS:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        target = base / path if base is not None else Path(path)
+        info = await run_in_threadpool(_stat, target, base)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), info)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.FILE_STAT_CACHE_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+        return info
+
+    def evict(self, path: str) -> None:
+        """Drop every entry that resolved to *path*."""
+        with self._lock:
+            for key in [k for k, (_, info) in self._entries.items() if info and info.path == path]:
+                del self._entries[key]
+
+
+stat_cache = StatCache()
+
+
+# ── Conditional and range requests ────────────────────────────────────────────
+
+def _etag_list(header: str) -> set[str]:
+    return {tag.strip().removeprefix("W/") for tag in header.split(",")}
+
+
+def not_modified(request_headers: Headers, info: FileInfo) -> bool:
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison (RFC 9110 §13.1.2)
+        return if_none_match.strip() == "*" or info.etag in _etag_list(if_none_match)
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return info.mtime <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _if_range_matches(if_range: str, info: FileInfo) -> bool:
+    # Strong comparison only: a weak tag or a different date means "send it all"
+    if_range = if_range.strip()
+    if if_range.startswith('"'):
+        return if_range == info.etag
+    return if_range == info.last_modified
+
+
+def parse_ranges(header: str, size: int) -> list[tuple[int, int]] | None:
+    """
+    Byte ranges as sorted, merged, half-open (start, end) pairs. None means
+    ignore the header (malformed, not bytes, too many ranges); an empty list
+    means nothing requested overlaps the file (416).
+    """
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs.strip():
+        return None
+    parts = specs.split(",")
+    if len(parts) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for part in parts:
+        match = _RANGE_SPEC.match(part.strip())
+        if not match or match.groups() == ("", ""):
+            return None
+        first, last = match.groups()
+        if first == "":  # suffix: the last N bytes
+            length = int(last)
+            if length and size:
+                ranges.append((max(size - length, 0), size))
+            continue
+        start = int(first)
+        end = size if last == "" else int(last) + 1
+        if last != "" and end <= start:
+            return None
+        if start < size:
+            ranges.append((start, min(end, size)))
+
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+# ── Response ──────────────────────────────────────────────────────────────────
+
+class FileDelivery(Response):
+    """Response for one file — see the module docstring."""
+
+    def __init__(
+        self,
+        info: FileInfo,
+        media_type: str | None = None,
+        headers: dict[str, str] | None = None,
+        cache_control: str | None = None,
+    ):
+        self.info = info
+        self.media_type = media_type or info.media_type
+        self.background = None
+        self.response_headers = {
+            "accept-ranges": "bytes",
+            "etag": info.etag,
+            "last-modified": info.last_modified,
+            "cache-control": cache_control or (IMMUTABLE if info.content_addressed else REVALIDATE),
+            **{name.lower(): value for name, value in (headers or {}).items()},
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        request_headers = Headers(scope=scope)
+        head = scope["method"] == "HEAD"
+
+        if not_modified(request_headers, self.info):
+            await self._start(send, 304, {})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        ranges = None
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if range_header and (if_range is None or _if_range_matches(if_range, self.info)):
+            ranges = parse_ranges(range_header, self.info.size)
+
+        if ranges == []:
+            await self._start(send, 416, {"content-range": f"bytes */{self.info.size}", "content-length": "0"})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        try:
+            file = open(self.info.path, "rb", buffering=0)
+        except OSError:
+            # Deleted since it was stat'ed
+            stat_cache.evict(self.info.path)
+            raise HTTPException(status_code=404, detail="File not found")
+        with file:
+            if ranges is None:
+                await self._start(send, 200, {
+                    "content-type": self.media_type,
+                    "content-length": str(self.info.size),
+                })
+                if not head:
+                    await send_file(scope, send, file, 0, self.info.size)
+            elif len(ranges) == 1:
+                start, end = ranges[0]
+                await self._start(send, 206, {
+                    "content-type": self.media_type,
+                    "content-range": f"bytes {start}-{end - 1}/{self.info.size}",
+                    "content-length": str(end - start),
+                })
+                if not head:
+                    await send_file(scope, send, file, start, end - start)
+            else:
+                await self._send_multipart(scope, send, file, ranges, head)
+            await send({"type": "http.response.body", "body": b""})
+
+        if self.background is not None:
+            await self.background()
+
+    async def _start(self, send: Send, status: int, extra: dict[str, str]) -> None:
+        headers = {**self.response_headers, **extra}
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()],
+        })
+
+    async def _send_multipart(self, scope, send, file, ranges: list[tuple[int, int]], head: bool) -> None:
+        boundary = token_hex(13)
+        part_headers = [
+            (
+                f"--{boundary}\r\n"
+                f"Content-Type: {self.media_type}\r\n"
+                f"Content-Range: bytes {start}-{end - 1}/{self.info.size}\r\n\r\n"
+            ).encode("latin-1")
+            for start, end in ranges
+        ]
+        closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+        # Each part after the first is preceded by the CRLF that ends the last one
+        length = sum(len(h) for h in part_headers) + sum(end - start for start, end in ranges)
+        length += 2 * (len(ranges) - 1) + len(closing)
+
+        await self._start(send, 206, {
+            "content-type": f"multipart/byteranges; boundary={boundary}",
+            "content-length": str(length),
+        })
+        if head:
+            return
+        for i, ((start, end), header) in enumerate(zip(ranges, part_headers)):
+            await send({
+                "type": "http.response.body",
+                "body": (b"\r\n" if i else b"") + header,
+                "more_body": True,
+            })
+            await send_file(scope, send, file, start, end - start)
+        await send({"type": "http.response.body", "body": closing, "more_body": True})
+
+
+async def send_file(scope: Scope, send: Send, file, offset: int, count: int) -> None:
+    """Send *count* bytes of *file* from *offset* as more_body chunks."""
+    if "http.response.zerocopysend" in scope.get("extensions", {}):
+        await send({
+            "type": "http.response.zerocopysend",
+            "file": file,
+            "offset": offset,
+            "count": count,
+            "more_body": True,
+        })
+        return
+    end = offset + count
+    while offset < end:
+        chunk = await run_in_threadpool(os.pread, file.fileno(), min(CHUNK_SIZE, end - offset), offset)
+        if not chunk:
+            break  # truncated underneath us; Content-Length will be short
+        offset += len(chunk)
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+
+async def deliver(
+    path: str | Path,
+    media_type: str | None = None,
+    base: Path | None = None,
+    headers: dict[str, str] | None = None,
+    cache_control: str | None = None,
+) -> FileDelivery:
+    """Stat *path* (through the cache) and build its response — 403/404 as HTTPException."""
+    info = await stat_cache.lookup(path, base)
+    return FileDelivery(info, media_type, headers, cache_control)
@@ -0,0 +1,195 @@
+"""
+Upload ingestion — streams an upload to disk without blocking the event loop.
+
+The format is sniffed from the first bytes (not trusted from the filename),
+the size cap is enforced as chunks arrive, and the SHA-256 is computed on
+the way through, so the stored file is named by its content hash.
+"""
+import hashlib
+import os
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from fastapi import HTTPException, UploadFile, status
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..models import Song, UploadSession, utcnow
+from ..repositories import songs as song_repo
+from . import job_queue, stem_cache
+from .content_hash import CHUNK_SIZE
+
+# Bytes needed to recognise every supported container
+SNIFF_BYTES = 12
+
+
+def sniff_audio_format(head: bytes) -> str | None:
+    """Return the file suffix for *head*'s audio container, or None."""
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return ".wav"
+    if head[:4] == b"fLaC":
+        return ".flac"
+    if head[:4] == b"OggS":
+        return ".ogg"
+    if head[4:8] == b"ftyp":
+        return ".m4a"
+    if head[:3] == b"ID3":
+        return ".mp3"
+    if len(head) >= 2 and head[0] == 0xFF:
+        if head[1] & 0xF6 == 0xF0:  # ADTS sync word, layer 0
+            return ".aac"
+        if head[1] & 0xE0 == 0xE0:  # MPEG audio frame sync
+            return ".mp3"
+    return None
+
+
+def originals_dir() -> Path:
+    path = Path(settings.UPLOAD_DIR) / "originals"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def store_original(tmp_path: Path, content_hash: str, suffix: str) -> Path:
+    """
+    Move a fully written temp file to originals/<sha256><suffix> (a rename
+    within the same directory). If that content is already stored, the temp
+    file is dropped and the existing one reused.
+    """
+    dest_path = originals_dir() / f"{content_hash}{suffix}"
+    if dest_path.exists():
+        tmp_path.unlink()
+    else:
+        os.replace(tmp_path, dest_path)
+    return dest_path
+
+
+def check_upload_allowed(db: Session, user_id: int) -> None:
+    """Raise unless *user_id* may add another song right now."""
+    if settings.DEMO_MODE:
+        raise HTTPException(
+            status_code=503,
+            detail="Song upload is disabled in demo mode. Run the app locally to upload your own tracks.",
+        )
+
+    song_count = db.query(Song).filter(Song.user_id == user_id).count()
+    if song_count >= settings.MAX_USER_SONGS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Upload limit reached ({settings.MAX_USER_SONGS} songs per account).",
+        )
+
+
+def create_uploaded_song(
+    db: Session, user_id: int, path: Path, content_hash: str, filename: str | None
+) -> Song:
+    """
+    Create the Song for a stored original and hand it to the separation
+    pipeline: cached stems if this audio was separated before, else a job.
+    """
+    song = Song(
+        title=Path(filename or "Untitled").stem,
+        original_path=str(path),
+        content_hash=content_hash,
+        status="pending",
+        user_id=user_id,
+    )
+    db.add(song)
+    db.flush()
+
+    if not stem_cache.attach_cached_stems(db, song):
+        job_queue.enqueue(db, song.id)
+    db.commit()
+    return song_repo.get_song(db, song.id)
+
+
+def incoming_path(upload_id: str) -> Path:
+    """Where a resumable upload's parts are written (see routers/uploads.py)."""
+    return Path(settings.UPLOAD_DIR) / "incoming" / f"{upload_id}.part"
+
+
+def upload_session_cutoff():
+    """Sessions created before this have expired (UPLOAD_SESSION_TTL_HOURS)."""
+    return utcnow() - timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+
+
+def expire_upload_sessions(db: Session) -> int:
+    """
+    Drop resumable upload sessions older than UPLOAD_SESSION_TTL_HOURS with
+    their preallocated files, and any incoming file that outlived its
+    session. The worker calls this periodically. Returns sessions dropped.
+    """
+    expired = db.query(UploadSession).filter(UploadSession.created_at < upload_session_cutoff()).all()
+    for session in expired:
+        incoming_path(session.id).unlink(missing_ok=True)
+        db.delete(session)
+    db.commit()
+
+    incoming = Path(settings.UPLOAD_DIR) / "incoming"
+    if incoming.is_dir():
+        live = {upload_id for (upload_id,) in db.query(UploadSession.id)}
+        stale_before = time.time() - settings.UPLOAD_SESSION_TTL_HOURS * 3600
+        for path in incoming.glob("*.part"):
+            if path.stem not in live and path.stat().st_mtime < stale_before:
+                path.unlink(missing_ok=True)
+    return len(expired)
+
+
+def too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File exceeds the {settings.MAX_UPLOAD_MB} MB upload limit.",
+    )
+
+
+def unsupported_format() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        detail="Unsupported audio format (expected MP3, WAV, FLAC, M4A, OGG or AAC).",
+    )
+
+
+async def ingest_upload(file: UploadFile) -> tuple[Path, str]:
+    """
+    Stream *file* into originals/, returning (path, sha256 hex digest).
+
+    Raises 415 if the first bytes aren't a supported audio container and 413
+    once more than MAX_UPLOAD_MB has been read. Disk writes and hashing run
+    in the threadpool, one hop per chunk, so the loop stays free.
+    """
+    max_bytes = settings.MAX_UPLOAD_MB * 1_048_576
+
+    head = await file.read(SNIFF_BYTES)
+    suffix = sniff_audio_format(head)
+    if suffix is None:
+        raise unsupported_format()
+
+    digest = hashlib.sha256()
+    tmp_path = originals_dir() / f".{uuid.uuid4().hex}{suffix}.part"
+    fp = await run_in_threadpool(tmp_path.open, "wb")
+    try:
+        size = 0
+        chunk = head
+        while chunk:
+            size += len(chunk)
+            if size > max_bytes:
+                raise too_large()
+            await run_in_threadpool(_hash_and_write, digest, fp, chunk)
+            chunk = await file.read(CHUNK_SIZE)
+        await run_in_threadpool(fp.close)
+
+        content_hash = digest.hexdigest()
+        dest_path = await run_in_threadpool(store_original, tmp_path, content_hash, suffix)
+    except BaseException:
+        fp.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    return dest_path, content_hash
+
+
+def _hash_and_write(digest, fp, chunk: bytes) -> None:
+    digest.update(chunk)
+    fp.write(chunk)
@@ -0,0 +1,191 @@
+"""
+Durable separation queue backed by the separation_jobs table.
+
+Every operation that changes a job's owner is a conditional UPDATE
+(compare-and-set on status), so several worker processes can poll the same
+table without double-claiming a song — this works the same on SQLite and
+PostgreSQL. A job whose audio (content hash) is already being separated by
+another running job waits; when it runs, it finds that job's stems in the
+cache (services.stem_cache) instead of separating the same audio twice.
+"""
+from datetime import timedelta
+
+from sqlalchemy import exists
+from sqlalchemy.orm import Session, aliased
+
+from ..config import settings
+from ..models import SeparationJob, Song, utcnow
+
+
+def enqueue(db: Session, song_id: int) -> SeparationJob:
+    """Add a pending job for *song_id*. The caller commits."""
+    job = SeparationJob(song_id=song_id, status="pending", run_after=utcnow())
+    db.add(job)
+    return job
+
+
+def enqueue_orphans(db: Session) -> int:
+    """
+    Queue user songs that are pending/processing but have no job row —
+    uploads accepted before the queue existed, when separation still ran in
+    a BackgroundTask that died with the API process.
+    """
+    orphans = (
+        db.query(Song.id)
+        .outerjoin(SeparationJob, SeparationJob.song_id == Song.id)
+        .filter(
+            SeparationJob.id.is_(None),
+            Song.is_demo == False,
+            Song.status.in_(("pending", "processing")),
+        )
+        .all()
+    )
+    for (song_id,) in orphans:
+        enqueue(db, song_id)
+        db.query(Song).filter(Song.id == song_id).update({"status": "pending"})
+    db.commit()
+    return len(orphans)
+
+
+def _hash_in_flight(job_id_column):
+    """SQL: another running job is separating the same audio as this job."""
+    job, song, running_job, running_song = (
+        aliased(SeparationJob), aliased(Song), aliased(SeparationJob), aliased(Song)
+    )
+    return (
+        exists()
+        .where(
+            job.id == job_id_column,
+            song.id == job.song_id,
+            song.content_hash.isnot(None),
+            running_song.content_hash == song.content_hash,
+            running_job.song_id == running_song.id,
+            running_job.status == "running",
+            running_job.id != job.id,
+        )
+    )
+
+
+def claim_next(db: Session, worker_id: str) -> SeparationJob | None:
+    """
+    Atomically take the oldest runnable job, or return None if there is
+    none. Jobs for audio that's already being separated are skipped.
+    """
+    now = utcnow()
+    candidates = (
+        db.query(SeparationJob.id)
+        .filter(
+            SeparationJob.status == "pending",
+            SeparationJob.run_after <= now,
+            ~_hash_in_flight(SeparationJob.id),
+        )
+        .order_by(SeparationJob.run_after, SeparationJob.id)
+        .limit(5)
+        .all()
+    )
+    for (job_id,) in candidates:
+        claimed = (
+            db.query(SeparationJob)
+            .filter(
+                SeparationJob.id == job_id,
+                SeparationJob.status == "pending",
+                ~_hash_in_flight(job_id),
+            )
+            .update(
+                {
+                    "status": "running",
+                    "claimed_by": worker_id,
+                    "heartbeat_at": now,
+                    "attempts": SeparationJob.attempts + 1,
+                    "stage": None,
+                    "progress": None,
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        if claimed:
+            return db.get(SeparationJob, job_id)
+    return None
+
+
+def heartbeat(db: Session, job_ids: list[int], worker_id: str) -> None:
+    """Mark this worker's running jobs as alive so they aren't recovered."""
+    if not job_ids:
+        return
+    (
+        db.query(SeparationJob)
+        .filter(
+            SeparationJob.id.in_(job_ids),
+            SeparationJob.claimed_by == worker_id,
+            SeparationJob.status == "running",
+        )
+        .update({"heartbeat_at": utcnow()}, synchronize_session=False)
+    )
+    db.commit()
+
+
+def mark_done(db: Session, job: SeparationJob) -> None:
+    job.status = "done"
+    job.last_error = None
+    db.commit()
+
+
+def mark_failed(db: Session, job_id: int, error: str) -> bool:
+    """
+    Record a failed attempt. Schedules a retry with exponential backoff
+    while attempts remain; otherwise fails the job and flags the song.
+    Returns True if the job will be retried.
+    """
+    job = db.get(SeparationJob, job_id)
+    if job is None:
+        return False
+
+    job.last_error = error[:500]
+    retry = job.attempts < settings.JOB_MAX_ATTEMPTS
+    if retry:
+        job.status = "pending"
+        job.claimed_by = None
+        job.run_after = utcnow() + timedelta(seconds=_backoff_seconds(job.attempts))
+        job.song.status = "pending"
+    else:
+        job.status = "failed"
+        job.song.status = "error"
+        job.song.error_message = job.last_error
+    db.commit()
+    return retry
+
+
+def recover_stale(db: Session) -> int:
+    """
+    Re-queue running jobs whose worker stopped heartbeating (crash, OOM kill,
+    host restart). Counts as a failed attempt so a job that reliably kills
+    its worker can't loop forever.
+    """
+    cutoff = utcnow() - timedelta(seconds=settings.JOB_STALE_SECONDS)
+    stale = (
+        db.query(SeparationJob.id)
+        .filter(SeparationJob.status == "running", SeparationJob.heartbeat_at < cutoff)
+        .all()
+    )
+    recovered = 0
+    for (job_id,) in stale:
+        released = (
+            db.query(SeparationJob)
+            .filter(
+                SeparationJob.id == job_id,
+                SeparationJob.status == "running",
+                SeparationJob.heartbeat_at < cutoff,
+            )
+            .update({"status": "stale"}, synchronize_session=False)
+        )
+        db.commit()
+        if released:
+            mark_failed(db, job_id, "Worker stopped responding while separating")
+            recovered += 1
+    return recovered
+
+
+def _backoff_seconds(attempts: int) -> int:
+    delay = settings.JOB_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0)
+    return min(delay, settings.JOB_RETRY_MAX_SECONDS)
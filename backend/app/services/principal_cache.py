@@ -0,0 +1,108 @@
+"""
+In-process cache of authenticated principals, so get_current_user doesn't
+look the user up on every request — every list, status poll and stream.
+
+The token itself is still verified (signature and expiry) on every request;
+that needs no I/O. Only the users-table lookup behind it is cached: entries
+are keyed by user id, live for AUTH_CACHE_TTL_SECONDS and the least recently
+used ones are evicted past AUTH_CACHE_MAX_ENTRIES.
+
+A user updated or deleted through an ORM Session in this process is dropped
+from the cache when that transaction commits. Changes made anywhere else —
+another API process, a script, bulk or raw SQL — show up within the TTL.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from ..config import settings
+from ..models import User
+
+# Session.info key: ids of users changed in the session's open transaction
+_CHANGED_USERS = "principal_cache.changed_users"
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Who is making the request — what the routers need, without the ORM row."""
+    id: int
+    email: str
+
+
+class PrincipalCache:
+    def __init__(self):
+        # user id → (loaded at, principal), least recently used first
+        self._entries: OrderedDict[int, tuple[float, Principal]] = OrderedDict()
+        # Bumped by every invalidation; see put()
+        self._generation = 0
+        # The ORM events can fire from worker threads (sync sessions)
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, user_id: int) -> Principal | None:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            loaded_at, principal = entry
+            if time.monotonic() - loaded_at >= settings.AUTH_CACHE_TTL_SECONDS:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return principal
+
+    def put(self, principal: Principal, generation: int) -> None:
+        """
+        Cache *principal*, loaded after reading *generation*. If anything was
+        invalidated since, the row may predate that change and isn't cached.
+        """
+        if settings.AUTH_CACHE_MAX_ENTRIES <= 0:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[principal.id] = (time.monotonic(), principal)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > settings.AUTH_CACHE_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache()
+
+
+# ── Invalidation ──────────────────────────────────────────────────────────────
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _remember_changed_user(mapper, connection, target: User) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_CHANGED_USERS, set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session: Session) -> None:
+    for user_id in session.info.pop(_CHANGED_USERS, ()):
+        principal_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_users(session: Session) -> None:
+    session.info.pop(_CHANGED_USERS, None)
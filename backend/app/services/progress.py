@@ -0,0 +1,126 @@
+"""
+Separation progress: written by the worker, pushed to clients by the API.
+
+The worker runs in another process, so the separation_jobs row is the
+channel. ProgressReporter (worker side) writes stage fractions to it at most
+once per PROGRESS_WRITE_SECONDS. ProgressHub (API side) polls every song
+that has an open /events stream with one batched query per
+PROGRESS_POLL_SECONDS — however many clients are listening — and fans
+changes out to each stream's queue.
+"""
+import asyncio
+import time
+
+from sqlalchemy import select
+
+from ..config import settings
+from ..database import AsyncSessionLocal, SessionLocal
+from ..models import SeparationJob, Song
+
+TERMINAL_STATUSES = {"complete", "error", "deleted"}
+
+
+# ── Worker side ───────────────────────────────────────────────────────────────
+
+class ProgressReporter:
+    """progress(stage, fraction) callback that persists to a job row, throttled."""
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self.stage: str | None = None
+        self.fractions: dict[str, float] = {}
+        self._last_write = 0.0
+
+    def __call__(self, stage: str, fraction: float) -> None:
+        # Only the first time a stage finishes forces a write; anything else —
+        # stage changes included, which the separator makes after every
+        # segment — waits for the throttle
+        finished = fraction >= 1.0 and self.fractions.get(stage, 0.0) < 1.0
+        self.stage = stage
+        self.fractions[stage] = round(fraction, 3)
+
+        now = time.monotonic()
+        if finished or now - self._last_write >= settings.PROGRESS_WRITE_SECONDS:
+            self._last_write = now
+            self.flush()
+
+    def flush(self) -> None:
+        with SessionLocal() as db:
+            (
+                db.query(SeparationJob)
+                .filter(SeparationJob.id == self.job_id)
+                .update(
+                    {"stage": self.stage, "progress": dict(self.fractions)},
+                    synchronize_session=False,
+                )
+            )
+            db.commit()
+
+
+# ── API side ──────────────────────────────────────────────────────────────────
+
+async def _fetch_states(song_ids: list[int]) -> dict[int, dict]:
+    async with AsyncSessionLocal() as db:
+        rows = (
+            await db.execute(
+                select(
+                    Song.id, Song.status, Song.error_message,
+                    SeparationJob.stage, SeparationJob.progress, SeparationJob.attempts,
+                )
+                .outerjoin(SeparationJob, SeparationJob.song_id == Song.id)
+                .where(Song.id.in_(song_ids))
+            )
+        ).all()
+    states = {song_id: {"status": "deleted"} for song_id in song_ids}
+    for song_id, status, error, stage, progress, attempts in rows:
+        states[song_id] = {
+            "status": status,
+            "stage": stage,
+            "progress": progress or {},
+            "attempts": attempts or 0,
+            "error_message": error,
+        }
+    return states
+
+
+class ProgressHub:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._subscribers: dict[int, set[asyncio.Queue]] = {}
+        self._latest: dict[int, dict] = {}
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self, song_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(song_id, set()).add(queue)
+        if song_id in self._latest:
+            queue.put_nowait(self._latest[song_id])
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._poll())
+        return queue
+
+    def unsubscribe(self, song_id: int, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(song_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[song_id]
+            self._latest.pop(song_id, None)
+
+    async def _poll(self) -> None:
+        while self._subscribers:
+            try:
+                states = await _fetch_states(list(self._subscribers))
+            except Exception:
+                states = {}  # DB hiccup — keep streams open and retry next tick
+            for song_id, state in states.items():
+                if state == self._latest.get(song_id):
+                    continue
+                self._latest[song_id] = state
+                for queue in self._subscribers.get(song_id, ()):
+                    queue.put_nowait(state)
+            await asyncio.sleep(self.interval)
+
+
+hub = ProgressHub(interval=settings.PROGRESS_POLL_SECONDS)
@@ -0,0 +1,64 @@
+"""
+In-process token-bucket rate limiting, used to keep sign-in attempts (each
+one a deliberately slow bcrypt hash) from being turned into a CPU
+denial-of-service.
+
+Every key — "ip:1.2.3.4", "email:someone@example.com" — gets a bucket of
+*per_minute* tokens that refills continuously, so short bursts pass and a
+sustained flood is cut to the refill rate. Buckets live in this process
+only: with several API processes each allows its own quota, which still
+bounds the hashing every process does. The least recently used buckets are
+dropped past RATE_LIMIT_MAX_KEYS.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from ..config import settings
+
+
+class RateLimiter:
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0  # tokens per second
+        # key → (tokens, updated at), least recently used first
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _refill(self, key: str, now: float) -> float:
+        tokens, updated_at = self._buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated_at) * self.rate)
+
+    def acquire(self, key: str) -> int:
+        """
+        Spend one of *key*'s tokens if it has one and return 0; otherwise
+        spend nothing and return the seconds until it will. Taking the token
+        up front means concurrent attempts can't all pass before any is
+        counted.
+        """
+        if self.capacity <= 0:
+            return 0  # disabled
+        with self._lock:
+            now = time.monotonic()
+            tokens = self._refill(key, now)
+            if tokens < 1:
+                return math.ceil((1 - tokens) / self.rate)
+            self._buckets[key] = (tokens - 1, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > settings.RATE_LIMIT_MAX_KEYS:
+                self._buckets.popitem(last=False)
+        return 0
+
+    def refund(self, key: str) -> None:
+        """Give back a token taken by acquire() for an attempt that didn't count."""
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            if key in self._buckets:
+                now = time.monotonic()
+                self._buckets[key] = (min(self._refill(key, now) + 1, self.capacity), now)
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            self._buckets.pop(key, None)
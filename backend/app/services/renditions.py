@@ -0,0 +1,234 @@
+"""
+Web renditions of each stem, encoded once after separation.
+
+The WAV from Demucs stays as the lossless master; next to it each stem gets
+the encodings listed in STEM_RENDITIONS ("codec:kbps"), all produced by a
+single ffmpeg run that decodes the master once and writes every output:
+
+  stems/<hash>_<model>_vocals.wav          master (audio/wav)
+  stems/<hash>_<model>_vocals.96k.opus     audio/ogg; codecs=opus
+  stems/<hash>_<model>_vocals.128k.m4a     audio/mp4
+  stems/<hash>_<model>_vocals.192k.mp3     audio/mpeg
+  stems/<hash>_<model>_vocals.flac         lossless copy of the master (STEM_FLAC_VARIANTS),
+                                           not a listed rendition: static_delivery serves
+                                           it in place of the WAV to clients that accept it
+
+The names are content-addressed and shared by songs with the same audio, so
+every output is written under a run-private temporary name and renamed into
+place only once ffmpeg has succeeded.
+
+Clients pick one per request (GET /api/songs/{id}/stems/{stem_id}/audio) by
+?format=&bitrate= or by their Accept header — see choose_rendition().
+"""
+import os
+import subprocess
+from pathlib import Path
+from secrets import token_hex
+
+from ..config import settings
+from .static_delivery import flac_variant_path
+
+# codec → (ffmpeg encoder, extension, MIME type, extra output options)
+CODECS: dict[str, tuple[str, str, str, list[str]]] = {
+    "opus": ("libopus", "opus", "audio/ogg; codecs=opus", ["-vbr", "on"]),
+    "aac": ("aac", "m4a", "audio/mp4", ["-movflags", "+faststart"]),
+    "mp3": ("libmp3lame", "mp3", "audio/mpeg", []),
+}
+LOSSLESS = "wav"
+LOSSLESS_MIME = "audio/wav"
+
+# Accept-header media types → codec
+_MIME_CODECS = {
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "audio/mp4": "aac",
+    "audio/aac": "aac",
+    "audio/x-m4a": "aac",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/wav": LOSSLESS,
+    "audio/wave": LOSSLESS,
+    "audio/x-wav": LOSSLESS,
+}
+
+
+def profiles() -> list[tuple[str, int]]:
+    """(codec, kbps) pairs from STEM_RENDITIONS, skipping unknown codecs."""
+    parsed = []
+    for entry in settings.STEM_RENDITIONS:
+        codec, _, kbps = entry.partition(":")
+        if codec in CODECS and kbps.isdigit():
+            parsed.append((codec, int(kbps)))
+    return parsed
+
+
+def rendition_path(master_path: str | Path, codec: str, kbps: int) -> Path:
+    master = Path(master_path)
+    return master.with_name(f"{master.stem}.{kbps}k.{CODECS[codec][1]}")
+
+
+def _partial_path(target: Path, run: str) -> Path:
+    # Keeps the extension, which tells ffmpeg the container
+    return target.with_name(f"{target.stem}.{run}.tmp{target.suffix}")
+
+
+def encode_renditions(master_path: str | Path) -> list[dict]:
+    """
+    Encode every configured rendition of one stem (and its FLAC variant) in
+    a single ffmpeg run. Returns StemRendition column values for each
+    rendition.
+    """
+    from .stem_separator import _get_ffmpeg_exe
+
+    targets = profiles()
+    flac = settings.STEM_FLAC_VARIANTS
+    if not targets and not flac:
+        return []
+    ffmpeg = _get_ffmpeg_exe()
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg not available; cannot encode stem renditions")
+
+    run = token_hex(4)
+    cmd = [ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-y", "-i", str(master_path)]
+    outputs = []
+    # (temporary, final) for every file ffmpeg writes
+    files = []
+    for codec, kbps in targets:
+        encoder, _, mime, extra = CODECS[codec]
+        path = rendition_path(master_path, codec, kbps)
+        files.append((_partial_path(path, run), path))
+        cmd += ["-map", "0:a", "-vn", "-c:a", encoder, "-b:a", f"{kbps}k", *extra, str(files[-1][0])]
+        outputs.append((codec, kbps, mime, path))
+    if flac:
+        flac_path = flac_variant_path(master_path)
+        files.append((_partial_path(flac_path, run), flac_path))
+        cmd += ["-map", "0:a", "-vn", "-c:a", "flac", "-compression_level", "8", str(files[-1][0])]
+
+    try:
+        subprocess.run(cmd, capture_output=True, check=True)
+    except subprocess.CalledProcessError as exc:
+        # Only this run's files: the final names may be serving another song
+        for partial, _ in files:
+            partial.unlink(missing_ok=True)
+        raise RuntimeError(f"ffmpeg failed encoding {master_path}: {exc.stderr.decode(errors='replace')[-500:]}")
+    for partial, path in files:
+        os.replace(partial, path)
+
+    return [
+        {
+            "codec": codec,
+            "bitrate_kbps": kbps,
+            "mime_type": mime,
+            "file_path": str(path),
+            "size_bytes": path.stat().st_size,
+        }
+        for codec, kbps, mime, path in outputs
+    ]
+
+
+def encode_flac_variant(master_path: str | Path) -> Path:
+    """Write just the FLAC variant of a WAV master (for files from before it existed)."""
+    from .stem_separator import _get_ffmpeg_exe
+
+    ffmpeg = _get_ffmpeg_exe()
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg not available; cannot encode FLAC variants")
+    target = flac_variant_path(master_path)
+    # Written under a temporary name: a half-written variant must never be served
+    tmp = _partial_path(target, token_hex(4))
+    cmd = [
+        ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-y", "-i", str(master_path),
+        "-map", "0:a", "-vn", "-c:a", "flac", "-compression_level", "8", str(tmp),
+    ]
+    try:
+        subprocess.run(cmd, capture_output=True, check=True)
+    except subprocess.CalledProcessError as exc:
+        tmp.unlink(missing_ok=True)
+        raise RuntimeError(f"ffmpeg failed encoding {master_path}: {exc.stderr.decode(errors='replace')[-500:]}")
+    tmp.replace(target)
+    return target
+
+
+def encode_stems(stems: dict[str, dict], progress=None) -> dict[str, dict]:
+    """
+    Add a "renditions" list to each analysed stem (see audio_analysis.analyze_stems).
+    Silent stems that won't be listed aren't worth encoding.
+    """
+    for index, columns in enumerate(stems.values()):
+        if columns.get("is_silent") and settings.SILENT_STEMS != "keep":
+            columns["renditions"] = []
+        else:
+            columns["renditions"] = encode_renditions(columns["file_path"])
+        if progress is not None:
+            progress("encode", (index + 1) / len(stems))
+    return stems
+
+
+# ── Negotiation ───────────────────────────────────────────────────────────────
+
+def _parse_accept(header: str) -> list[tuple[str, float]]:
+    """Media types from an Accept header, highest q first (stable for ties)."""
+    ranges = []
+    for part in header.split(","):
+        fields = [f.strip() for f in part.split(";")]
+        if not fields[0]:
+            continue
+        q = 1.0
+        for param in fields[1:]:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        ranges.append((fields[0].lower(), q))
+    return sorted((r for r in ranges if r[1] > 0), key=lambda r: -r[1])
+
+
+def _pick_bitrate(candidates: list, max_kbps: int | None):
+    """Highest bitrate not above *max_kbps* (or the lowest one if all are)."""
+    candidates = sorted(candidates, key=lambda r: r.bitrate_kbps, reverse=True)
+    if max_kbps is None:
+        return candidates[0]
+    for rendition in candidates:
+        if rendition.bitrate_kbps <= max_kbps:
+            return rendition
+    return candidates[-1]
+
+
+def choose_rendition(renditions: list, fmt: str | None, max_kbps: int | None, accept: str | None):
+    """
+    Pick a StemRendition from *renditions*, or LOSSLESS for the master, or
+    None when nothing acceptable exists.
+
+    An explicit ?format= wins; otherwise the Accept header is walked in q
+    order. Wildcards (audio/*, */*) and a missing header get the first
+    codec in STEM_RENDITIONS that was encoded, falling back to the master.
+    """
+    by_codec: dict[str, list] = {}
+    for rendition in renditions:
+        by_codec.setdefault(rendition.codec, []).append(rendition)
+
+    def pick(codec: str):
+        if codec == LOSSLESS:
+            return LOSSLESS
+        if codec in by_codec:
+            return _pick_bitrate(by_codec[codec], max_kbps)
+        return None
+
+    if fmt:
+        return pick(fmt.lower())
+
+    preferred = [codec for codec, _ in profiles() if codec in by_codec]
+    default = pick(preferred[0]) if preferred else LOSSLESS
+    if not accept:
+        return default
+
+    for media_type, _ in _parse_accept(accept):
+        if media_type in ("*/*", "audio/*"):
+            return default
+        codec = _MIME_CODECS.get(media_type)
+        choice = pick(codec) if codec else None
+        if choice is not None:
+            return choice
+    return None
@@ -0,0 +1,82 @@
+"""
+Fixed-duration, time-aligned segments of every stem, for progressive
+playback (GET /api/songs/{id}/manifest).
+
+A player that downloads six whole stems before it starts waits for all of
+them on a slow link. Instead each stem is also cut into
+STEM_SEGMENT_SECONDS pieces at the same frame boundaries — segment i of
+every stem covers frames [i·N, (i+1)·N) with N = STEM_SEGMENT_SECONDS ×
+sample rate — so a client can fetch segment 0 of all stems, start playing
+and stream the rest ahead of the playhead.
+
+Segments are FLAC: lossless like the master, about half its size, and each
+one decodes on its own to exactly N frames (the last one: the remainder).
+Unlike MP3/AAC/Opus there is no encoder priming or padding, so scheduling
+decoded segments back to back is gapless and sample-accurate.
+
+  stems/<hash>_vocals.wav
+  stems/segments/<hash>_vocals.00000.flac
+  stems/segments/<hash>_vocals.00001.flac …
+
+Names derive from the master's, so segments are content-addressed like it.
+With STEM_PACKS on, the files only live until the song's pack is written
+(services/stem_pack.py), which then holds the only copy.
+"""
+import math
+from pathlib import Path
+from secrets import token_hex
+
+import soundfile as sf
+
+from ..config import settings
+
+SEGMENT_MIME = "audio/flac"
+# FLAC stores integer PCM; anything else (float masters) is written as 24-bit
+_FLAC_SUBTYPES = {"PCM_S8", "PCM_16", "PCM_24"}
+
+
+def segment_path(master_path: str | Path, index: int) -> Path:
+    master = Path(master_path)
+    return master.parent / "segments" / f"{master.stem}.{index:05d}.flac"
+
+
+def segment_paths(master_path: str | Path, count: int | None) -> list[Path]:
+    return [segment_path(master_path, index) for index in range(count or 0)]
+
+
+def package_stem(master_path: str | Path, seconds: float) -> dict:
+    """Write one stem's segments; returns its segment_* Stem column values."""
+    with sf.SoundFile(str(master_path)) as src:
+        sample_rate = src.samplerate
+        frames_per_segment = max(1, round(seconds * sample_rate))
+        count = max(1, math.ceil(src.frames / frames_per_segment))
+        subtype = src.subtype if src.subtype in _FLAC_SUBTYPES else "PCM_24"
+        segment_path(master_path, 0).parent.mkdir(parents=True, exist_ok=True)
+
+        for index in range(count):
+            block = src.read(frames_per_segment, dtype="int32", always_2d=True)
+            target = segment_path(master_path, index)
+            # A half-written segment must never be served, and a concurrent
+            # run of the same audio writes its own temporary file
+            tmp = target.with_name(f"{target.stem}.{token_hex(4)}.tmp.flac")
+            sf.write(str(tmp), block, sample_rate, format="FLAC", subtype=subtype)
+            tmp.replace(target)
+
+    return {"segment_seconds": frames_per_segment / sample_rate, "segment_count": count}
+
+
+def package_stems(stems: dict[str, dict], progress=None) -> dict[str, dict]:
+    """
+    Add segment_seconds / segment_count to each analysed stem (see
+    audio_analysis.analyze_stems), writing its segments. Silent stems that
+    won't be listed aren't worth packaging; STEM_SEGMENT_SECONDS = 0 turns
+    packaging off.
+    """
+    seconds = settings.STEM_SEGMENT_SECONDS
+    for index, columns in enumerate(stems.values()):
+        hidden = columns.get("is_silent") and settings.SILENT_STEMS != "keep"
+        if seconds > 0 and not hidden:
+            columns.update(package_stem(columns["file_path"], seconds))
+        if progress is not None:
+            progress("package", (index + 1) / len(stems))
+    return stems
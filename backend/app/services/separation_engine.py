@@ -0,0 +1,119 @@
+"""
+Long-lived, in-process Demucs engine.
+
+Loading a Demucs model means importing torch and reading ~100 MB of weights
+from disk. Running `python -m demucs` per song paid that on every job (twice
+when the 6-stem model failed and we fell back). The engine keeps loaded
+models in an LRU bounded by SEPARATION_MODEL_CACHE_MB, so a worker or seeding
+run pays the load once per model and then only separates tensors.
+
+torch and demucs are imported lazily — the API process never needs them.
+"""
+import threading
+from collections import OrderedDict
+
+from ..config import settings
+
+
+class SeparationEngine:
+    def __init__(self, cache_budget_mb: int, device: str = "auto"):
+        self._budget_bytes = cache_budget_mb * 1_048_576
+        self._device = device
+        self._models: OrderedDict[str, tuple[object, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: dict[str, threading.Lock] = {}
+
+    @property
+    def device(self) -> str:
+        if self._device == "auto":
+            import torch
+            self._device = "cuda" if torch.cuda.is_available() else "cpu"
+        return self._device
+
+    def get_model(self, name: str):
+        """Return the loaded model *name*, loading it on first use."""
+        with self._lock:
+            if name in self._models:
+                self._models.move_to_end(name)
+                return self._models[name][0]
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # Concurrent jobs asking for the same model wait for one load
+        with load_lock:
+            with self._lock:
+                if name in self._models:
+                    self._models.move_to_end(name)
+                    return self._models[name][0]
+
+            from demucs.pretrained import get_model
+
+            model = get_model(name)
+            model.to(self.device)
+            model.eval()
+            size = model_bytes(model)
+
+            with self._lock:
+                self._models[name] = (model, size)
+                self._evict(keep=name)
+            return model
+
+    def separate(self, name: str, wav, samplerate: int):
+        """
+        Separate *wav* — a (channels, frames) float tensor at *samplerate* —
+        with model *name*.
+
+        Returns (model_samplerate, {source_name: (channels, frames) tensor}).
+        """
+        import torch
+        from demucs.apply import apply_model
+        from demucs.audio import convert_audio
+
+        model = self.get_model(name)
+        wav = convert_audio(wav, samplerate, model.samplerate, model.audio_channels)
+
+        # Same normalisation the demucs CLI applies around apply_model
+        ref = wav.mean(0)
+        mean, std = ref.mean(), ref.std() + 1e-8
+        wav = (wav - mean) / std
+
+        with torch.no_grad():
+            sources = apply_model(
+                model, wav[None], device=self.device,
+                shifts=1, split=True, overlap=0.25, progress=False,
+            )[0]
+        sources = sources * std + mean
+
+        return model.samplerate, dict(zip(model.sources, sources.cpu()))
+
+    def _evict(self, keep: str) -> None:
+        """Drop least-recently-used models until the cache fits its budget."""
+        total = sum(size for _, size in self._models.values())
+        for name in list(self._models):
+            if total <= self._budget_bytes:
+                break
+            if name == keep:
+                continue
+            total -= self._models.pop(name)[1]
+
+
+def model_bytes(model) -> int:
+    """Memory held by a model's parameters and buffers."""
+    return sum(p.numel() * p.element_size() for p in model.parameters()) + sum(
+        b.numel() * b.element_size() for b in model.buffers()
+    )
+
+
+_engine: SeparationEngine | None = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> SeparationEngine:
+    """Process-wide engine shared by worker threads and seeding."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = SeparationEngine(
+                cache_budget_mb=settings.SEPARATION_MODEL_CACHE_MB,
+                device=settings.SEPARATION_DEVICE,
+            )
+        return _engine
@@ -0,0 +1,162 @@
+"""
+CDN-like delivery of UPLOAD_DIR for local and self-hosted deployments
+(the /uploads mount, /api/files and stem peaks).
+
+Files can have precomputed variants next to them, written once by the
+worker (or precompress_uploads.py for older files):
+
+  stems/<hash>_vocals.wav         master, 16-bit PCM
+  stems/<hash>_vocals.flac        the same PCM losslessly compressed (~half
+                                  the bytes), served instead of the WAV to
+                                  clients whose Accept names audio/flac
+  stems/<hash>_vocals.peaks.br    \\ Content-Encoding variants, by
+  stems/<hash>_vocals.peaks.gz    / Accept-Encoding
+
+A variant is its own representation: its own ETag and Content-Length, and
+Range requests address its bytes — the same as a CDN serving a
+precompressed object. Responses carry Vary so shared caches keep them
+apart, and hashed names get the immutable policy from file_delivery.
+"""
+import gzip
+from pathlib import Path
+
+from fastapi import HTTPException
+from starlette._utils import get_route_path
+from starlette.datastructures import Headers
+from starlette.types import Receive, Scope, Send
+
+from .catalog_cache import choose_encoding
+from .file_delivery import FileDelivery, stat_cache
+
+try:
+    import brotli
+except ImportError:  # optional — gzip variants still work
+    brotli = None
+
+FLAC_MIME = "audio/flac"
+_FLAC_ACCEPT = {"audio/flac", "audio/x-flac"}
+# Sidecars worth a Content-Encoding variant (audio is already compressed or
+# has its FLAC variant)
+PRECOMPRESSED_SUFFIXES = {".peaks", ".json"}
+_ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+# ── Variants on disk ──────────────────────────────────────────────────────────
+
+def flac_variant_path(path: str | Path) -> Path:
+    return Path(path).with_suffix(".flac")
+
+
+def encoded_variant_path(path: str | Path, coding: str) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + _ENCODING_SUFFIXES[coding])
+
+
+def variant_paths(path: str | Path) -> list[Path]:
+    """Every variant *path* may have, for cleanup (they may not all exist)."""
+    path = Path(path)
+    paths = [encoded_variant_path(path, coding) for coding in _ENCODING_SUFFIXES]
+    if path.suffix == ".wav":
+        paths.append(flac_variant_path(path))
+    return paths
+
+
+def precompress(path: str | Path) -> list[Path]:
+    """
+    Write the gzip (and, with the brotli package, brotli) variants of a
+    sidecar file. A variant that isn't smaller than the file is skipped.
+    """
+    path = Path(path)
+    if path.suffix not in PRECOMPRESSED_SUFFIXES:
+        return []
+    data = path.read_bytes()
+    encoded = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded["br"] = brotli.compress(data, quality=11)
+
+    written = []
+    for coding, body in encoded.items():
+        target = encoded_variant_path(path, coding)
+        if len(body) < len(data):
+            tmp = target.with_name(target.name + ".tmp")
+            tmp.write_bytes(body)
+            tmp.replace(target)
+            written.append(target)
+    return written
+
+
+# ── Negotiation ───────────────────────────────────────────────────────────────
+
+def accepts_flac(accept: str | None) -> bool:
+    """Only an explicit audio/flac counts — */* clients may expect the WAV bytes."""
+    for part in (accept or "").split(","):
+        media_type, *params = [field.strip() for field in part.split(";")]
+        if media_type.lower() not in _FLAC_ACCEPT:
+            continue
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+async def deliver_best(
+    path: str | Path,
+    request_headers: Headers,
+    base: Path | None = None,
+    media_type: str | None = None,
+    cache_control: str | None = None,
+) -> FileDelivery:
+    """
+    The response for *path*, or for its best variant the client accepts.
+    403/404 for the file itself as HTTPException; a missing variant just
+    means the file is served as-is.
+    """
+    info = await stat_cache.lookup(path, base)
+    headers = {}
+    suffix = Path(info.path).suffix
+
+    if suffix == ".wav":
+        headers["vary"] = "Accept"
+        if accepts_flac(request_headers.get("accept")):
+            flac = await stat_cache.find(flac_variant_path(info.path))
+            if flac is not None:
+                return FileDelivery(flac, FLAC_MIME, headers, cache_control)
+
+    elif suffix in PRECOMPRESSED_SUFFIXES:
+        headers["vary"] = "Accept-Encoding"
+        available = {}
+        for coding in _ENCODING_SUFFIXES:
+            variant = await stat_cache.find(encoded_variant_path(info.path, coding))
+            if variant is not None:
+                available[coding] = variant
+        coding = choose_encoding(request_headers.get("accept-encoding"), available)
+        if coding != "identity":
+            headers["content-encoding"] = coding
+            # Content-Type stays the original's; Content-Encoding says how it's packed
+            return FileDelivery(available[coding], media_type or info.media_type, headers, cache_control)
+
+    return FileDelivery(info, media_type, headers, cache_control)
+
+
+# ── /uploads ──────────────────────────────────────────────────────────────────
+
+class StaticUploads:
+    """ASGI app serving *directory* through deliver_best() — replaces StaticFiles."""
+
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        assert scope["type"] == "http"
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405, headers={"Allow": "GET, HEAD"})
+        relative = get_route_path(scope).lstrip("/")
+        if not relative:
+            raise HTTPException(status_code=404, detail="File not found")
+        response = await deliver_best(relative, Headers(scope=scope), base=self.directory)
+        await response(scope, receive, send)
@@ -0,0 +1,126 @@
+"""
+Content-addressed reuse of uploads and stems.
+
+Originals are stored as originals/<sha256><ext> and stems as
+stems/<sha256>_<model>_<stem>.wav (plus its .peaks sidecar, web renditions
+and segments, and the song's stem pack), so identical audio maps to
+identical files.
+A new song whose audio hash was already separated gets Stem rows pointing at
+the existing files instead of a new Demucs run (the cache key is
+(content hash, model) — see Stem.model_name). Files are shared, so they're
+reference-counted by the rows that point at them and only unlinked when the
+last song using them is deleted.
+"""
+from pathlib import Path
+
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models import Song, Stem, StemRendition
+from . import segments, static_delivery, stem_pack
+
+# Everything about a stem that depends only on its audio, copied on a cache hit
+_STEM_FILE_COLUMNS = (
+    "file_path", "checksum", "duration", "sample_rate", "peak_db", "rms_db", "lufs",
+    "is_silent", "peaks_path", "segment_seconds", "segment_count",
+)
+_RENDITION_COLUMNS = ("codec", "bitrate_kbps", "mime_type", "file_path", "size_bytes")
+
+
+def new_stem(song_id: int, stem_type: str, model: str, columns: dict) -> Stem:
+    """
+    Stem row (with its renditions) from the column values produced by
+    audio_analysis.analyze_stems / renditions.encode_stems.
+    """
+    columns = dict(columns)
+    renditions = [StemRendition(**values) for values in columns.pop("renditions", [])]
+    return Stem(
+        song_id=song_id, stem_type=stem_type, model_name=model, renditions=renditions, **columns
+    )
+
+
+def _stem_files(stem: Stem) -> list[str]:
+    """Files on disk that belong to *stem*."""
+    paths = [stem.file_path, stem.peaks_path] + [r.file_path for r in stem.renditions]
+    paths = [path for path in paths if path]
+    paths += [str(variant) for path in paths for variant in static_delivery.variant_paths(path)]
+    return paths + [str(path) for path in segments.segment_paths(stem.file_path, stem.segment_count)]
+
+
+def find_cached_stems(db: Session, content_hash: str) -> tuple[str, dict[str, Stem]] | None:
+    """
+    Return (model_name, {stem_type: Stem}) from an earlier separation of the
+    same audio, preferring models in SEPARATION_MODELS order, or None.
+    """
+    rows = (
+        db.query(Stem)
+        .join(Song, Song.id == Stem.song_id)
+        .filter(
+            Song.content_hash == content_hash,
+            Song.status == "complete",
+            Stem.model_name.in_(settings.SEPARATION_MODELS),
+        )
+        .all()
+    )
+    for model in settings.SEPARATION_MODELS:
+        stems = {stem.stem_type: stem for stem in rows if stem.model_name == model}
+        if stems and all(Path(stem.file_path).exists() for stem in stems.values()):
+            return model, stems
+    return None
+
+
+def attach_cached_stems(db: Session, song: Song) -> bool:
+    """
+    Give *song* the stems of an earlier separation of the same audio and mark
+    it complete. Returns False (changing nothing) on a cache miss.
+    The caller commits.
+    """
+    if not song.content_hash:
+        return False
+    cached = find_cached_stems(db, song.content_hash)
+    if cached is None:
+        return False
+
+    model, stems = cached
+    for stale in db.query(Stem).filter(Stem.song_id == song.id).all():
+        db.delete(stale)
+    db.flush()  # deletes before inserts: (song_id, stem_type) is unique
+    for stem_type, cached_stem in stems.items():
+        columns = {name: getattr(cached_stem, name) for name in _STEM_FILE_COLUMNS}
+        columns["renditions"] = [
+            {name: getattr(rendition, name) for name in _RENDITION_COLUMNS}
+            for rendition in cached_stem.renditions
+        ]
+        db.add(new_stem(song.id, stem_type, model, columns))
+    song.status = "complete"
+    song.error_message = None
+    return True
+
+
+def release_song_files(db: Session, song: Song) -> None:
+    """Unlink *song*'s original and stems unless another song still uses them."""
+    if song.original_path:
+        shared = (
+            db.query(Song.id)
+            .filter(Song.original_path == song.original_path, Song.id != song.id)
+            .first()
+        )
+        if not shared:
+            Path(song.original_path).unlink(missing_ok=True)
+
+    # One query for every stem file still referenced by another song
+    paths = [stem.file_path for stem in song.stems]
+    shared = {
+        path
+        for (path,) in db.query(Stem.file_path)
+        .filter(Stem.file_path.in_(paths), Stem.song_id != song.id)
+        .distinct()
+    } if paths else set()
+    for stem in song.stems:
+        if stem.file_path not in shared:
+            for path in _stem_files(stem):
+                Path(path).unlink(missing_ok=True)
+    # A pack belongs to exactly this set of stems, so it's shared with them
+    pack = stem_pack.song_pack_path(song.stems)
+    if pack is not None and not shared:
+        pack.unlink(missing_ok=True)
@@ -0,0 +1,278 @@
+"""
+One chunk-indexed container per song holding every stem (GET
+/api/songs/{id}/pack), so a player opens one file instead of one per stem.
+
+The container is built from the stems' time-aligned FLAC segments
+(services/segments.py) — no second encode, and sample alignment comes for
+free. Chunk i of every stem is stored back to back, so any time range of
+the whole song is one contiguous run of bytes, and an offset index up
+front lets the server (or a client with Range requests) pull any subset of
+stems without reading the rest.
+
+Format (little-endian):
+  header   4s magic "PRSM", u16 version, u16 stem count, u32 sample rate,
+           u64 frames, u32 frames per chunk, u32 first chunk, u32 chunk count
+  stems    per stem: 16s stem type, NUL-padded
+  index    per chunk, per stem: u64 offset, u32 length (0 = no audio there)
+  data     per chunk, per stem: one FLAC stream of that chunk's frames
+
+Chunk i covers frames [(first + i)·N, (first + i + 1)·N) of the song; the
+whole file has first = 0, a slice the index of its first chunk.
+
+Packs are named after the sha256 of their stems' checksums, so they are
+content-addressed like the stems and shared by songs that share them.
+
+Once a pack is written its segment files are deleted: the audio is stored
+once, and GET /api/songs/{id}/stems/{stem_id}/segments/{i} is served as the
+byte range of chunk i (deliver_segment).
+"""
+import hashlib
+import os
+import shutil
+import struct
+from dataclasses import dataclass, replace
+from pathlib import Path
+from secrets import token_hex
+
+import soundfile as sf
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from ..config import settings
+from .file_delivery import FileInfo, not_modified, send_file, stat_cache
+from .segments import SEGMENT_MIME, segment_paths
+
+PACK_MAGIC = b"PRSM"
+PACK_VERSION = 1
+PACK_MIME = "application/vnd.prism.stem-pack"
+_HEADER = struct.Struct("<4sHHIQIII")
+_STEM = struct.Struct("<16s")
+_ENTRY = struct.Struct("<QI")
+
+
+# ── Writing ───────────────────────────────────────────────────────────────────
+
+def pack_path(stems_dir: str | Path, checksums: dict[str, str]) -> Path:
+    """Where the pack of stems with these {stem_type: checksum} lives."""
+    key = "\n".join(f"{stem_type}:{checksum}" for stem_type, checksum in sorted(checksums.items()))
+    return Path(stems_dir) / "packs" / f"{hashlib.sha256(key.encode()).hexdigest()}.prsm"
+
+
+def song_pack_path(stems) -> Path | None:
+    """pack_path() for a song's Stem rows — only stems with segments are packed."""
+    packed = [stem for stem in stems if stem.segment_count and stem.checksum]
+    if not packed:
+        return None
+    return pack_path(Path(packed[0].file_path).parent, {s.stem_type: s.checksum for s in packed})
+
+
+def write_pack(stems: dict[str, dict]) -> Path | None:
+    """
+    Write the pack of segmented stems (column values after
+    segments.package_stems) and delete the segments it now holds. None if
+    there is nothing to pack or STEM_PACKS is off.
+    """
+    stems = {t: columns for t, columns in stems.items() if columns.get("segment_count")}
+    if not settings.STEM_PACKS or not stems:
+        return None
+
+    first = next(iter(stems.values()))
+    sample_rate = first["sample_rate"]
+    chunk_frames = round(first["segment_seconds"] * sample_rate)
+    chunks = {t: segment_paths(c["file_path"], c["segment_count"]) for t, c in stems.items()}
+    chunk_count = max(len(paths) for paths in chunks.values())
+    frames = max(
+        sf.info(str(paths[-1])).frames + (len(paths) - 1) * chunk_frames for paths in chunks.values()
+    )
+
+    target = pack_path(Path(first["file_path"]).parent, {t: c["checksum"] for t, c in stems.items()})
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # Chunk-major: chunk 0 of every stem, then chunk 1 …
+    order = [paths[i] if i < len(paths) else None for i in range(chunk_count) for paths in chunks.values()]
+    offset = _HEADER.size + _STEM.size * len(stems) + _ENTRY.size * len(order)
+    index = []
+    for segment in order:
+        length = segment.stat().st_size if segment is not None else 0
+        index.append(_ENTRY.pack(offset if length else 0, length))
+        offset += length
+
+    header = _HEADER.pack(
+        PACK_MAGIC, PACK_VERSION, len(stems), sample_rate, frames, chunk_frames, 0, chunk_count
+    )
+    # A half-written pack must never be served; concurrent writers don't share a temp file
+    tmp = target.with_name(f"{target.name}.{token_hex(4)}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(b"".join(_STEM.pack(t.encode()) for t in stems))
+        f.write(b"".join(index))
+        for segment in order:
+            if segment is not None:
+                with open(segment, "rb") as src:
+                    shutil.copyfileobj(src, f)
+    tmp.replace(target)
+    for segment in order:
+        if segment is not None:
+            segment.unlink(missing_ok=True)
+    return target
+
+
+# ── Slicing ───────────────────────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class PackIndex:
+    sample_rate: int
+    frames: int
+    chunk_frames: int
+    stem_types: list[str]
+    # entries[chunk][stem] = (offset, length)
+    entries: list[list[tuple[int, int]]]
+
+
+def read_index(path: str) -> PackIndex:
+    """Header, stem table and index of a pack — two positioned reads."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        magic, version, stem_count, sample_rate, frames, chunk_frames, _, chunk_count = _HEADER.unpack(
+            os.pread(fd, _HEADER.size, 0)
+        )
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            raise ValueError(f"{path} is not a version {PACK_VERSION} stem pack")
+        table = os.pread(fd, (_STEM.size + _ENTRY.size * chunk_count) * stem_count, _HEADER.size)
+    finally:
+        os.close(fd)
+
+    stem_types = [
+        _STEM.unpack_from(table, i * _STEM.size)[0].rstrip(b"\0").decode() for i in range(stem_count)
+    ]
+    base = _STEM.size * stem_count
+    entries = [
+        [_ENTRY.unpack_from(table, base + (c * stem_count + s) * _ENTRY.size) for s in range(stem_count)]
+        for c in range(chunk_count)
+    ]
+    return PackIndex(sample_rate, frames, chunk_frames, stem_types, entries)
+
+
+def slice_pack(
+    index: PackIndex, stem_types: list[str], start: float, end: float | None
+) -> tuple[bytes, list[tuple[int, int]]]:
+    """
+    A pack of just *stem_types* (in pack order) and the chunks overlapping
+    [start, end) seconds: (header + stem table + index, byte ranges of the
+    source pack that follow it). Adjacent ranges are merged, so a slice with
+    every stem is a single read.
+    """
+    columns = [i for i, stem_type in enumerate(index.stem_types) if stem_type in stem_types]
+    first = int(start * index.sample_rate) // index.chunk_frames
+    stop = len(index.entries)
+    if end is not None:
+        stop = min(stop, -(-int(end * index.sample_rate) // index.chunk_frames))
+    chunks = index.entries[first:stop]
+
+    offset = _HEADER.size + (_STEM.size + _ENTRY.size * len(chunks)) * len(columns)
+    entries, ranges = [], []
+    for chunk in chunks:
+        for column in columns:
+            source, length = chunk[column]
+            entries.append(_ENTRY.pack(offset if length else 0, length))
+            offset += length
+            if not length:
+                continue
+            if ranges and ranges[-1][0] + ranges[-1][1] == source:
+                ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+            else:
+                ranges.append((source, length))
+
+    head = _HEADER.pack(
+        PACK_MAGIC, PACK_VERSION, len(columns), index.sample_rate, index.frames,
+        index.chunk_frames, first, len(chunks),
+    )
+    head += b"".join(_STEM.pack(index.stem_types[c].encode()) for c in columns)
+    return head + b"".join(entries), ranges
+
+
+class PackSlice(Response):
+    """A slice_pack() result: the new head, then the source's byte ranges."""
+
+    def __init__(
+        self, info: FileInfo, head: bytes, ranges: list[tuple[int, int]], cache_control: str, etag: str,
+        media_type: str = PACK_MIME,
+    ):
+        self.info = replace(info, etag=etag)
+        self.head = head
+        self.ranges = ranges
+        self.background = None
+        self.response_headers = {
+            "content-type": media_type,
+            "content-length": str(len(head) + sum(length for _, length in ranges)),
+            "etag": etag,
+            "last-modified": info.last_modified,
+            "cache-control": cache_control,
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not_modified(Headers(scope=scope), self.info):
+            headers = {k: v for k, v in self.response_headers.items() if not k.startswith("content-")}
+            await self._start(send, 304, headers)
+        elif scope["method"] == "HEAD":
+            await self._start(send, 200, self.response_headers)
+        else:
+            try:
+                file = open(self.info.path, "rb", buffering=0)
+            except OSError:
+                # Deleted since it was stat'ed
+                stat_cache.evict(self.info.path)
+                raise HTTPException(status_code=404, detail="File not found")
+            with file:
+                await self._start(send, 200, self.response_headers)
+                if self.head:
+                    await send({"type": "http.response.body", "body": self.head, "more_body": True})
+                for offset, length in self.ranges:
+                    await send_file(scope, send, file, offset, length)
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _start(self, send: Send, status: int, headers: dict[str, str]) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()],
+        })
+
+
+async def deliver_slice(
+    path: str | Path, stem_types: list[str] | None, start: float, end: float | None, cache_control: str
+) -> PackSlice:
+    """
+    Slice of the pack at *path* — 400 for a stem it doesn't hold, 416 for a
+    time range outside the song, 404 if the pack is missing.
+    """
+    info = await stat_cache.lookup(path)
+    index = await run_in_threadpool(read_index, info.path)
+    wanted = stem_types or index.stem_types
+    missing = [stem_type for stem_type in wanted if stem_type not in index.stem_types]
+    if missing:
+        raise HTTPException(status_code=400, detail={"available": index.stem_types})
+    if start * index.sample_rate >= index.frames or (end is not None and end <= start):
+        raise HTTPException(status_code=416, detail="Time range outside the song")
+
+    head, ranges = slice_pack(index, wanted, start, end)
+    # Same source bytes and same selection → same slice
+    selection = hashlib.sha256(head).hexdigest()[:16]
+    return PackSlice(info, head, ranges, cache_control, f'"{info.etag[1:-1]}-{selection}"')
+
+
+async def deliver_segment(path: str | Path, stem_type: str, index: int, cache_control: str) -> PackSlice:
+    """Chunk *index* of *stem_type* from the pack at *path* — one FLAC segment; 404 if it has none."""
+    info = await stat_cache.lookup(path)
+    pack_index = await run_in_threadpool(read_index, info.path)
+    if stem_type not in pack_index.stem_types or not 0 <= index < len(pack_index.entries):
+        raise HTTPException(status_code=404, detail="Segment not found")
+    offset, length = pack_index.entries[index][pack_index.stem_types.index(stem_type)]
+    if not length:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    return PackSlice(
+        info, b"", [(offset, length)], cache_control, f'"{info.etag[1:-1]}-{stem_type}-{index}"',
+        media_type=SEGMENT_MIME,
+    )
@@ -1,28 +1,49 @@
 """
-Stem separation using Meta's Demucs.
+Stem separation using Meta's Demucs, run in-process (see separation_engine).
 
-Models used (in priority order):
+Models used (in priority order, settings.SEPARATION_MODELS):
   1. htdemucs_6s  → 6 stems: vocals, drums, bass, guitar, piano, other
   2. htdemucs     → 4 stems: vocals, drums, bass, other   (fallback)
 
-MP3 handling on Windows:
+Decoding:
   torchaudio 2.5.x on Windows cannot load MP3 natively (soundfile only
   supports WAV/FLAC; torchaudio's ffmpeg integration needs shared libs that
   are not trivially available on Windows).
 
-  Fix: if the input is an MP3 (or any non-WAV), we convert it to WAV first
-  using the ffmpeg binary bundled by imageio-ffmpeg, then hand the WAV to
-  demucs. soundfile can always read WAV, so no system ffmpeg is needed.
+  Instead, the ffmpeg binary bundled by imageio-ffmpeg decodes every input
+  to raw float32 PCM on a pipe, resampled to the model's rate. The separator
+  reads that pipe segment by segment, so no intermediate WAV is written and
+  no system ffmpeg is needed. Without imageio-ffmpeg, WAV/FLAC/OGG inputs
+  already at 44.1 kHz stereo are read with soundfile instead.
 """
 import os
+import re
 import subprocess
-import shutil
-import sys
-import tempfile
+import threading
 from pathlib import Path
+from secrets import token_hex
+from typing import Callable
+
+import numpy as np
+
+from ..config import settings
+from .separation_engine import get_engine, model_bytes
 
 KNOWN_STEMS = {"vocals", "drums", "bass", "guitar", "piano", "other"}
 
+# progress(stage, fraction) — stage is "decode" or "separate", fraction 0..1
+ProgressFn = Callable[[str, float], None]
+
+# Streaming separation: segments overlap by this much and are linearly
+# crossfaded, which hides the edge effects of separating each one on its own.
+_CROSSFADE_SECONDS = 1.0
+_MIN_SEGMENT_SECONDS = 10.0
+# Even when memory would allow more, cap segments so progress is reported
+# at least once per minute of audio
+_MAX_SEGMENT_SECONDS = 60.0
+# Activations inside apply_model (it processes ~8 s windows internally)
+_INFERENCE_OVERHEAD_MB = 512
+
 
 def _get_ffmpeg_exe() -> str | None:
     """Return the path to the imageio-ffmpeg binary, or None if unavailable."""
@@ -33,121 +54,289 @@ def _get_ffmpeg_exe() -> str | None:
         return None
 
 
-def _to_wav(input_path: Path, tmp_dir: Path) -> Path:
+class _FfmpegDecoder:
     """
-    Convert *input_path* to a 44100 Hz stereo WAV using imageio-ffmpeg.
-    Returns the path to the converted WAV file.
-    Raises RuntimeError on failure.
+    Decode any input to float32 PCM at *samplerate* / *channels* through an
+    ffmpeg pipe, so nothing is written to disk before separation.
     """
-    ffmpeg = _get_ffmpeg_exe()
-    if not ffmpeg:
-        raise RuntimeError(
-            "imageio-ffmpeg not available. "
-            "Install it with: pip install imageio-ffmpeg"
+
+    def __init__(self, ffmpeg: str, input_path: Path, samplerate: int, channels: int):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.frames_read = 0
+        duration = _probe_duration(ffmpeg, input_path)
+        self.total_frames = int(duration * samplerate) if duration else None
+        self._frame_bytes = 4 * channels
+        self._proc = subprocess.Popen(
+            [
+                ffmpeg,
+                "-nostdin",
+                "-v", "error",
+                "-i", str(input_path),
+                "-ar", str(samplerate),  # resample to the model's rate
+                "-ac", str(channels),
+                "-f", "f32le",           # raw little-endian float32 frames
+                "pipe:1",
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        # Drain stderr on the side so a chatty decode can't fill the pipe
+        # and stall ffmpeg while we're blocked reading stdout
+        self._stderr: list[bytes] = []
+        self._stderr_thread = threading.Thread(
+            target=lambda: self._stderr.extend(self._proc.stderr), daemon=True
         )
+        self._stderr_thread.start()
+
+    def read(self, frames: int) -> np.ndarray:
+        """Return up to *frames* frames as a (frames, channels) array."""
+        data = self._proc.stdout.read(frames * self._frame_bytes)
+        if len(data) < frames * self._frame_bytes:
+            self._check_exit()
+        usable = len(data) - len(data) % self._frame_bytes
+        self.frames_read += usable // self._frame_bytes
+        return np.frombuffer(data[:usable], dtype="<f4").reshape(-1, self.channels)
+
+    def _check_exit(self) -> None:
+        returncode = self._proc.wait()
+        self._stderr_thread.join()
+        if returncode != 0:
+            stderr = b"".join(self._stderr).decode("utf-8", errors="replace")
+            raise RuntimeError(f"ffmpeg decode failed:\n{stderr}")
+
+    def close(self) -> None:
+        if self._proc.poll() is None:
+            self._proc.kill()
+        self._proc.wait()
+        self._proc.stdout.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class _SoundfileDecoder:
+    """Fallback when ffmpeg is unavailable: stream WAV/FLAC/OGG via soundfile."""
 
-    wav_path = tmp_dir / f"{input_path.stem}_converted.wav"
+    def __init__(self, input_path: Path, samplerate: int, channels: int):
+        import soundfile as sf
+
+        try:
+            self._file = sf.SoundFile(str(input_path))
+        except Exception as exc:
+            raise RuntimeError(
+                f"Cannot decode {input_path.name} without ffmpeg. "
+                "Install it with: pip install imageio-ffmpeg"
+            ) from exc
+        if self._file.samplerate != samplerate or self._file.channels != channels:
+            self._file.close()
+            raise RuntimeError(
+                f"{input_path.name} needs resampling to {samplerate} Hz / "
+                f"{channels} ch, which requires imageio-ffmpeg"
+            )
+        self.samplerate = samplerate
+        self.channels = channels
+        self.frames_read = 0
+        self.total_frames = self._file.frames
+
+    def read(self, frames: int) -> np.ndarray:
+        block = self._file.read(frames, dtype="float32", always_2d=True)
+        self.frames_read += len(block)
+        return block
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _probe_duration(ffmpeg: str, input_path: Path) -> float | None:
+    """Duration in seconds from ffmpeg's input banner, for progress reporting."""
     result = subprocess.run(
-        [
-            ffmpeg,
-            "-y",                    # overwrite without asking
-            "-i", str(input_path),
-            "-ar", "44100",          # resample to 44.1 kHz
-            "-ac", "2",              # stereo
-            "-f", "wav",
-            str(wav_path),
-        ],
+        [ffmpeg, "-hide_banner", "-nostdin", "-i", str(input_path)],
         capture_output=True,
         encoding="utf-8",
         errors="replace",
     )
-    if result.returncode != 0:
-        raise RuntimeError(f"ffmpeg conversion failed:\n{result.stderr}")
-    return wav_path
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", result.stderr)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def _open_decoder(input_path: Path, samplerate: int, channels: int):
+    ffmpeg = _get_ffmpeg_exe()
+    if ffmpeg:
+        return _FfmpegDecoder(ffmpeg, input_path, samplerate, channels)
+    return _SoundfileDecoder(input_path, samplerate, channels)
 
 
-def separate_stems(input_path: str, output_base_dir: str, song_id: int) -> dict[str, str]:
+def separate_stems(input_path: str, output_base_dir: str, file_key: int | str) -> dict[str, str]:
     """
-    Run demucs on *input_path* and move the resulting stem files to
-    *output_base_dir*.
+    Separate *input_path* with the in-process Demucs engine and write the
+    resulting stem files to *output_base_dir* as <file_key>_<model>_<stem>.wav.
 
     Returns a dict mapping stem_type → absolute file path.
     Raises RuntimeError if separation fails.
     """
+    return separate_with_model(input_path, output_base_dir, file_key)[1]
+
+
+def separate_with_model(
+    input_path: str,
+    output_base_dir: str,
+    file_key: int | str,
+    progress: ProgressFn | None = None,
+) -> tuple[str, dict[str, str]]:
+    """
+    Like separate_stems(), but also returns the name of the model that
+    produced the stems (a fallback model if the preferred one failed), and
+    reports decode/separation progress to *progress* after every segment.
+
+    The track is streamed through the model in overlapping segments sized
+    to SEPARATION_MAX_MEMORY_MB, so peak memory doesn't grow with length.
+    """
     input_path = Path(input_path).resolve()
     output_base_dir = Path(output_base_dir).resolve()
     output_base_dir.mkdir(parents=True, exist_ok=True)
 
-    tmp_dir = output_base_dir / f"_tmp_{song_id}"
-    tmp_dir.mkdir(parents=True, exist_ok=True)
+    # Fall back through SEPARATION_MODELS; the engine keeps each one warm
+    errors = []
+    for model in settings.SEPARATION_MODELS:
+        try:
+            return model, _run_demucs(input_path, output_base_dir, file_key, model, progress)
+        except Exception as exc:
+            errors.append(f"demucs ({model}) failed: {exc}")
+    raise RuntimeError("\n".join(errors))
 
-    try:
-        # Convert non-WAV inputs to WAV so torchaudio can load them on Windows
-        if input_path.suffix.lower() != ".wav":
-            work_path = _to_wav(input_path, tmp_dir)
-        else:
-            work_path = input_path
 
-        try:
-            stems = _run_demucs(work_path, tmp_dir, song_id, model="htdemucs_6s")
-        except RuntimeError:
-            stems = _run_demucs(work_path, tmp_dir, song_id, model="htdemucs")
+def _segment_frames(net, samplerate: int) -> tuple[int, int]:
+    """
+    Pick (segment, overlap) lengths in frames so that one segment's working
+    set — model, input copies, and every source's output — stays inside
+    SEPARATION_MAX_MEMORY_MB.
+    """
+    budget = (
+        settings.SEPARATION_MAX_MEMORY_MB - _INFERENCE_OVERHEAD_MB
+    ) * 1_048_576 - model_bytes(net)
+    # float32 input (normalised + padded copies) and sources output
+    # (apply_model buffer, denormalised copy, crossfaded/clipped copy)
+    bytes_per_frame = 4 * net.audio_channels * (4 + 3 * len(net.sources))
+
+    overlap = int(_CROSSFADE_SECONDS * samplerate)
+    segment = min(budget // bytes_per_frame, int(_MAX_SEGMENT_SECONDS * samplerate))
+    segment = max(segment, int(_MIN_SEGMENT_SECONDS * samplerate))
+    return int(segment), overlap
 
-    finally:
-        shutil.rmtree(tmp_dir, ignore_errors=True)
 
-    return stems
+def _overlapping_blocks(read, segment: int, overlap: int):
+    """
+    Yield (block, is_last) windows of up to *segment* frames, each starting
+    with the last *overlap* frames of the previous one. *read(n)* returns a
+    (frames, channels) array, empty at end of input.
+    """
+    block = read(segment)
+    while len(block):
+        ahead = read(segment - overlap)
+        yield block, not len(ahead)
+        if not len(ahead):
+            return
+        block = np.concatenate([block[-overlap:], ahead])
 
 
 def _run_demucs(
     input_path: Path,
-    tmp_dir: Path,
-    song_id: int,
+    output_dir: Path,
+    file_key: int | str,
     model: str,
+    progress: ProgressFn | None = None,
 ) -> dict[str, str]:
-    result = subprocess.run(
-        [
-            sys.executable, "-m", "demucs",
-            "--name", model,
-            "--out", str(tmp_dir),
-            str(input_path),
-        ],
-        capture_output=True,
-        encoding="utf-8",
-        errors="replace",   # demucs prints Unicode progress bars; don't crash on cp1252
-    )
-    if result.returncode != 0:
-        raise RuntimeError(f"demucs ({model}) failed:\n{result.stdout}\n{result.stderr}")
+    import soundfile as sf
+    import torch
 
-    stem_dir = _find_stem_dir(tmp_dir)
-    if stem_dir is None:
-        raise RuntimeError("Could not locate demucs output directory.")
+    engine = get_engine()
+    net = engine.get_model(model)
 
-    final_dir = tmp_dir.parent
-    stems: dict[str, str] = {}
+    # The model is part of the name: a fallback run of the same audio must not
+    # overwrite the preferred model's files
+    stems = {
+        stem_type: output_dir / f"{file_key}_{model}_{stem_type}.wav"
+        for stem_type in net.sources
+        if stem_type in KNOWN_STEMS
+    }
+    if not stems:
+        raise RuntimeError("No recognisable stems in demucs output.")
+    # Written under names private to this run and renamed into place once
+    # complete, so a concurrent or abandoned run of the same audio can never
+    # leave a half-written file at — or delete — the final name
+    run = token_hex(4)
+    partial = {stem_type: dest.with_name(f"{dest.stem}.{run}.part.wav") for stem_type, dest in stems.items()}
 
-    for stem_file in sorted(stem_dir.iterdir()):
-        stem_type = stem_file.stem.lower()
-        if stem_type not in KNOWN_STEMS:
-            continue
-        dest = final_dir / f"{song_id}_{stem_type}{stem_file.suffix}"
-        shutil.move(str(stem_file), str(dest))
-        stems[stem_type] = str(dest)
+    writers: dict[str, sf.SoundFile] = {}
+    try:
+        # Decoded PCM goes straight from ffmpeg into the model and each
+        # stem is written once
+        with _open_decoder(input_path, net.samplerate, net.audio_channels) as decoder:
+            samplerate = decoder.samplerate
+            segment, overlap = _segment_frames(net, samplerate)
+            fade_in = np.linspace(0.0, 1.0, overlap, dtype=np.float32)
+            fade_out = 1.0 - fade_in
 
-    if not stems:
-        raise RuntimeError("No recognisable stem files found in demucs output.")
-
-    return stems
-
-
-def _find_stem_dir(root: Path) -> Path | None:
-    """Walk up to 3 levels deep to find a directory containing audio files."""
-    for level1 in root.iterdir():
-        if not level1.is_dir():
-            continue
-        for level2 in level1.iterdir():
-            if not level2.is_dir():
-                continue
-            if any(f.suffix in {".wav", ".mp3", ".flac"} for f in level2.iterdir()):
-                return level2
-    return None
+            for stem_type, part in partial.items():
+                writers[stem_type] = sf.SoundFile(
+                    str(part), "w", samplerate, net.audio_channels, subtype="PCM_16"
+                )
+
+            written = 0
+            tail: dict[str, np.ndarray] = {}
+            for block, is_last in _overlapping_blocks(decoder.read, segment, overlap):
+                wav = torch.from_numpy(np.ascontiguousarray(block.T))
+                _, sources = engine.separate(model, wav, samplerate)
+
+                keep = 0 if is_last else overlap
+                for stem_type, writer in writers.items():
+                    out = sources[stem_type].numpy()
+                    # Crossfade into the previous segment's held-back tail
+                    if stem_type in tail:
+                        out[:, :overlap] = (
+                            tail[stem_type] * fade_out + out[:, :overlap] * fade_in
+                        )
+                    length = out.shape[1] - keep
+                    # Per-sample clip: a whole-track rescale isn't possible
+                    # without holding the whole track
+                    writer.write(np.clip(out[:, :length].T, -1.0, 1.0))
+                    tail[stem_type] = out[:, length:].copy()
+                written += length
+                del sources
+
+                total = decoder.total_frames
+                if progress and total:
+                    progress("decode", min(decoder.frames_read / total, 1.0))
+                    progress("separate", min(written / total, 1.0))
+
+            if progress:
+                progress("decode", 1.0)
+                progress("separate", 1.0)
+
+    except BaseException:
+        for writer in writers.values():
+            writer.close()
+        for part in partial.values():
+            part.unlink(missing_ok=True)
+        raise
+
+    for writer in writers.values():
+        writer.close()
+    for stem_type, dest in stems.items():
+        os.replace(partial[stem_type], dest)
+
+    return {stem_type: str(dest) for stem_type, dest in stems.items()}
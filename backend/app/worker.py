@@ -0,0 +1,222 @@
+"""
+Separation worker — claims queued songs and runs Demucs on them.
+
+Runs as its own process so multi-minute separations never share a process
+with uvicorn, survive API restarts, and are capped to what the machine can
+actually hold in RAM at once.
+
+Usage:
+    cd backend
+    python -m app.worker                    # concurrency sized to RAM / cores
+    python -m app.worker --concurrency 2
+"""
+import argparse
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from .config import settings
+from .database import engine, SessionLocal
+from .migrations import migrate_database
+from .models import SeparationJob, Stem
+from .services import job_queue, stem_cache
+from .services.ingest import expire_upload_sessions
+from .services.audio_analysis import analyze_stems
+from .services.progress import ProgressReporter
+from .services.renditions import encode_stems
+from .services.segments import package_stems
+from .services.separation_engine import get_engine
+from .services.stem_pack import write_pack
+from .services.stem_separator import separate_with_model
+
+_stop = threading.Event()
+_UPLOAD_SWEEP_SECONDS = 600
+
+
+# ── Capacity ──────────────────────────────────────────────────────────────────
+
+def _available_memory_mb() -> int | None:
+    """MemAvailable from /proc/meminfo, falling back to total physical RAM."""
+    try:
+        with open("/proc/meminfo") as fp:
+            for line in fp:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // 1_048_576
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def max_concurrency() -> int:
+    """How many separations fit in the available cores and RAM."""
+    by_cpu = max(1, (os.cpu_count() or 1) // settings.SEPARATION_THREADS_PER_JOB)
+    memory_mb = _available_memory_mb()
+    if memory_mb is None:
+        return by_cpu
+    by_ram = max(1, memory_mb // settings.SEPARATION_MAX_MEMORY_MB)
+    return min(by_cpu, by_ram)
+
+
+# ── Job execution ─────────────────────────────────────────────────────────────
+
+def process_job(job_id: int) -> None:
+    """Separate, analyse, encode, segment and pack one claimed job's song and persist its stems."""
+    db = SessionLocal()
+    try:
+        job = db.get(SeparationJob, job_id)
+        if job is None:
+            return
+        song = job.song
+
+        # An identical upload may have finished while this one was queued
+        if stem_cache.attach_cached_stems(db, song):
+            job_queue.mark_done(db, job)
+            return
+
+        song.status = "processing"
+        song.error_message = None
+        db.commit()
+
+        stems_dir = Path(settings.UPLOAD_DIR) / "stems"
+        progress = ProgressReporter(job.id)
+        model, stem_paths = separate_with_model(
+            song.original_path,
+            str(stems_dir),
+            song.content_hash or song.id,
+            progress=progress,
+        )
+        stems = analyze_stems(stem_paths, progress=progress)
+        encode_stems(stems, progress=progress)
+        package_stems(stems, progress=progress)
+        write_pack(stems)
+
+        # A retried job may have left rows behind from an earlier attempt
+        for stale in db.query(Stem).filter(Stem.song_id == song.id).all():
+            db.delete(stale)
+        db.flush()  # deletes before inserts: (song_id, stem_type) is unique
+        for stem_type, columns in stems.items():
+            db.add(stem_cache.new_stem(song.id, stem_type, model, columns))
+
+        song.status = "complete"
+        job_queue.mark_done(db, job)
+
+    except Exception as exc:
+        db.rollback()
+        try:
+            retry = job_queue.mark_failed(db, job_id, str(exc))
+            print(f"[job {job_id}] failed ({'will retry' if retry else 'giving up'}): {exc}")
+        except Exception:
+            pass
+    finally:
+        db.close()
+
+
+# ── Main loop ─────────────────────────────────────────────────────────────────
+
+def run(concurrency: int) -> None:
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    in_flight: dict[Future, int] = {}
+
+    with SessionLocal() as db:
+        queued = job_queue.enqueue_orphans(db)
+    if queued:
+        print(f"Queued {queued} song(s) left over from before the job queue.")
+
+    print(f"Worker {worker_id} started with concurrency {concurrency}.")
+    next_sweep = 0.0
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="separate") as pool:
+        while not _stop.is_set():
+            with SessionLocal() as db:
+                job_queue.heartbeat(db, list(in_flight.values()), worker_id)
+                recovered = job_queue.recover_stale(db)
+                if recovered:
+                    print(f"Recovered {recovered} stale job(s).")
+                # Abandoned resumable uploads hold preallocated files
+                if time.monotonic() >= next_sweep:
+                    next_sweep = time.monotonic() + _UPLOAD_SWEEP_SECONDS
+                    expired = expire_upload_sessions(db)
+                    if expired:
+                        print(f"Expired {expired} abandoned upload(s).")
+
+                while len(in_flight) < concurrency:
+                    job = job_queue.claim_next(db, worker_id)
+                    if job is None:
+                        break
+                    print(f"[job {job.id}] song {job.song_id}, attempt {job.attempts}")
+                    in_flight[pool.submit(process_job, job.id)] = job.id
+
+            if in_flight:
+                done, _ = wait(
+                    in_flight, timeout=settings.WORKER_POLL_SECONDS, return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    in_flight.pop(future)
+            else:
+                _stop.wait(settings.WORKER_POLL_SECONDS)
+
+        if in_flight:
+            print(f"Stopping — waiting for {len(in_flight)} running job(s) to finish ...")
+            # Keep heartbeating so another worker doesn't steal them meanwhile
+            while in_flight:
+                done, _ = wait(in_flight, timeout=settings.WORKER_POLL_SECONDS)
+                for future in done:
+                    in_flight.pop(future)
+                with SessionLocal() as db:
+                    job_queue.heartbeat(db, list(in_flight.values()), worker_id)
+
+
+def _request_stop(signum, frame) -> None:
+    if _stop.is_set():
+        raise KeyboardInterrupt
+    _stop.set()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the Prism stem separation worker.")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=settings.WORKER_CONCURRENCY,
+        help="Max simultaneous separations (default: size to available RAM / cores)",
+    )
+    args = parser.parse_args()
+
+    capacity = max_concurrency()
+    concurrency = args.concurrency if args.concurrency > 0 else capacity
+    if concurrency > capacity:
+        print(
+            f"Requested concurrency {concurrency} exceeds what fits in RAM/cores; "
+            f"capping at {capacity}."
+        )
+        concurrency = capacity
+
+    # Jobs share the process-wide torch thread pool, sized at import time
+    threads = str(settings.SEPARATION_THREADS_PER_JOB * concurrency)
+    os.environ.setdefault("OMP_NUM_THREADS", threads)
+    os.environ.setdefault("MKL_NUM_THREADS", threads)
+
+    migrate_database(engine)
+    Path(settings.UPLOAD_DIR).mkdir(parents=True, exist_ok=True)
+
+    # Load the primary model up front so the first job doesn't pay for it
+    try:
+        get_engine().get_model(settings.SEPARATION_MODELS[0])
+    except Exception as exc:
+        print(f"[warn] could not preload {settings.SEPARATION_MODELS[0]}: {exc}")
+
+    signal.signal(signal.SIGINT, _request_stop)
+    signal.signal(signal.SIGTERM, _request_stop)
+    run(concurrency)
+    print("Worker stopped.")
+
+
+if __name__ == "__main__":
+    main()
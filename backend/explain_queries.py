@@ -0,0 +1,219 @@
+"""
+Query-plan benchmark for the indexes in migrations/versions/0003_query_indexes.py.
+
+Builds a synthetic catalog at revision 0002 (the schema as create_all()
+left it), prints the plan and median time of each hot query, upgrades to
+head and prints them again, so the effect of every index is visible side
+by side.
+
+Usage:
+    cd backend
+    python explain_queries.py                       # throwaway SQLite file
+    python explain_queries.py --songs 100000 --runs 20
+    python explain_queries.py --database-url postgresql://localhost/prism_bench
+
+A --database-url must point at an empty, disposable database: the script
+migrates it down to nothing before filling it.
+"""
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine, insert, select, text
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from alembic import command
+
+from app.migrations import alembic_config, migrate_database
+from app.models import SeparationJob, Song, Stem, User, utcnow
+
+STEM_TYPES = ("vocals", "drums", "bass", "guitar", "piano", "other")
+INSERT_BATCH = 5000
+
+
+# ── Synthetic data ────────────────────────────────────────────────────────────
+
+def populate(engine, songs: int, demos: int, users: int) -> None:
+    """*songs* user songs spread over *users*, plus *demos* demo songs, six stems each."""
+    rng = random.Random(0)
+    now = utcnow()
+
+    with engine.begin() as conn:
+        conn.execute(
+            insert(User.__table__),
+            [{"email": f"user{i}@example.com", "password_hash": "x"} for i in range(users)],
+        )
+
+    song_rows = []
+    for i in range(songs + demos):
+        demo = i >= songs
+        song_rows.append({
+            "title": f"Song {i:07d}",
+            "artist": None,
+            "original_path": f"uploads/originals/{i:064x}.mp3",
+            "content_hash": f"{i:064x}",
+            # Most uploads finished long ago; a few are still in flight
+            "status": "complete" if demo or rng.random() < 0.97 else "pending",
+            "is_demo": demo,
+            "user_id": None if demo else rng.randrange(users) + 1,
+            "created_at": now - timedelta(minutes=rng.randrange(525_600)),
+        })
+    for start in range(0, len(song_rows), INSERT_BATCH):
+        with engine.begin() as conn:
+            conn.execute(insert(Song.__table__), song_rows[start:start + INSERT_BATCH])
+
+    stem_rows = [
+        {
+            "song_id": song_id,
+            "stem_type": stem_type,
+            "file_path": f"uploads/stems/{song_id:064x}_{stem_type}.wav",
+            "model_name": "htdemucs_6s",
+            "is_silent": False,
+        }
+        for song_id in range(1, songs + demos + 1)
+        for stem_type in STEM_TYPES
+    ]
+    for start in range(0, len(stem_rows), INSERT_BATCH):
+        with engine.begin() as conn:
+            conn.execute(insert(Stem.__table__), stem_rows[start:start + INSERT_BATCH])
+
+    job_rows = []
+    for song_id in range(1, songs + 1):
+        status = song_rows[song_id - 1]["status"]
+        job_rows.append({
+            "song_id": song_id,
+            "status": "done" if status == "complete" else rng.choice(("pending", "running")),
+            "attempts": 1,
+            "run_after": now - timedelta(minutes=rng.randrange(10_000)),
+            "heartbeat_at": now - timedelta(seconds=rng.randrange(600)),
+        })
+    for start in range(0, len(job_rows), INSERT_BATCH):
+        with engine.begin() as conn:
+            conn.execute(insert(SeparationJob.__table__), job_rows[start:start + INSERT_BATCH])
+
+
+# ── The queries the app runs ──────────────────────────────────────────────────
+
+def hot_queries(songs: int, users: int) -> dict:
+    """Label → statement, mirroring the repository / job queue / cleanup code."""
+    # String timestamps so the statements render with literal binds for EXPLAIN
+    now = utcnow().isoformat(sep=" ")
+    cutoff = (utcnow() - timedelta(seconds=120)).isoformat(sep=" ")
+    song_id = songs // 2
+    return {
+        "demo catalog": (
+            select(Song.id, Song.title)
+            .where(Song.is_demo == True, Song.status == "complete")
+            .order_by(Song.title)
+        ),
+        "my songs": (
+            select(Song.id, Song.title)
+            .where(Song.user_id == users // 2)
+            .order_by(Song.created_at.desc())
+        ),
+        "stems of a song": select(Stem.id, Stem.stem_type).where(Stem.song_id == song_id),
+        "claim next job": (
+            select(SeparationJob.id)
+            .where(SeparationJob.status == "pending", SeparationJob.run_after <= now)
+            .order_by(SeparationJob.run_after, SeparationJob.id)
+            .limit(5)
+        ),
+        "stale running jobs": (
+            select(SeparationJob.id)
+            .where(SeparationJob.status == "running", SeparationJob.heartbeat_at < cutoff)
+        ),
+        "shared original": (
+            select(Song.id)
+            .where(Song.original_path == f"uploads/originals/{song_id - 1:064x}.mp3", Song.id != song_id)
+            .limit(1)
+        ),
+        "shared stem files": (
+            select(Stem.file_path)
+            .where(
+                Stem.file_path.in_([
+                    f"uploads/stems/{song_id:064x}_{stem_type}.wav" for stem_type in STEM_TYPES
+                ]),
+                Stem.song_id != song_id,
+            )
+            .distinct()
+        ),
+    }
+
+
+def explain(conn, statement) -> list[str]:
+    sql = str(statement.compile(conn, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "sqlite":
+        return [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+    return [row[0] for row in conn.execute(text(f"EXPLAIN {sql}"))]
+
+
+def median_ms(conn, statement, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        conn.execute(statement).all()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def measure(engine, queries: dict, runs: int) -> dict:
+    with engine.connect() as conn:
+        conn.execute(text("ANALYZE"))
+        return {
+            label: (explain(conn, statement), median_ms(conn, statement, runs))
+            for label, statement in queries.items()
+        }
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Show query plans before/after the index migration.")
+    parser.add_argument("--database-url", help="Empty, disposable database (default: a temp SQLite file)")
+    parser.add_argument("--songs", type=int, default=50_000, help="User songs to generate (default: 50000)")
+    parser.add_argument("--demos", type=int, default=40, help="Demo songs to generate (default: 40)")
+    parser.add_argument("--users", type=int, default=5_000, help="Users to spread songs over (default: 5000)")
+    parser.add_argument("--runs", type=int, default=10, help="Timed runs per query (default: 10)")
+    args = parser.parse_args()
+
+    tmp_dir = None
+    url = args.database_url
+    if url is None:
+        tmp_dir = tempfile.TemporaryDirectory(prefix="prism-explain-")
+        url = f"sqlite:///{tmp_dir.name}/bench.db"
+    engine = create_engine(url)
+
+    with engine.begin() as conn:
+        command.downgrade(alembic_config(conn), "base")
+    migrate_database(engine, "0002")
+    print(f"Generating {args.songs} songs ({args.demos} demos), {args.songs * 6} stems...")
+    populate(engine, args.songs, args.demos, args.users)
+
+    queries = hot_queries(args.songs, args.users)
+    before = measure(engine, queries, args.runs)
+    migrate_database(engine)
+    after = measure(engine, queries, args.runs)
+
+    for label in queries:
+        (plan_before, ms_before), (plan_after, ms_after) = before[label], after[label]
+        print(f"\n── {label}: {ms_before:.2f} ms → {ms_after:.2f} ms")
+        print("   before (0002):")
+        for line in plan_before:
+            print(f"     {line}")
+        print("   after (head):")
+        for line in plan_after:
+            print(f"     {line}")
+
+    engine.dispose()
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+HTTP load test for the hot read endpoints — GET /api/songs/demos and
+GET /api/songs/{id} — against a running API.
+
+Each endpoint is hit by --concurrency clients in a closed loop for
+--duration seconds; the script prints throughput and latency percentiles.
+Run it before and after a change to compare:
+
+    cd backend
+    uvicorn app.main:app --port 8000          # in another terminal
+    python load_test.py
+    python load_test.py --base-url https://prism-api.onrender.com --concurrency 128
+
+GET /{id} needs a login: pass --email/--password of an existing account, or
+a throwaway account is registered (not possible in demo mode).
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+
+try:
+    import httpx
+except ImportError:
+    sys.exit("httpx not installed. Run: pip install httpx")
+
+
+async def _login(client: httpx.AsyncClient, email: str | None, password: str | None) -> str:
+    if email:
+        response = await client.post("/api/auth/login", json={"email": email, "password": password})
+    else:
+        response = await client.post(
+            "/api/auth/register",
+            json={"email": f"load-{uuid.uuid4().hex[:12]}@example.com", "password": uuid.uuid4().hex},
+        )
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def run_endpoint(
+    client: httpx.AsyncClient, path: str, headers: dict, concurrency: int, duration: float
+) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def user():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.get(path, headers=headers)
+                response.read()
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def pct(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50": pct(0.50),
+        "p95": pct(0.95),
+        "p99": pct(0.99),
+        "mean": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+async def main_async(args) -> None:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60.0) as client:
+        demos = (await client.get("/api/songs/demos")).json()
+        if not demos:
+            sys.exit("No demo songs — seed some first (python seed_demos.py).")
+        token = await _login(client, args.email, args.password)
+        auth = {"Authorization": f"Bearer {token}"}
+
+        targets = [
+            ("GET /api/songs/demos", "/api/songs/demos", {"Accept-Encoding": "gzip"}),
+            ("GET /api/songs/{id}", f"/api/songs/{demos[0]['id']}", auth),
+        ]
+        print(f"{args.base_url} — {args.concurrency} concurrent clients, {args.duration:.0f}s per endpoint\n")
+        print(f"{'endpoint':<24}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+        for label, path, headers in targets:
+            # Warm caches and pools before measuring
+            await run_endpoint(client, path, headers, args.concurrency, min(2.0, args.duration))
+            result = await run_endpoint(client, path, headers, args.concurrency, args.duration)
+            print(
+                f"{label:<24}{result['rps']:>9.0f}{result['p50']:>9.1f}"
+                f"{result['p95']:>9.1f}{result['p99']:>9.1f}{result['errors']:>8}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the hot read endpoints of a running API.")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent clients (default: 64)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per endpoint (default: 10)")
+    parser.add_argument("--email", help="Existing account to log in as (default: register one)")
+    parser.add_argument("--password")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""baseline: users, songs, stems
+
+The schema create_all() built before migrations existed. Databases created
+that way are stamped at this revision by app.migrations and upgraded from
+here.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("password_hash", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "songs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("artist", sa.String(), nullable=True),
+        sa.Column("original_path", sa.String(), nullable=True),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("error_message", sa.String(), nullable=True),
+        sa.Column("is_demo", sa.Boolean(), nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=True),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+    )
+    op.create_index("ix_songs_id", "songs", ["id"])
+
+    op.create_table(
+        "stems",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("song_id", sa.Integer(), sa.ForeignKey("songs.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("stem_type", sa.String(), nullable=False),
+        sa.Column("file_path", sa.String(), nullable=False),
+    )
+    op.create_index("ix_stems_id", "stems", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_table("stems")
+    op.drop_table("songs")
+    op.drop_table("users")
@@ -0,0 +1,143 @@
+"""job queue, resumable uploads, content hashes, stem analysis and renditions
+
+Everything added to the models between the baseline and the move to
+migrations. Those databases were built by create_all() at whatever point
+the code was when they were first started, so each table, column and index
+is only created if it isn't already there.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def _inspector():
+    """None when rendering SQL offline (--sql): the script then assumes a fresh 0001 schema."""
+    if op.get_context().as_sql:
+        return None
+    return sa.inspect(op.get_bind())
+
+
+def _ensure_columns(table: str, *columns: sa.Column) -> None:
+    """Add whichever of *columns* an older create_all() didn't create."""
+    inspector = _inspector()
+    existing = {c["name"] for c in inspector.get_columns(table)} if inspector else set()
+    for column in columns:
+        if column.name not in existing:
+            op.add_column(table, column)
+
+
+def _ensure_table(name: str, *columns: sa.Column, constraints=()) -> None:
+    inspector = _inspector()
+    if inspector is None or not inspector.has_table(name):
+        op.create_table(name, *columns, *constraints)
+    else:
+        _ensure_columns(name, *columns)
+
+
+def _ensure_index(name: str, table: str, columns: list[str], unique: bool = False) -> None:
+    inspector = _inspector()
+    if inspector is None or name not in {index["name"] for index in inspector.get_indexes(table)}:
+        op.create_index(name, table, columns, unique=unique)
+
+
+def upgrade() -> None:
+    _ensure_columns("songs", sa.Column("content_hash", sa.String(64), nullable=True))
+    _ensure_index("ix_songs_content_hash", "songs", ["content_hash"])
+
+    _ensure_columns(
+        "stems",
+        sa.Column("checksum", sa.String(64), nullable=True),
+        sa.Column("model_name", sa.String(), nullable=True),
+        sa.Column("duration", sa.Float(), nullable=True),
+        sa.Column("sample_rate", sa.Integer(), nullable=True),
+        sa.Column("peak_db", sa.Float(), nullable=True),
+        sa.Column("rms_db", sa.Float(), nullable=True),
+        sa.Column("lufs", sa.Float(), nullable=True),
+        sa.Column("is_silent", sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column("peaks_path", sa.String(), nullable=True),
+    )
+    _ensure_index("ix_stems_checksum", "stems", ["checksum"])
+
+    _ensure_table(
+        "stem_renditions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("stem_id", sa.Integer(), sa.ForeignKey("stems.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("codec", sa.String(), nullable=False),
+        sa.Column("bitrate_kbps", sa.Integer(), nullable=False),
+        sa.Column("mime_type", sa.String(), nullable=False),
+        sa.Column("file_path", sa.String(), nullable=False),
+        sa.Column("size_bytes", sa.BigInteger(), nullable=False),
+    )
+    _ensure_index("ix_stem_renditions_id", "stem_renditions", ["id"])
+    _ensure_index("ix_stem_renditions_stem_id", "stem_renditions", ["stem_id"])
+
+    _ensure_table(
+        "separation_jobs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("song_id", sa.Integer(), sa.ForeignKey("songs.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("run_after", sa.DateTime(), nullable=False),
+        sa.Column("claimed_by", sa.String(), nullable=True),
+        sa.Column("heartbeat_at", sa.DateTime(), nullable=True),
+        sa.Column("last_error", sa.String(), nullable=True),
+        sa.Column("stage", sa.String(), nullable=True),
+        sa.Column("progress", sa.JSON(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+        constraints=[sa.UniqueConstraint("song_id")],
+    )
+    _ensure_index("ix_separation_jobs_id", "separation_jobs", ["id"])
+
+    _ensure_table(
+        "upload_sessions",
+        sa.Column("id", sa.String(32), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("filename", sa.String(), nullable=False),
+        sa.Column("total_size", sa.BigInteger(), nullable=False),
+        sa.Column("part_size", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    _ensure_table(
+        "upload_parts",
+        sa.Column(
+            "session_id",
+            sa.String(32),
+            sa.ForeignKey("upload_sessions.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("part_number", sa.Integer(), primary_key=True),
+    )
+
+    _ensure_table(
+        "catalog_versions",
+        sa.Column("name", sa.String(), primary_key=True),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("catalog_versions")
+    op.drop_table("upload_parts")
+    op.drop_table("upload_sessions")
+    op.drop_table("separation_jobs")
+    op.drop_table("stem_renditions")
+    op.drop_index("ix_stems_checksum", table_name="stems")
+    with op.batch_alter_table("stems") as batch:
+        for name in (
+            "peaks_path", "is_silent", "lufs", "rms_db", "peak_db",
+            "sample_rate", "duration", "model_name", "checksum",
+        ):
+            batch.drop_column(name)
+    op.drop_index("ix_songs_content_hash", table_name="songs")
+    with op.batch_alter_table("songs") as batch:
+        batch.drop_column("content_hash")
@@ -0,0 +1,81 @@
+"""indexes for the hot queries, one stem per (song, type)
+
+Each index serves a query the app actually runs (see explain_queries.py
+for the plans before and after):
+
+  ix_songs_demo_title         GET /demos: is_demo AND status='complete' ORDER BY title
+                              (partial — demo rows are a sliver of songs)
+  ix_songs_user_created       GET /my and the per-user song count:
+                              user_id = ? ORDER BY created_at DESC
+  ix_songs_original_path      release_song_files: is the original shared?
+  uq_stems_song_stem_type     stems by song_id; also makes a duplicate stem
+                              row for the same song and type impossible
+  ix_stems_file_path          release_song_files: are the stem files shared?
+  ix_separation_jobs_pending  claim_next: status='pending' AND run_after <= ?
+                              ORDER BY run_after, id (partial — finished
+                              jobs, the vast majority, aren't in it)
+  ix_separation_jobs_running  recover_stale: status='running' AND heartbeat_at < ?
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def _where(clause):
+    """Same predicate for both dialects that support partial indexes."""
+    return {"sqlite_where": clause, "postgresql_where": clause}
+
+
+def upgrade() -> None:
+    is_demo = sa.column("is_demo", sa.Boolean)
+    song_status = sa.column("status", sa.String)
+    job_status = sa.column("status", sa.String)
+
+    op.create_index(
+        "ix_songs_demo_title", "songs", ["title"],
+        **_where(sa.and_(is_demo == sa.true(), song_status == "complete")),
+    )
+    op.create_index("ix_songs_user_created", "songs", ["user_id", "created_at"])
+    op.create_index("ix_songs_original_path", "songs", ["original_path"])
+
+    # Keep the newest row of any duplicated (song, stem type) — older ones
+    # are leftovers of a retried separation
+    op.execute(
+        "DELETE FROM stem_renditions WHERE stem_id IN ("
+        " SELECT id FROM stems WHERE id NOT IN ("
+        "  SELECT MAX(id) FROM stems GROUP BY song_id, stem_type))"
+    )
+    op.execute(
+        "DELETE FROM stems WHERE id NOT IN ("
+        " SELECT MAX(id) FROM stems GROUP BY song_id, stem_type)"
+    )
+    op.create_index("uq_stems_song_stem_type", "stems", ["song_id", "stem_type"], unique=True)
+    op.create_index("ix_stems_file_path", "stems", ["file_path"])
+
+    op.create_index(
+        "ix_separation_jobs_pending", "separation_jobs", ["run_after", "id"],
+        **_where(job_status == "pending"),
+    )
+    op.create_index(
+        "ix_separation_jobs_running", "separation_jobs", ["heartbeat_at"],
+        **_where(job_status == "running"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_separation_jobs_running", table_name="separation_jobs")
+    op.drop_index("ix_separation_jobs_pending", table_name="separation_jobs")
+    op.drop_index("ix_stems_file_path", table_name="stems")
+    op.drop_index("uq_stems_song_stem_type", table_name="stems")
+    op.drop_index("ix_songs_original_path", table_name="songs")
+    op.drop_index("ix_songs_user_created", table_name="songs")
+    op.drop_index("ix_songs_demo_title", table_name="songs")
@@ -0,0 +1,28 @@
+"""stem segments for progressive playback
+
+segment_seconds / segment_count on stems (services/segments.py). Existing
+stems keep NULL — they have no segments, and GET /{id}/manifest says so.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("stems", sa.Column("segment_seconds", sa.Float(), nullable=True))
+    op.add_column("stems", sa.Column("segment_count", sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("stems") as batch:
+        batch.drop_column("segment_count")
+        batch.drop_column("segment_seconds")
@@ -0,0 +1,76 @@
+"""
+Backfill the precompressed variants that /uploads, /api/files and /peaks
+serve (app/services/static_delivery.py) for files written before they
+existed: a FLAC copy of every WAV stem and gzip/brotli copies of every
+.peaks sidecar. New stems get theirs from the worker.
+
+Usage:
+    cd backend
+    python precompress_uploads.py                     # UPLOAD_DIR/stems
+    python precompress_uploads.py --workers 4
+    python precompress_uploads.py --stems-dir /srv/prism/uploads/stems
+
+Files that already have their variants are skipped, so re-running is cheap.
+"""
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.config import settings
+from app.services.renditions import encode_flac_variant
+from app.services.static_delivery import (
+    PRECOMPRESSED_SUFFIXES,
+    encoded_variant_path,
+    flac_variant_path,
+    precompress,
+)
+
+
+def pending(stems_dir: Path) -> tuple[list[Path], list[Path]]:
+    """(WAVs without a FLAC variant, sidecars without a gzip variant)."""
+    wavs = [p for p in sorted(stems_dir.glob("*.wav")) if not flac_variant_path(p).exists()]
+    sidecars = [
+        p for p in sorted(stems_dir.iterdir())
+        if p.suffix in PRECOMPRESSED_SUFFIXES and not encoded_variant_path(p, "gzip").exists()
+    ]
+    return wavs, sidecars
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write FLAC / gzip / brotli variants of stored stems.")
+    parser.add_argument("--stems-dir", type=Path, default=Path(settings.UPLOAD_DIR) / "stems")
+    parser.add_argument("--workers", type=int, default=2, help="Parallel ffmpeg runs (default: 2)")
+    args = parser.parse_args()
+
+    if not args.stems_dir.is_dir():
+        sys.exit(f"No stems directory at {args.stems_dir}")
+    wavs, sidecars = pending(args.stems_dir)
+    print(f"{len(wavs)} WAV(s) to encode to FLAC, {len(sidecars)} sidecar(s) to precompress")
+
+    saved = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for wav, result in zip(wavs, pool.map(_encode, wavs)):
+            if isinstance(result, Exception):
+                print(f"  [warn] {wav.name}: {result}")
+                continue
+            before, after = wav.stat().st_size, result.stat().st_size
+            saved += before - after
+            print(f"  [flac] {wav.name}: {before / 1_048_576:.1f} → {after / 1_048_576:.1f} MB")
+
+    for sidecar in sidecars:
+        precompress(sidecar)
+    print(f"Done. FLAC variants are {saved / 1_048_576:.0f} MB smaller than their WAVs in total.")
+
+
+def _encode(wav: Path) -> Path | Exception:
+    try:
+        return encode_flac_variant(wav)
+    except RuntimeError as err:
+        return err
+
+
+if __name__ == "__main__":
+    main()
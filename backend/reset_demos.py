@@ -15,6 +15,7 @@ sys.path.insert(0, str(Path(__file__).parent))
 from app.database import SessionLocal
 from app.models import Song, Stem
 from app.config import settings
+from app.services.catalog_cache import bump_catalog_version
 
 db = SessionLocal()
 
@@ -25,6 +26,7 @@ for song in demo_songs:
     db.query(Stem).filter(Stem.song_id == song.id).delete()
     db.delete(song)
 
+bump_catalog_version(db)
 db.commit()
 db.close()
 print("Database records cleared.")
@@ -36,4 +38,9 @@ if stems_dir.exists():
     stems_dir.mkdir()
     print(f"Stem files deleted: {stems_dir}")
 
+manifest = Path(settings.UPLOAD_DIR) / "seed_manifest.json"
+if manifest.exists():
+    manifest.unlink()
+    print(f"Seed manifest deleted: {manifest}")
+
 print("\nDone. Run `python seed_demos.py` to re-seed.")
@@ -11,26 +11,46 @@ Usage:
     python seed_demos.py --reset      # clear existing demo entries first
     python seed_demos.py --songs-dir /path/to/folder
     python seed_demos.py --reset --songs-dir /path/to/folder
+    python seed_demos.py --workers 4  # separate 4 songs in parallel
+
+Progress is tracked in uploads/seed_manifest.json, keyed by each file's
+content hash, so re-running after an interruption only separates the songs
+that didn't finish.
 """
+import json
+import multiprocessing
+import os
 import re
 import shutil
 import sys
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 # Add project root so we can import app modules
 sys.path.insert(0, str(Path(__file__).parent))
 
 from app.config import settings
-from app.database import Base, engine, SessionLocal
+from app.database import engine, SessionLocal
+from app.migrations import migrate_database
 from app.models import Song, Stem
-from app.services.stem_separator import separate_stems
+from app.services.content_hash import sha256_file
+from app.services.audio_analysis import analyze_stems
+from app.services.catalog_cache import bump_catalog_version
+from app.services.renditions import encode_stems
+from app.services.segments import package_stems
+from app.services.stem_pack import write_pack
+from app.services.stem_cache import new_stem
+from app.services.stem_separator import separate_with_model
 
 AUDIO_EXTENSIONS = {".mp3", ".wav", ".flac", ".m4a", ".ogg", ".aac"}
 
 # Default songs folder: one level above backend/
 DEFAULT_SONGS_DIR = Path(__file__).parent.parent / "songs"
 
+# Written to UPLOAD_DIR; lets an interrupted run resume by file content
+MANIFEST_NAME = "seed_manifest.json"
+
 
 def parse_filename(stem: str) -> tuple[str, str]:
     """
@@ -70,10 +90,83 @@ def parse_filename(stem: str) -> tuple[str, str]:
 def clear_demo_songs(db) -> None:
     """Delete all is_demo=True songs (and their stems via cascade)."""
     deleted = db.query(Song).filter(Song.is_demo == True).delete()
+    bump_catalog_version(db)
     db.commit()
     print(f"  Cleared {deleted} existing demo song(s) from database.")
 
 
+# ── Resume manifest ───────────────────────────────────────────────────────────
+
+def load_manifest(path: Path) -> dict:
+    """Seeding progress keyed by audio content hash: {sha256: {...}}."""
+    if path.exists():
+        return json.loads(path.read_text(encoding="utf-8"))
+    return {}
+
+
+def save_manifest(path: Path, manifest: dict) -> None:
+    # Write-then-rename so an interrupted run never leaves a torn manifest
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+# ── Separation workers ────────────────────────────────────────────────────────
+
+def _init_worker(threads: int, counter) -> None:
+    """Pin each pool process to its own share of the CPU threads."""
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    if hasattr(os, "sched_setaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+        share = cores[index * threads:(index + 1) * threads]
+        if share:
+            os.sched_setaffinity(0, share)
+
+    import torch
+    torch.set_num_threads(threads)
+
+
+def _separate(audio_path: str, stems_dir: str, file_key: str) -> tuple[str, dict[str, dict]]:
+    """Separate, analyse, encode, segment and pack one song; returns (model, {stem_type: Stem columns})."""
+    model, stem_paths = separate_with_model(audio_path, stems_dir, file_key)
+    stems = package_stems(encode_stems(analyze_stems(stem_paths)))
+    write_pack(stems)
+    return model, stems
+
+
+def _record_result(db, manifest: dict, digest: str, song: Song, get_stems) -> None:
+    """Commit one song's outcome; *get_stems()* returns (model, stems) or raises."""
+    entry = manifest[digest]
+    try:
+        model, stems = get_stems()
+        for stale in db.query(Stem).filter(Stem.song_id == song.id).all():
+            db.delete(stale)
+        db.flush()  # deletes before inserts: (song_id, stem_type) is unique
+        for stem_type, columns in stems.items():
+            db.add(new_stem(song.id, stem_type, model, columns))
+        song.status = "complete"
+        song.error_message = None
+        bump_catalog_version(db)
+        db.commit()
+        entry.update(
+            status="complete",
+            stems={stem_type: columns["file_path"] for stem_type, columns in stems.items()},
+        )
+        print(f"  [ok] {song.title}: {len(stems)} stems: {', '.join(stems.keys())}")
+    except Exception as e:
+        db.rollback()
+        song.status = "error"
+        song.error_message = str(e)[:500]
+        db.commit()
+        entry.update(status="error", error=str(e)[:500])
+        print(f"  [error] {song.title}: Demucs failed: {e}")
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Seed demo songs from a local folder.")
     parser.add_argument(
@@ -87,6 +180,12 @@ def main() -> None:
         action="store_true",
         help="Clear existing demo entries before seeding",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Separate this many songs in parallel, each in its own process (default: 1)",
+    )
     args = parser.parse_args()
 
     songs_dir: Path = args.songs_dir.resolve()
@@ -104,29 +203,50 @@ def main() -> None:
 
     print(f"Found {len(audio_files)} audio file(s) in {songs_dir}\n")
 
-    Base.metadata.create_all(bind=engine)
+    migrate_database(engine)
 
     raw_dir   = Path(settings.UPLOAD_DIR) / "demo_originals"
     stems_dir = Path(settings.UPLOAD_DIR) / "stems"
     raw_dir.mkdir(parents=True, exist_ok=True)
     stems_dir.mkdir(parents=True, exist_ok=True)
 
+    manifest_path = Path(settings.UPLOAD_DIR) / MANIFEST_NAME
+    manifest = load_manifest(manifest_path)
+
     db = SessionLocal()
 
     if args.reset:
         clear_demo_songs(db)
+        manifest = {}
+        save_manifest(manifest_path, manifest)
         print()
 
+    # 1. Decide what needs separating, creating/reusing a Song row for each
+    pending: list[tuple[str, Song, Path]] = []
     for audio_file in audio_files:
         artist, title = parse_filename(audio_file.stem)
         print(f">> {artist} - {title}  [{audio_file.name}]")
 
-        # Skip if already seeded (by title match)
-        existing = db.query(Song).filter(Song.title == title, Song.is_demo == True).first()
-        if existing:
-            print(f"  [skip] already in database\n")
+        digest = sha256_file(audio_file)
+        entry = manifest.get(digest)
+        song = db.get(Song, entry["song_id"]) if entry else None
+
+        if song is not None and song.status == "complete":
+            print(f"  [skip] already seeded (manifest)\n")
             continue
 
+        # Songs seeded before the manifest existed are matched by title; an
+        # unfinished one is reused below rather than duplicated
+        if song is None:
+            song = db.query(Song).filter(Song.title == title, Song.is_demo == True).first()
+            if song and song.status == "complete":
+                song.content_hash = song.content_hash or digest
+                db.commit()
+                manifest[digest] = {"file": audio_file.name, "song_id": song.id, "status": "complete"}
+                save_manifest(manifest_path, manifest)
+                print(f"  [skip] already in database\n")
+                continue
+
         # Copy original into uploads/demo_originals/
         dest_path = raw_dir / audio_file.name
         if not dest_path.exists():
@@ -135,35 +255,63 @@ def main() -> None:
         else:
             print(f"  [cached] {dest_path.name}")
 
-        # Create DB record
-        song = Song(
-            title=title,
-            artist=artist,
-            original_path=str(dest_path),
-            status="processing",
-            is_demo=True,
-        )
-        db.add(song)
+        if song is None:
+            song = Song(
+                title=title,
+                artist=artist,
+                original_path=str(dest_path),
+                content_hash=digest,
+                is_demo=True,
+            )
+            db.add(song)
+        else:
+            print(f"  [resume] reusing song id={song.id} from an interrupted run")
+            song.artist = artist
+            song.original_path = str(dest_path)
+            song.content_hash = digest
+            song.error_message = None
+        song.status = "processing"
         db.commit()
         db.refresh(song)
 
-        # Run Demucs
-        print(f"  Separating stems (this takes a few minutes) ...")
-        try:
-            stem_paths = separate_stems(str(dest_path), str(stems_dir), song.id)
-            for stem_type, path in stem_paths.items():
-                db.add(Stem(song_id=song.id, stem_type=stem_type, file_path=str(path)))
-            song.status = "complete"
-            db.commit()
-            print(f"  [ok] {len(stem_paths)} stems: {', '.join(stem_paths.keys())}\n")
-        except Exception as e:
-            song.status = "error"
-            song.error_message = str(e)[:500]
-            db.commit()
-            print(f"  [error] Demucs failed: {e}\n")
+        manifest[digest] = {"file": audio_file.name, "song_id": song.id, "status": "processing"}
+        save_manifest(manifest_path, manifest)
+        pending.append((digest, song, dest_path))
+        print()
+
+    # 2. Run Demucs — serially in-process (one warm model), or fanned out
+    if pending:
+        print(f"Separating {len(pending)} song(s) (this takes a few minutes each) ...")
+
+    if args.workers <= 1:
+        for digest, song, dest_path in pending:
+            _record_result(
+                db, manifest, digest, song,
+                lambda: _separate(str(dest_path), str(stems_dir), digest),
+            )
+            save_manifest(manifest_path, manifest)
+    elif pending:
+        workers = min(args.workers, len(pending))
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        print(f"  {workers} worker process(es), {threads} thread(s) each")
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(threads, multiprocessing.Value("i", 0)),
+        ) as pool:
+            futures = {
+                pool.submit(_separate, str(dest_path), str(stems_dir), digest): (digest, song)
+                for digest, song, dest_path in pending
+            }
+            # Commit each song as soon as its worker finishes
+            for future in as_completed(futures):
+                digest, song = futures[future]
+                _record_result(db, manifest, digest, song, future.result)
+                save_manifest(manifest_path, manifest)
 
     db.close()
-    print("Seeding complete.")
+    print("\nSeeding complete.")
 
 
 if __name__ == "__main__":
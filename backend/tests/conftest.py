@@ -0,0 +1,27 @@
+"""
+Test settings: a throwaway SQLite database and upload directory, set before
+the app (and its settings) is imported.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix="prism-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/test.db"
+os.environ["UPLOAD_DIR"] = f"{_tmp}/uploads"
+os.environ["DEMO_MODE"] = "false"
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
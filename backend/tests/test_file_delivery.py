@@ -0,0 +1,206 @@
+"""
+Range parsing, conditional requests and body delivery of
+app/services/file_delivery.py.
+"""
+import asyncio
+import os
+import re
+from email.utils import formatdate
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.services import file_delivery
+from app.services.file_delivery import deliver, parse_ranges, send_file
+
+DATA = bytes(range(256)) * 40  # 10240 bytes
+SIZE = len(DATA)
+
+
+# ── parse_ranges ──────────────────────────────────────────────────────────────
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", [(0, 100)]),
+    ("bytes=-500", [(SIZE - 500, SIZE)]),                 # suffix
+    ("bytes=-999999", [(0, SIZE)]),                       # suffix longer than the file
+    ("bytes=10000-", [(10000, SIZE)]),                    # open-ended
+    ("bytes=100-99999", [(100, SIZE)]),                   # end clamped to the file
+    ("bytes=0-99, 50-149", [(0, 150)]),                   # overlapping → merged
+    ("bytes=0-99,100-199", [(0, 200)]),                   # adjacent → merged
+    ("bytes=500-599, 0-9", [(0, 10), (500, 600)]),        # sorted
+    ("bytes=20000-", []),                                 # nothing overlaps → 416
+    ("bytes=20000-20100, -0", []),
+])
+def test_parse_ranges(header, expected):
+    assert parse_ranges(header, SIZE) == expected
+
+
+@pytest.mark.parametrize("header", [
+    "items=0-10",
+    "bytes=",
+    "bytes=-",
+    "bytes=abc",
+    "bytes=10-5",
+    "bytes=" + ",".join(f"{i}-{i}" for i in range(file_delivery.MAX_RANGES + 1)),
+])
+def test_parse_ranges_ignores_bad_headers(header):
+    assert parse_ranges(header, SIZE) is None
+
+
+# ── HTTP ──────────────────────────────────────────────────────────────────────
+
+@pytest.fixture(scope="module")
+def served(tmp_path_factory):
+    path = tmp_path_factory.mktemp("delivery") / "audio.bin"
+    path.write_bytes(DATA)
+    app = FastAPI()
+
+    @app.get("/file")
+    async def get_file():
+        return await deliver(path, media_type="audio/wav")
+
+    with TestClient(app) as client:
+        yield client, path
+
+
+def test_whole_file(served):
+    client, _ = served
+    response = client.get("/file")
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-length"] == str(SIZE)
+
+
+def test_suffix_range(served):
+    client, _ = served
+    response = client.get("/file", headers={"Range": "bytes=-100"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes {SIZE - 100}-{SIZE - 1}/{SIZE}"
+    assert response.content == DATA[-100:]
+
+
+def test_open_ended_range(served):
+    client, _ = served
+    response = client.get("/file", headers={"Range": "bytes=10000-"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 10000-{SIZE - 1}/{SIZE}"
+    assert response.content == DATA[10000:]
+
+
+def test_overlapping_ranges_are_merged(served):
+    client, _ = served
+    response = client.get("/file", headers={"Range": "bytes=0-99,50-149"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 0-149/{SIZE}"
+    assert response.content == DATA[:150]
+
+
+def test_unsatisfiable_range(served):
+    client, _ = served
+    response = client.get("/file", headers={"Range": f"bytes={SIZE}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{SIZE}"
+    assert response.content == b""
+
+
+def test_partly_satisfiable_ranges_send_the_rest(served):
+    client, _ = served
+    response = client.get("/file", headers={"Range": f"bytes=0-9,{SIZE + 10}-"})
+    assert response.status_code == 206
+    assert response.content == DATA[:10]
+
+
+def test_malformed_range_sends_whole_file(served):
+    client, _ = served
+    response = client.get("/file", headers={"Range": "bytes=oops"})
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+def test_multipart_byteranges(served):
+    client, _ = served
+    response = client.get("/file", headers={"Range": "bytes=0-9,-5,1000-1019"})
+    assert response.status_code == 206
+    boundary = re.fullmatch(
+        r"multipart/byteranges; boundary=(\w+)", response.headers["content-type"]
+    ).group(1)
+    body = response.content
+    assert response.headers["content-length"] == str(len(body))
+    assert body.endswith(f"\r\n--{boundary}--\r\n".encode())
+
+    parts = body.split(f"--{boundary}".encode())[1:-1]
+    received = []
+    for part in parts:
+        head, _, payload = part.partition(b"\r\n\r\n")
+        assert b"Content-Type: audio/wav" in head
+        start, end = map(int, re.search(rb"Content-Range: bytes (\d+)-(\d+)/", head).groups())
+        payload = payload.removesuffix(b"\r\n")
+        assert payload == DATA[start:end + 1]
+        received.append((start, end))
+    assert received == [(0, 9), (1000, 1019), (SIZE - 5, SIZE - 1)]
+
+
+def test_if_range_mismatch_sends_whole_file(served):
+    client, _ = served
+    response = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+def test_if_none_match(served):
+    client, _ = served
+    etag = client.get("/file").headers["etag"]
+    response = client.get("/file", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert client.get("/file", headers={"If-None-Match": f'W/{etag}, "other"'}).status_code == 304
+    assert client.get("/file", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_if_modified_since(served):
+    client, path = served
+    mtime = os.stat(path).st_mtime
+    assert client.get("/file", headers={"If-Modified-Since": formatdate(mtime + 60, usegmt=True)}).status_code == 304
+    assert client.get("/file", headers={"If-Modified-Since": formatdate(mtime - 60, usegmt=True)}).status_code == 200
+    # If-None-Match takes precedence over If-Modified-Since
+    response = client.get("/file", headers={
+        "If-None-Match": '"other"',
+        "If-Modified-Since": formatdate(mtime + 60, usegmt=True),
+    })
+    assert response.status_code == 200
+
+
+# ── send_file ─────────────────────────────────────────────────────────────────
+
+def _collect(scope: dict, path, offset: int, count: int) -> list[dict]:
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    async def run():
+        with open(path, "rb", buffering=0) as file:
+            await send_file(scope, send, file, offset, count)
+
+    asyncio.run(run())
+    return messages
+
+
+def test_send_file_positioned_reads(served, monkeypatch):
+    _, path = served
+    monkeypatch.setattr(file_delivery, "CHUNK_SIZE", 1000)
+    messages = _collect({}, path, 123, 4567)
+    assert [len(m["body"]) for m in messages] == [1000] * 4 + [567]
+    assert b"".join(m["body"] for m in messages) == DATA[123:123 + 4567]
+    assert all(m["more_body"] for m in messages)
+
+
+def test_send_file_zerocopy(served):
+    _, path = served
+    messages = _collect({"extensions": {"http.response.zerocopysend": {}}}, path, 10, 20)
+    assert len(messages) == 1
+    assert messages[0]["type"] == "http.response.zerocopysend"
+    assert (messages[0]["offset"], messages[0]["count"]) == (10, 20)
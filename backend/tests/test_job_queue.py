@@ -0,0 +1,123 @@
+"""
+Claiming, retrying and stale-job recovery of app/services/job_queue.py.
+"""
+import threading
+from datetime import timedelta
+
+import pytest
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import SeparationJob, Song, utcnow
+from app.services import job_queue
+
+
+@pytest.fixture
+def db(client):
+    """A session over an empty queue."""
+    with SessionLocal() as db:
+        db.query(SeparationJob).delete()
+        db.commit()
+        yield db
+
+
+def _queue_songs(db, count: int, content_hash: str | None = None) -> list[int]:
+    job_ids = []
+    for n in range(count):
+        song = Song(title=f"Queued {n}", status="pending", content_hash=content_hash)
+        db.add(song)
+        db.flush()
+        job_ids.append(job_queue.enqueue(db, song.id))
+    db.commit()
+    return [job.id for job in job_ids]
+
+
+def _race(claimers: int) -> list[int | None]:
+    """Run claim_next from *claimers* threads at once; the job ids they got."""
+    barrier = threading.Barrier(claimers)
+    claimed: list[int | None] = [None] * claimers
+
+    def claim(index: int) -> None:
+        with SessionLocal() as db:
+            barrier.wait()
+            job = job_queue.claim_next(db, f"worker-{index}")
+            claimed[index] = job.id if job else None
+
+    threads = [threading.Thread(target=claim, args=(index,)) for index in range(claimers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return claimed
+
+
+def test_racing_claimers_claim_a_job_once(db):
+    (job_id,) = _queue_songs(db, 1)
+    claimed = _race(8)
+    assert claimed.count(job_id) == 1
+    assert claimed.count(None) == 7
+
+    db.expire_all()
+    job = db.get(SeparationJob, job_id)
+    assert (job.status, job.attempts) == ("running", 1)
+
+
+def test_racing_claimers_share_out_jobs(db):
+    job_ids = _queue_songs(db, 3)
+    claimed = [job_id for job_id in _race(8) if job_id is not None]
+    assert sorted(claimed) == sorted(job_ids)
+
+
+def test_same_audio_waits_for_the_running_job(db):
+    first, second = _queue_songs(db, 2, content_hash="f" * 64)
+    assert job_queue.claim_next(db, "worker-a").id == first
+    assert job_queue.claim_next(db, "worker-b") is None
+    job_queue.mark_done(db, db.get(SeparationJob, first))
+    assert job_queue.claim_next(db, "worker-b").id == second
+
+
+def test_stale_job_is_requeued_as_a_failed_attempt(db):
+    (job_id,) = _queue_songs(db, 1)
+    job = job_queue.claim_next(db, "worker-a")
+    assert job.attempts == 1
+    job.heartbeat_at = utcnow() - timedelta(seconds=settings.JOB_STALE_SECONDS + 1)
+    db.commit()
+
+    assert job_queue.recover_stale(db) == 1
+
+    db.expire_all()
+    job = db.get(SeparationJob, job_id)
+    assert job.status == "pending"
+    assert job.attempts == 1  # the lost run counts
+    assert job.claimed_by is None
+    assert job.last_error == "Worker stopped responding while separating"
+    assert job.run_after > utcnow()  # backed off
+    assert job.song.status == "pending"
+    # Not claimable until the backoff has passed
+    assert job_queue.claim_next(db, "worker-b") is None
+
+    job.run_after = utcnow()
+    db.commit()
+    assert job_queue.claim_next(db, "worker-b").attempts == 2
+
+
+def test_live_job_is_not_recovered(db):
+    _queue_songs(db, 1)
+    job_queue.claim_next(db, "worker-a")
+    assert job_queue.recover_stale(db) == 0
+
+
+def test_job_fails_after_max_attempts(db):
+    (job_id,) = _queue_songs(db, 1)
+    for attempt in range(1, settings.JOB_MAX_ATTEMPTS + 1):
+        job = job_queue.claim_next(db, "worker-a")
+        assert job.attempts == attempt
+        retry = job_queue.mark_failed(db, job_id, "boom")
+        assert retry == (attempt < settings.JOB_MAX_ATTEMPTS)
+        job.run_after = utcnow()
+        db.commit()
+
+    db.expire_all()
+    job = db.get(SeparationJob, job_id)
+    assert job.status == "failed"
+    assert (job.song.status, job.song.error_message) == ("error", "boom")
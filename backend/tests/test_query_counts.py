@@ -0,0 +1,89 @@
+"""
+The song endpoints load a fixed number of queries however many songs,
+stems and renditions there are (see app/repositories/songs.py).
+"""
+import pytest
+
+from app.auth import create_token
+from app.database import SessionLocal, count_queries
+from app.models import Song, Stem, StemRendition, User
+from app.services.catalog_cache import demo_catalog
+
+STEM_TYPES = ("vocals", "drums", "bass", "other")
+
+
+def _add_songs(db, count: int, **song_columns) -> list[int]:
+    ids = []
+    for n in range(count):
+        song = Song(title=f"Song {n}", status="complete", **song_columns)
+        db.add(song)
+        db.flush()
+        for stem_type in STEM_TYPES:
+            db.add(Stem(
+                song_id=song.id,
+                stem_type=stem_type,
+                file_path=f"/nonexistent/{song.id}_{stem_type}.wav",
+                renditions=[
+                    StemRendition(codec=codec, bitrate_kbps=128, mime_type=f"audio/{codec}",
+                                  file_path=f"/nonexistent/{song.id}_{stem_type}.{codec}", size_bytes=1)
+                    for codec in ("mp3", "opus")
+                ],
+            ))
+        ids.append(song.id)
+    db.commit()
+    return ids
+
+
+@pytest.fixture(scope="module")
+def library(client):
+    """Demo songs, and a user with songs of their own: (auth headers, one of their song ids)."""
+    with SessionLocal() as db:
+        _add_songs(db, 5, is_demo=True)
+        user = User(email="queries@example.com", password_hash="x")
+        db.add(user)
+        db.flush()
+        song_ids = _add_songs(db, 5, user_id=user.id)
+        headers = {"Authorization": f"Bearer {create_token(user)}"}
+    return headers, song_ids[0]
+
+
+def _queries(client, path: str, headers=None) -> list[str]:
+    with count_queries() as queries:
+        response = client.get(path, headers=headers)
+    assert response.status_code == 200, response.text
+    return queries.statements
+
+
+def test_demo_catalog_queries(client, library):
+    demo_catalog.invalidate()
+    statements = _queries(client, "/api/songs/demos")
+    # Version check, songs, stems, renditions
+    assert len(statements) <= 4, statements
+    # Served from memory until the catalog version changes
+    assert len(_queries(client, "/api/songs/demos")) <= 1
+
+
+def test_my_songs_queries(client, library):
+    headers, _ = library
+    statements = _queries(client, "/api/songs/my", headers)
+    # User, songs, stems, renditions
+    assert len(statements) <= 4, statements
+
+
+def test_song_queries(client, library):
+    headers, song_id = library
+    statements = _queries(client, f"/api/songs/{song_id}", headers)
+    # User, song, stems, renditions
+    assert len(statements) <= 4, statements
+
+
+def test_queries_do_not_grow_with_library(client, library):
+    headers, _ = library
+    demo_catalog.invalidate()
+    before = len(_queries(client, "/api/songs/demos")), len(_queries(client, "/api/songs/my", headers))
+    with SessionLocal() as db:
+        _add_songs(db, 10, is_demo=True)
+        _add_songs(db, 10, user_id=db.query(User.id).filter(User.email == "queries@example.com").scalar())
+    demo_catalog.invalidate()
+    after = len(_queries(client, "/api/songs/demos")), len(_queries(client, "/api/songs/my", headers))
+    assert after == before